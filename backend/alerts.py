@@ -0,0 +1,356 @@
+# ===============================================================================
+# ALERTS.PY - CRISIS ALERT PIPELINE (OFF THE REQUEST PATH)
+# ===============================================================================
+# This file handles:
+# - Queuing a crisis alert from the chat endpoints in O(1), without waiting
+#   for any email, webhook or database write
+# - A small pool of background workers that deduplicate alerts per session,
+#   batch them, and deliver each batch to every configured sink
+# - Retrying failed deliveries with exponential backoff
+# - Backpressure: the queue has a fixed size and alerts that don't fit are
+#   counted as dropped (and logged) instead of slowing down chat requests
+#
+# Sinks (see build_sinks):
+# - LogSink: always on, prints a line per alert
+# - SmtpSink: emails counselors (ALERT_EMAIL_TO, uses the SMTP_* settings)
+# - WebhookSink: POSTs the batch as JSON (ALERT_WEBHOOK_URL)
+# - SupabaseSink: inserts one row per alert (ALERT_SUPABASE_TABLE)
+# ===============================================================================
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import random
+import time
+
+# Characters of the triggering message included in an alert
+EXCERPT_CHARS = 200
+
+# ===============================================================================
+# ALERT EVENT
+# ===============================================================================
+
+@dataclass
+class CrisisAlert:
+    """One crisis detection, as queued by the chat endpoints."""
+    session_id: str
+    excerpt: str                  # Start of the triggering message
+    source: str                   # Endpoint that detected it ("/chat", "/ai-chat", ...)
+    institute: Optional[str] = None
+    personality: Optional[str] = None
+    detected_at: datetime = field(default_factory=datetime.now)
+    repeats: int = 0              # Later detections in the same session that were deduplicated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "excerpt": self.excerpt,
+            "source": self.source,
+            "institute": self.institute,
+            "personality": self.personality,
+            "detected_at": self.detected_at.isoformat(),
+            "repeats": self.repeats
+        }
+
+# ===============================================================================
+# SINKS
+# ===============================================================================
+# A sink delivers a batch of alerts somewhere. send() is a blocking call; the
+# pipeline runs it in a worker thread and retries it if it raises.
+
+class AlertSink(ABC):
+    name = "sink"
+
+    @abstractmethod
+    def send(self, alerts: List[CrisisAlert]):
+        """Deliver a batch of alerts; raise to have the pipeline retry it."""
+
+
+class LogSink(AlertSink):
+    """Prints every alert (always enabled, so alerts are never silent)."""
+    name = "log"
+
+    def send(self, alerts: List[CrisisAlert]):
+        for alert in alerts:
+            print(f"[CRISIS ALERT] session={alert.session_id} source={alert.source} "
+                  f"institute={alert.institute or '-'} repeats={alert.repeats}")
+
+
+class SmtpSink(AlertSink):
+    """Emails one summary per batch to the counselor addresses."""
+    name = "smtp"
+
+    def __init__(self, settings, recipients: List[str]):
+        self.settings = settings
+        self.recipients = recipients
+
+    def send(self, alerts: List[CrisisAlert]):
+        import smtplib
+        from email.message import EmailMessage
+
+        settings = self.settings
+        msg = EmailMessage()
+        msg['Subject'] = f"MindCare crisis alert: {len(alerts)} session(s) need attention"
+        msg['From'] = settings.smtp_from
+        msg['To'] = ", ".join(self.recipients)
+        lines = ["Crisis indicators were detected in the following MindCare sessions:", ""]
+        for alert in alerts:
+            lines.append(f"- Session {alert.session_id} at {alert.detected_at:%Y-%m-%d %H:%M} "
+                         f"({alert.institute or 'unknown institute'}, via {alert.source})")
+            lines.append(f"  \"{alert.excerpt}\"")
+            if alert.repeats:
+                lines.append(f"  ({alert.repeats} further detection(s) in this session)")
+        lines += ["", "Please review these conversations in the admin dashboard.", "", "MindCare"]
+        msg.set_content("\n".join(lines))
+
+        port = int(settings.smtp_port)
+        if port == 465:
+            # SMTPS (implicit SSL)
+            with smtplib.SMTP_SSL(settings.smtp_host, port, timeout=20) as server:
+                server.login(settings.smtp_user, settings.smtp_pass)
+                server.send_message(msg)
+        else:
+            # SMTP with STARTTLS
+            with smtplib.SMTP(settings.smtp_host, port, timeout=20) as server:
+                server.ehlo()
+                server.starttls()
+                server.ehlo()
+                server.login(settings.smtp_user, settings.smtp_pass)
+                server.send_message(msg)
+
+
+class WebhookSink(AlertSink):
+    """POSTs {"alerts": [...]} as JSON to a webhook (e.g. a chat channel integration)."""
+    name = "webhook"
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def send(self, alerts: List[CrisisAlert]):
+        import requests
+
+        response = requests.post(self.url, json={"alerts": [a.to_dict() for a in alerts]}, timeout=10)
+        response.raise_for_status()
+
+
+class SupabaseSink(AlertSink):
+    """Inserts one row per alert into a Supabase table (service role REST API)."""
+    name = "supabase"
+
+    def __init__(self, supabase_url: str, service_role_key: str, table: str):
+        self.endpoint = f"{supabase_url.rstrip('/')}/rest/v1/{table}"
+        self.headers = {
+            'apikey': service_role_key,
+            'Authorization': f'Bearer {service_role_key}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal'
+        }
+
+    def send(self, alerts: List[CrisisAlert]):
+        import requests
+
+        rows = [a.to_dict() for a in alerts]
+        response = requests.post(self.endpoint, headers=self.headers, json=rows, timeout=10)
+        response.raise_for_status()
+
+
+def build_sinks(settings) -> List[AlertSink]:
+    """Create the sinks that are configured in settings (the log sink is always included)."""
+    sinks: List[AlertSink] = [LogSink()]
+    if settings.alert_email_to and settings.smtp_configured:
+        sinks.append(SmtpSink(settings, list(settings.alert_email_to)))
+    if settings.alert_webhook_url:
+        sinks.append(WebhookSink(settings.alert_webhook_url))
+    if settings.alert_supabase_table and settings.supabase_url and settings.supabase_service_role_key:
+        sinks.append(SupabaseSink(settings.supabase_url, settings.supabase_service_role_key,
+                                  settings.alert_supabase_table))
+    return sinks
+
+# ===============================================================================
+# PIPELINE
+# ===============================================================================
+
+class CrisisAlertPipeline:
+    """
+    Bounded queue plus worker pool that turns crisis detections into notifications.
+
+    enqueue() only appends to the queue, so the chat endpoints never wait for
+    delivery. Workers group alerts into batches (up to batch_size, or whatever
+    arrived within batch_window seconds), drop repeats for sessions alerted in
+    the last dedup_seconds, and hand each batch to every sink.
+    """
+
+    def __init__(self, queue_size: int = 1000, workers: int = 2, batch_size: int = 20,
+                 batch_window: float = 2.0, dedup_seconds: float = 600.0,
+                 max_retries: int = 4, retry_base_delay: float = 1.0):
+        """
+        Initialize the pipeline (workers start with start()).
+
+        Args:
+            queue_size: Alerts that can wait for delivery; further alerts are dropped
+            workers: Number of worker tasks
+            batch_size: Maximum alerts per delivered batch
+            batch_window: Seconds a worker waits to fill a batch
+            dedup_seconds: A session is alerted at most once per this many seconds
+            max_retries: Delivery attempts per sink after the first one fails
+            retry_base_delay: First retry delay in seconds (doubles every retry)
+        """
+        self.queue_size = queue_size
+        self.worker_count = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.dedup_seconds = dedup_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self.sinks: List[AlertSink] = [LogSink()]
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        # session_id -> time of its last delivered alert, oldest first
+        self._recent: "OrderedDict[str, float]" = OrderedDict()
+        # session_id -> detections deduplicated since its last delivered alert,
+        # reported on the session's next delivered alert (oldest first, bounded)
+        self._repeats: "OrderedDict[str, int]" = OrderedDict()
+        self.max_pending_repeats = 10000
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.deduplicated = 0
+        self.delivered: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+
+    def configure(self, settings):
+        """Pick the sinks from settings (see settings.py)."""
+        self.sinks = build_sinks(settings)
+
+    def enqueue(self, alert: CrisisAlert) -> bool:
+        """
+        Queue an alert for delivery. O(1) and never blocks.
+
+        Returns:
+            False if the queue is full and the alert was dropped
+        """
+        try:
+            self._queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"[CRISIS ALERT] queue full, alert for session {alert.session_id} dropped")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _is_duplicate(self, alert: CrisisAlert, now: float) -> bool:
+        """
+        Drop repeat detections within dedup_seconds of the session's last alert.
+        They are counted, and the count goes out with the session's next
+        delivered alert (see _take_repeats); delivered alerts are never changed.
+        """
+        # Forget sessions whose dedup window has passed (oldest entries first)
+        while self._recent:
+            session_id, alerted_at = next(iter(self._recent.items()))
+            if now - alerted_at < self.dedup_seconds:
+                break
+            del self._recent[session_id]
+
+        if alert.session_id not in self._recent:
+            self._recent[alert.session_id] = now
+            return False
+        self._repeats[alert.session_id] = self._repeats.pop(alert.session_id, 0) + 1
+        if len(self._repeats) > self.max_pending_repeats:
+            self._repeats.popitem(last=False)
+        return True
+
+    def _take_repeats(self, alert: CrisisAlert):
+        """Attach the detections deduplicated so far in this session to an alert about to be delivered."""
+        alert.repeats += self._repeats.pop(alert.session_id, 0)
+
+    async def _next_batch(self) -> List[CrisisAlert]:
+        """Wait for one alert, then collect more for up to batch_window seconds."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver(self, sink: AlertSink, alerts: List[CrisisAlert]):
+        """Send a batch to one sink, retrying with exponential backoff and jitter."""
+        loop = asyncio.get_event_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await loop.run_in_executor(None, sink.send, alerts)
+                self.delivered[sink.name] = self.delivered.get(sink.name, 0) + len(alerts)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed[sink.name] = self.failed.get(sink.name, 0) + len(alerts)
+                    print(f"[CRISIS ALERT] {sink.name} delivery failed after {attempt + 1} attempts: {e}")
+                    return
+                delay = self.retry_base_delay * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                now = time.monotonic()
+                alerts = []
+                for alert in batch:
+                    if self._is_duplicate(alert, now):
+                        self.deduplicated += 1
+                    else:
+                        alerts.append(alert)
+                # After the whole batch is filtered, so repeats in the same batch count too
+                for alert in alerts:
+                    self._take_repeats(alert)
+                if alerts:
+                    # Sinks are independent: a slow webhook doesn't hold up the email
+                    await asyncio.gather(*(self._deliver(sink, alerts) for sink in self.sinks))
+            except Exception as e:
+                print(f"[CRISIS ALERT] worker error: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        """Start the worker pool (call on server startup)."""
+        # Bind a fresh queue to the running loop, keeping anything queued before startup
+        previous, self._queue = self._queue, asyncio.Queue(maxsize=self.queue_size)
+        while not previous.empty():
+            self._queue.put_nowait(previous.get_nowait())
+        loop = asyncio.get_event_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def stop(self):
+        """Stop the worker pool (call on server shutdown). Queued alerts are logged."""
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        while not self._queue.empty():
+            alert = self._queue.get_nowait()
+            print(f"[CRISIS ALERT] undelivered at shutdown: session={alert.session_id}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "sinks": [sink.name for sink in self.sinks],
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "deduplicated": self.deduplicated,
+            "delivered": dict(self.delivered),
+            "failed": dict(self.failed)
+        }
+
+# Global pipeline used by the chat endpoints.
+# Sinks are configured and workers started in the app's lifespan (see chatbot.py).
+alert_pipeline = CrisisAlertPipeline()
@@ -0,0 +1,224 @@
+# ===============================================================================
+# ANALYTICS.PY - TIME-BUCKETED ROLLUPS FOR THE ADMIN ANALYTICS DASHBOARD
+# ===============================================================================
+# This file handles:
+# - Recording the outcome of every analyzed chat message (crisis detected?
+#   academic stress detected?) as it happens
+# - Keeping per-minute, per-hour and per-day counters in fixed-size rings,
+#   keyed by institute and therapy personality
+# - Answering dashboard ranges (e.g. crisis detections per hour for the last
+#   day) from those counters instead of rescanning conversation history
+#
+# Memory is fixed: every resolution keeps a fixed number of buckets, and each
+# bucket holds one small array of counters per (institute, personality) key.
+# Buckets follow the server's local clock: day buckets run from local midnight
+# to midnight (hour buckets from :00 local), whatever the UTC offset.
+# ===============================================================================
+
+from typing import Any, Dict, List, Optional, Tuple
+from array import array
+from datetime import datetime, timezone
+import threading
+import time
+
+# Counters kept for every (bucket, institute, personality)
+METRICS = ("messages", "crisis", "academic_stress")
+MESSAGES, CRISIS, ACADEMIC_STRESS = range(len(METRICS))
+
+# name -> (bucket width in seconds, number of buckets kept)
+RESOLUTIONS = {
+    "minute": (60, 24 * 60),      # last 24 hours
+    "hour": (3600, 14 * 24),      # last 14 days
+    "day": (86400, 366),          # last year
+}
+
+UNKNOWN_INSTITUTE = "unknown"
+OTHER_INSTITUTE = "other"
+
+
+def local_seconds(timestamp: float) -> float:
+    """Unix time shifted by the local UTC offset at that moment (local wall-clock seconds)."""
+    return timestamp + time.localtime(timestamp).tm_gmtoff
+
+
+def local_label(seconds: float) -> str:
+    """ISO label (local time, no offset) for a point on the local wall clock."""
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat()
+
+# ===============================================================================
+# BUCKET RING
+# ===============================================================================
+
+class BucketRing:
+    """
+    A fixed number of time buckets of one width, reused in a circle.
+
+    Bucket i covers [i * width, (i + 1) * width) local wall-clock seconds since
+    the epoch (see local_seconds) and lives in slot i % size. A slot still
+    holding an older bucket is cleared the first time a newer bucket needs it,
+    so nothing ever has to expire buckets in the background.
+    """
+
+    def __init__(self, width: int, size: int):
+        self.width = width
+        self.size = size
+        self._bucket_ids = [-1] * size
+        self._counters: List[Dict[Tuple[str, str], array]] = [{} for _ in range(size)]
+
+    def add(self, timestamp: float, key: Tuple[str, str], flags: Tuple[int, ...]):
+        """Add one message with the given metric increments to its bucket."""
+        bucket_id = int(local_seconds(timestamp) // self.width)
+        slot = bucket_id % self.size
+        if self._bucket_ids[slot] != bucket_id:
+            self._bucket_ids[slot] = bucket_id
+            self._counters[slot] = {}
+        counters = self._counters[slot].get(key)
+        if counters is None:
+            counters = self._counters[slot][key] = array("L", [0] * len(METRICS))
+        for index, increment in enumerate(flags):
+            counters[index] += increment
+
+    def buckets(self, start: float, end: float):
+        """
+        Yield (bucket start in local wall-clock seconds, counters by key) for every
+        bucket in the Unix time range [start, end), oldest first. Buckets that fell
+        out of the ring are skipped.
+        """
+        start, end = local_seconds(start), local_seconds(end)
+        first = max(int(start // self.width), int(end // self.width) - self.size + 1)
+        last = int((end - 1) // self.width)
+        for bucket_id in range(first, last + 1):
+            slot = bucket_id % self.size
+            counters = self._counters[slot] if self._bucket_ids[slot] == bucket_id else {}
+            yield bucket_id * self.width, counters
+
+# ===============================================================================
+# ROLLUP ENGINE
+# ===============================================================================
+
+class AnalyticsRollups:
+    """
+    Records detection outcomes into every resolution and answers range queries.
+    Recording is O(number of resolutions); a query touches only the buckets in
+    its range.
+    """
+
+    def __init__(self, resolutions: Dict[str, Tuple[int, int]] = RESOLUTIONS, max_institutes: int = 500):
+        """
+        Initialize empty rollups.
+
+        Args:
+            resolutions: name -> (bucket width in seconds, buckets kept)
+            max_institutes: Distinct institutes tracked; later ones are counted as "other"
+        """
+        self.rings = {name: BucketRing(width, size) for name, (width, size) in resolutions.items()}
+        self.max_institutes = max_institutes
+        self._institutes: set = set()
+        # Normalized name -> configured spelling (KNOWN_INSTITUTES)
+        self._known_institutes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, settings):
+        """Apply KNOWN_INSTITUTES (see settings.py)."""
+        self._known_institutes = {_normalize(name): name for name in settings.known_institutes}
+
+    def known_institute(self, name: Optional[str]) -> Optional[str]:
+        """
+        The configured spelling of an institute name sent by a client, or None
+        if it isn't in KNOWN_INSTITUTES. Client-sent names are unauthenticated,
+        so anything else must not get its own analytics key.
+        """
+        if not isinstance(name, str):
+            return None
+        return self._known_institutes.get(_normalize(name))
+
+    def _institute_key(self, institute: Optional[str]) -> str:
+        """Normalize an institute name and keep the number of distinct keys bounded."""
+        name = " ".join((institute or "").split())[:100]
+        if not name:
+            return UNKNOWN_INSTITUTE
+        if name not in self._institutes:
+            if len(self._institutes) >= self.max_institutes:
+                return OTHER_INSTITUTE
+            self._institutes.add(name)
+        return name
+
+    def record(self, institute: Optional[str], personality: str, crisis: bool, academic_stress: bool,
+               timestamp: Optional[float] = None):
+        """
+        Record one analyzed user message.
+
+        Args:
+            institute: Student's institute (None if unknown)
+            personality: Therapy personality of the session
+            crisis: Whether the crisis detector matched
+            academic_stress: Whether the academic stress detector matched
+            timestamp: Unix time of the message (defaults to now)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        flags = (1, int(crisis), int(academic_stress))
+        with self._lock:
+            key = (self._institute_key(institute), personality)
+            for ring in self.rings.values():
+                ring.add(timestamp, key, flags)
+
+    def query(self, resolution: str, start: float, end: float, institute: Optional[str] = None,
+              personality: Optional[str] = None, group_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Totals per bucket for a time range.
+
+        Args:
+            resolution: "minute", "hour" or "day"
+            start, end: Unix time range [start, end)
+            institute: Only this institute (None = all)
+            personality: Only this personality (None = all)
+            group_by: None, "institute" or "personality" - split each bucket's totals
+
+        Returns:
+            One dict per bucket (oldest first) with the bucket start, the counters
+            and the academic stress / crisis share of messages
+
+        Raises:
+            ValueError: Unknown resolution or group_by
+        """
+        ring = self.rings.get(resolution)
+        if ring is None:
+            raise ValueError(f"resolution must be one of: {', '.join(self.rings)}")
+        if group_by not in (None, "institute", "personality"):
+            raise ValueError("group_by must be 'institute' or 'personality'")
+        group_index = {"institute": 0, "personality": 1}.get(group_by)
+
+        results = []
+        with self._lock:
+            for bucket_start, counters in ring.buckets(start, end):
+                groups: Dict[str, List[int]] = {}
+                for key, values in counters.items():
+                    if (institute is not None and key[0] != institute) or \
+                            (personality is not None and key[1] != personality):
+                        continue
+                    group = key[group_index] if group_index is not None else "all"
+                    totals = groups.setdefault(group, [0] * len(METRICS))
+                    for index, value in enumerate(values):
+                        totals[index] += value
+                if group_by is None:
+                    results.append({"start": local_label(bucket_start),
+                                    **_totals_dict(groups.get("all", [0] * len(METRICS)))})
+                else:
+                    results.append({"start": local_label(bucket_start),
+                                    "groups": {name: _totals_dict(totals) for name, totals in groups.items()}})
+        return results
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+def _totals_dict(totals: List[int]) -> Dict[str, Any]:
+    result = dict(zip(METRICS, totals))
+    messages = totals[MESSAGES]
+    result["crisis_share"] = round(totals[CRISIS] / messages, 4) if messages else 0.0
+    result["academic_stress_share"] = round(totals[ACADEMIC_STRESS] / messages, 4) if messages else 0.0
+    return result
+
+# Global instance updated by the chat endpoints
+analytics_rollups = AnalyticsRollups()
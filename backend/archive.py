@@ -0,0 +1,530 @@
+# ===============================================================================
+# ARCHIVE.PY - NDJSON EXPORT AND COMPRESSED ARCHIVAL OF CONVERSATIONS
+# ===============================================================================
+# This file handles:
+# - Archiving cold sessions (no activity for a while) to compressed files on
+#   disk and evicting them from memory, so RAM only holds live conversations
+# - Restoring an archived session when its user comes back
+# - Keeping archived sessions searchable: their postings stay in the search
+#   index when they are evicted, and archive files are indexed on startup
+# - Streaming every session (in memory and archived) as NDJSON, compressed on
+#   the fly, for counselor review and research exports
+# - A small command line tool to download an export or dump the archive
+#
+# Record format (one JSON object per line, a session header before its messages):
+#   {"type": "session", "session_id": ..., "personality": ..., "crisis": ...,
+#    "summary": ..., "created": ..., "last_activity": ...}
+#   {"type": "message", "session_id": ..., "seq": ..., "role": ...,
+#    "content": ..., "timestamp": ...}
+#
+# Usage (from the backend folder):
+#   python archive.py export --url http://localhost:8000 --admin-key KEY --out export.ndjson.gz
+#   python archive.py dump --dir archive --crisis-only --out crisis.ndjson
+# ===============================================================================
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import sys
+import zlib
+
+from features import ConversationManager, ConversationSummary, MessageData
+from search_index import search_index
+
+# Default folder for archived sessions (backend/archive, git-ignored)
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+# Only plain session IDs ever become file names
+SAFE_SESSION_ID = re.compile(r'^[a-zA-Z0-9\-_]{1,100}$')
+
+# Uncompressed bytes collected before handing them to the compressor
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# ===============================================================================
+# RECORD HELPERS
+# ===============================================================================
+
+def _encode(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse an ISO time the way timestamps are stored: naive, local time.
+    Times with an offset (e.g. "...Z") are converted to local time first, so
+    they can be compared with stored timestamps.
+
+    Raises:
+        ValueError: Not an ISO 8601 time
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def session_header(manager: ConversationManager, session_id: str,
+                   messages: List[MessageData]) -> Dict[str, Any]:
+    """Header record describing an in-memory session."""
+    summary = manager.get_summary(session_id)
+    last_activity = manager.get_last_activity(session_id)
+    return {
+        "type": "session",
+        "session_id": session_id,
+        "personality": manager.get_personality(session_id),
+        "crisis": manager.is_crisis_flagged(session_id),
+        "summary": {
+            "text": summary.text,
+            "covered_messages": summary.covered_messages,
+            "updated": summary.updated.isoformat()
+        } if summary else None,
+        "created": messages[0].timestamp.isoformat() if messages else None,
+        "last_activity": last_activity.isoformat() if last_activity else None
+    }
+
+
+def message_record(session_id: str, message: MessageData) -> Dict[str, Any]:
+    return {
+        "type": "message",
+        "session_id": session_id,
+        "seq": message.seq,
+        "role": message.role,
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat()
+    }
+
+# ===============================================================================
+# EXPORT (STREAMED, CONSTANT MEMORY)
+# ===============================================================================
+
+def _in_range(timestamp: datetime, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    return (since is None or timestamp >= since) and (until is None or timestamp < until)
+
+
+def _filter_session(header: Dict[str, Any], messages: Iterator[Dict[str, Any]],
+                    since: Optional[datetime], until: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the header and the messages inside [since, until).
+    With a time filter, sessions without a matching message are left out entirely.
+    """
+    if since is None and until is None:
+        yield header
+        yield from messages
+        return
+    header_sent = False
+    for record in messages:
+        if not _in_range(datetime.fromisoformat(record["timestamp"]), since, until):
+            continue
+        if not header_sent:
+            header_sent = True
+            yield header
+        yield record
+
+
+def iter_memory_records(manager: ConversationManager, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, crisis_only: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Records for every session held in memory.
+    Only one session's message list (references, not the texts) is copied at a
+    time, and its records are encoded one at a time.
+    """
+    for session_id in manager.list_all_sessions():
+        messages = manager.get_messages(session_id)
+        if not messages or (crisis_only and not manager.is_crisis_flagged(session_id)):
+            continue
+        header = session_header(manager, session_id, messages)
+        records = (message_record(session_id, message) for message in messages)
+        yield from _filter_session(header, records, since, until)
+
+
+def iter_archive_records(directory: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         crisis_only: bool = False, skip_sessions=()) -> Iterator[Dict[str, Any]]:
+    """
+    Records for every archived session, read line by line from the files.
+
+    Args:
+        directory: Archive folder
+        since, until: Only messages with since <= timestamp < until
+        crisis_only: Only sessions flagged for crisis indicators
+        skip_sessions: Session IDs to leave out (e.g. restored and still in memory)
+    """
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(ARCHIVE_SUFFIX):
+                continue
+            session_id = entry.name[:-len(ARCHIVE_SUFFIX)]
+            if session_id in skip_sessions:
+                continue
+            try:
+                with gzip.open(entry.path, "rt", encoding="utf-8") as fh:
+                    header = json.loads(fh.readline())
+                    if crisis_only and not header.get("crisis"):
+                        continue
+                    # Skip whole files whose activity lies outside the range
+                    last_activity = parse_time(header.get("last_activity"))
+                    created = parse_time(header.get("created"))
+                    if since and last_activity and last_activity < since:
+                        continue
+                    if until and created and created >= until:
+                        continue
+                    records = (json.loads(line) for line in fh if line.strip())
+                    yield from _filter_session(header, records, since, until)
+            except (OSError, EOFError, ValueError) as e:
+                print(f"Warning: skipping unreadable archive file {entry.name}: {e}")
+
+
+def iter_ndjson(records: Iterator[Dict[str, Any]], compress: bool = True) -> Iterator[bytes]:
+    """
+    Turn records into NDJSON bytes, gzip-compressed on the fly.
+    Output is produced in chunks of about EXPORT_CHUNK_BYTES (before compression).
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip container
+    buffer: List[str] = []
+    buffered = 0
+    for record in records:
+        line = _encode(record)
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= EXPORT_CHUNK_BYTES:
+            data = "".join(buffer).encode("utf-8")
+            buffer.clear()
+            buffered = 0
+            if compressor is None:
+                yield data
+            else:
+                data = compressor.compress(data)
+                if data:
+                    yield data
+    data = "".join(buffer).encode("utf-8")
+    if compressor is None:
+        if data:
+            yield data
+        return
+    yield compressor.compress(data) + compressor.flush()
+
+# ===============================================================================
+# ARCHIVER
+# ===============================================================================
+
+class ConversationArchiver:
+    """
+    Moves cold sessions from memory to <directory>/<session_id>.ndjson.gz and
+    brings them back when they are used again.
+    """
+
+    def __init__(self, manager: ConversationManager, directory: str = ARCHIVE_DIR,
+                 idle_minutes: int = 30, check_interval: float = 60.0):
+        """
+        Initialize the archiver (nothing touches the disk until it's used).
+
+        Args:
+            manager: The conversation manager whose sessions are archived
+            directory: Folder for archive files
+            idle_minutes: Sessions without activity for this long are archived (0 disables)
+            check_interval: Seconds between archive passes
+        """
+        self.manager = manager
+        self.directory = directory
+        self.idle_minutes = idle_minutes
+        self.check_interval = check_interval
+        self.archived_total = 0
+        self.restored_total = 0
+        self._task: Optional[asyncio.Task] = None
+        manager.session_loader = self.restore
+
+    def configure(self, settings):
+        """Apply archive settings (see settings.py)."""
+        self.directory = settings.archive_dir
+        self.idle_minutes = settings.archive_idle_minutes
+
+    def _path(self, session_id: str) -> Optional[str]:
+        if not SAFE_SESSION_ID.match(session_id):
+            return None
+        return os.path.join(self.directory, session_id + ARCHIVE_SUFFIX)
+
+    def write_session(self, session_id: str, header: Dict[str, Any], messages: List[MessageData]) -> bool:
+        """
+        Write one session to its archive file (safe to call from a worker thread).
+        Writes to a temporary file first, so a crash never leaves half a session.
+        """
+        path = self._path(session_id)
+        if path is None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as fh:
+            fh.write(_encode(header))
+            for message in messages:
+                fh.write(_encode(message_record(session_id, message)))
+        os.replace(tmp_path, path)
+        return True
+
+    async def archive_session(self, session_id: str) -> bool:
+        """
+        Archive one session and evict it from memory.
+        The file is written in a worker thread; if a message arrives meanwhile,
+        the session stays in memory and is archived on a later pass.
+
+        Returns:
+            True if the session was archived and evicted
+        """
+        snapshot = self.manager.get_messages(session_id)
+        if snapshot is None:
+            return False
+        if not snapshot:
+            # Nothing worth keeping
+            return self.manager.remove_session(session_id, expected_messages=0)
+
+        header = session_header(self.manager, session_id, snapshot)
+        loop = asyncio.get_event_loop()
+        written = await loop.run_in_executor(None, self.write_session, session_id, header, snapshot)
+
+        # Evict only if no message arrived while the file was written (checked atomically).
+        # Its postings stay in the search index, so /admin/search still finds it
+        if not written or not self.manager.remove_session(session_id, expected_messages=len(snapshot),
+                                                          keep_search_index=True):
+            return False
+        self.archived_total += 1
+        return True
+
+    async def archive_cold_sessions(self, idle_minutes: Optional[int] = None) -> int:
+        """
+        Archive every session idle for longer than `idle_minutes`.
+
+        Returns:
+            Number of sessions archived
+        """
+        idle_minutes = self.idle_minutes if idle_minutes is None else idle_minutes
+        cutoff = datetime.now() - timedelta(minutes=idle_minutes)
+        archived = 0
+        for session_id in self.manager.get_cold_sessions(cutoff):
+            # Don't archive a session whose summary is being written right now
+            if self.manager.is_summary_in_progress(session_id):
+                continue
+            try:
+                if await self.archive_session(session_id):
+                    archived += 1
+            except OSError as e:
+                print(f"Archiving session {session_id} failed: {e}")
+        if archived:
+            print(f"Archived {archived} cold sessions to {self.directory}")
+        return archived
+
+    def restore(self, session_id: str) -> bool:
+        """
+        Load an archived session back into memory (blocking: used by load_archived / ensure_session).
+
+        Returns:
+            True if the session was found in the archive and restored
+        """
+        path = self._path(session_id)
+        if path is None or not os.path.exists(path):
+            return False
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                header = json.loads(fh.readline())
+                messages = []
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    messages.append(MessageData(
+                        role=record["role"],
+                        content=record["content"],
+                        timestamp=datetime.fromisoformat(record["timestamp"]),
+                        seq=record["seq"]
+                    ))
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            print(f"Warning: could not restore archived session {session_id}: {e}")
+            return False
+
+        summary = header.get("summary")
+        restored = self.manager.restore_session(
+            session_id,
+            messages,
+            personality=header.get("personality"),
+            summary=ConversationSummary(
+                text=summary["text"],
+                covered_messages=summary["covered_messages"],
+                updated=datetime.fromisoformat(summary["updated"])
+            ) if summary else None,
+            crisis=bool(header.get("crisis"))
+        )
+        # False: another request restored it first, which is just as good
+        if restored:
+            self.restored_total += 1
+        return True
+
+    def read_message(self, session_id: str, seq: int) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Read one message of an archived session (blocking: run it in a threadpool).
+        Used for /admin/search snippets of sessions that are no longer in memory.
+
+        Returns:
+            (session header, message record); either is None if not found
+        """
+        path = self._path(session_id)
+        if path is None:
+            return None, None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                header = json.loads(fh.readline())
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("seq") == seq:
+                        return header, record
+                return header, None
+        except (OSError, EOFError, ValueError):
+            return None, None
+
+    def index_archive(self) -> int:
+        """
+        Queue every archived message for the search index (blocking: run it in a
+        threadpool). Sessions archived before a restart stay searchable this way;
+        messages that are already indexed are skipped by the index.
+
+        Returns:
+            Number of messages queued
+        """
+        queued = 0
+        for record in iter_archive_records(self.directory, skip_sessions=self.manager):
+            if record.get("type") != "message":
+                continue
+            search_index.add_message(record["session_id"], record["seq"], record["content"])
+            queued += 1
+        if queued:
+            print(f"Queued {queued} archived messages for the search index")
+        return queued
+
+    def export(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               crisis_only: bool = False, compress: bool = True) -> Iterator[bytes]:
+        """
+        Stream every session (in memory first, then the archive) as NDJSON bytes.
+        A session restored to memory is only exported from memory.
+        """
+        def records():
+            yield from iter_memory_records(self.manager, since, until, crisis_only)
+            yield from iter_archive_records(self.directory, since, until, crisis_only,
+                                            skip_sessions=self.manager)
+        return iter_ndjson(records(), compress=compress)
+
+    async def _archive_loop(self):
+        """Background loop: archive cold sessions every check_interval seconds."""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.archive_cold_sessions()
+            except Exception as e:
+                print(f"Archive pass failed: {e}")
+
+    def start(self):
+        """Index the archive for search and start the archive loop (call on server startup)."""
+        loop = asyncio.get_event_loop()
+        loop.run_in_executor(None, self.index_archive)
+        if self.idle_minutes > 0:
+            self._task = loop.create_task(self._archive_loop())
+
+    def stop(self):
+        """Stop the archive loop (call on server shutdown)."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "idle_minutes": self.idle_minutes,
+            "archived_total": self.archived_total,
+            "restored_total": self.restored_total
+        }
+
+# ===============================================================================
+# COMMAND LINE
+# ===============================================================================
+
+def download_export(url: str, admin_key: str, out_path: str, params: Dict[str, str]) -> int:
+    """
+    Download /admin/export to a file in chunks.
+
+    Returns:
+        Number of bytes written
+    """
+    import urllib.parse
+    import urllib.request
+
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v})
+    request = urllib.request.Request(f"{url.rstrip('/')}/admin/export?{query}",
+                                     headers={"X-Admin-Key": admin_key})
+    written = 0
+    with urllib.request.urlopen(request) as response, open(out_path, "wb") as out:
+        while True:
+            chunk = response.read(EXPORT_CHUNK_BYTES)
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Export or dump MindCare conversations as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="Download an export from a running server")
+    export_cmd.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    export_cmd.add_argument("--admin-key", default=os.getenv("ADMIN_API_KEY"), help="Admin API key")
+
+    dump_cmd = commands.add_parser("dump", help="Export straight from an archive folder (server not needed)")
+    dump_cmd.add_argument("--dir", default=ARCHIVE_DIR, help="Archive folder")
+
+    for command in (export_cmd, dump_cmd):
+        command.add_argument("--since", help="Only messages at or after this ISO time")
+        command.add_argument("--until", help="Only messages before this ISO time")
+        command.add_argument("--crisis-only", action="store_true", help="Only sessions flagged for crisis")
+        command.add_argument("--out", required=True, help="Output file (.gz for compressed output)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        if not args.admin_key:
+            print("An admin key is required (--admin-key or ADMIN_API_KEY)")
+            return 1
+        params = {
+            "since": args.since,
+            "until": args.until,
+            "crisis_only": "true" if args.crisis_only else None,
+            "compress": "true" if args.out.endswith(".gz") else "false"
+        }
+        written = download_export(args.url, args.admin_key, args.out, params)
+    else:
+        try:
+            since, until = parse_time(args.since), parse_time(args.until)
+        except ValueError as e:
+            print(f"Invalid time: {e}")
+            return 1
+        records = iter_archive_records(args.dir, since, until, args.crisis_only)
+        written = 0
+        with open(args.out, "wb") as out:
+            for chunk in iter_ndjson(records, compress=args.out.endswith(".gz")):
+                out.write(chunk)
+                written += len(chunk)
+    print(f"Wrote {written} bytes to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
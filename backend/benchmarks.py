@@ -0,0 +1,385 @@
+# ===============================================================================
+# BENCHMARKS.PY - MICRO-BENCHMARKS FOR HOT REQUEST-PATH FUNCTIONS
+# ===============================================================================
+# This file measures the functions that run on every chat request:
+# - RateLimiter.is_allowed
+# - InputValidator.validate_message / _is_spam_message / sanitize_message
+# - create_enhanced_prompt
+# - ConversationManager.add_message
+# - AnalyticsRollups.record
+# - SearchIndex.search on a large index (admin search)
+# - RiskClassifier.score_batch (crisis risk scoring, per message; needs numpy)
+#
+# Each benchmark has a per-call time budget. The run fails (exit code 1) when a
+# benchmark goes over its budget, or when it is slower than a saved baseline by
+# more than the allowed tolerance.
+#
+# Usage (from the backend folder):
+#   python benchmarks.py                        # run against the budgets
+#   python benchmarks.py --save baseline.json   # record a baseline
+#   python benchmarks.py --baseline baseline.json --tolerance 1.5
+#   python benchmarks.py --only validate        # run a subset by name
+# ===============================================================================
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Silence the import-time banners printed by the backend modules
+with open(os.devnull, "w") as _devnull, contextlib.redirect_stdout(_devnull):
+    from features import ConversationManager
+    from search_index import SearchIndex
+    from analytics import AnalyticsRollups
+    from risk_classifier import RiskClassifier
+    from security import RateLimiter, InputValidator
+    import chatbot
+
+# ===============================================================================
+# MESSAGE CORPORA
+# ===============================================================================
+
+# Short, realistic student messages (the common case)
+REALISTIC_MESSAGES = [
+    "hey",
+    "I can't sleep before my exams, my mind keeps racing",
+    "My roommate and I had a huge fight and now I feel so alone here",
+    "I've been feeling really anxious about my grades this semester",
+    "Honestly I don't know why I'm even in college anymore",
+    "Can you help me plan a study schedule? The deadline is on Friday",
+    "I had a panic attack in the library today and everyone stared at me",
+    "thanks, that breathing exercise actually helped a bit :)",
+    "My parents keep comparing me to my cousin and it hurts",
+    "I skipped all my classes this week, I just couldn't get out of bed",
+]
+
+
+def _build_long_message(seed: int, length: int = 1000) -> str:
+    """
+    Build a realistic message of exactly `length` characters.
+
+    Args:
+        seed: Random seed so every run uses the same text
+        length: Target message length
+
+    Returns:
+        A message made from the realistic corpus words
+    """
+    rng = random.Random(seed)
+    words = " ".join(REALISTIC_MESSAGES).split()
+    parts: List[str] = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:length]
+
+
+# Messages right at InputValidator.MAX_MESSAGE_LENGTH
+LONG_MESSAGES = [_build_long_message(seed) for seed in range(10)]
+
+# Inputs crafted to make the harmful-pattern and spam regexes backtrack
+ADVERSARIAL_MESSAGES = [
+    "<script" + "<" * 993,                      # Script tag that never closes
+    "<script " + "<a" * 496,                    # Many '<' units inside an open tag
+    "<script>" * 125,                           # Repeated openers, no closer
+    "on" * 500,                                 # Event-handler prefix with no '='
+    "on" + "a" * 997 + " ",                     # Long handler name with no '='
+    ("aaaaaaaaaab" * 91)[:1000],                # Runs just under the spam limit
+    "".join(chr(0x61 + (i % 26)) * 10 for i in range(100)),  # 10-char runs everywhere
+    " " * 999 + "x",                            # Whitespace-only body for sanitize
+]
+
+# A long therapy session used for the conversation benchmarks
+LONG_SESSION_TURNS = 500
+
+# Messages in the index used for the search benchmark (20 per session)
+SEARCH_INDEX_MESSAGES = 200000
+
+# Messages scored per call in the risk classifier benchmark
+RISK_BATCH_SIZE = 64
+
+# ===============================================================================
+# BENCHMARK RUNNER
+# ===============================================================================
+
+@dataclass
+class Benchmark:
+    """
+    A single benchmark case.
+
+    Attributes:
+        name: Unique name shown in the report
+        func: Zero-argument callable that runs ONE operation
+        budget_us: Maximum allowed median time per call, in microseconds
+    """
+    name: str
+    func: Callable[[], object]
+    budget_us: float
+
+
+def _time_per_call(func: Callable[[], object], number: int) -> float:
+    """Run `func` `number` times and return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1_000_000
+
+
+def run_benchmark(bench: Benchmark, rounds: int = 7, min_round_time: float = 0.05) -> Dict[str, float]:
+    """
+    Time a benchmark in several rounds, pytest-benchmark style.
+
+    The call count per round is calibrated so each round lasts at least
+    `min_round_time` seconds, which keeps timer noise out of fast functions.
+
+    Args:
+        bench: The benchmark to run
+        rounds: Number of timed rounds
+        min_round_time: Minimum duration of a round in seconds
+
+    Returns:
+        Dictionary with min/median/max microseconds per call and the call count
+    """
+    # Calibrate: double the call count until one round is long enough
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            bench.func()
+        if time.perf_counter() - start >= min_round_time or number >= 1_000_000:
+            break
+        number *= 2
+
+    samples = [_time_per_call(bench.func, number) for _ in range(rounds)]
+    return {
+        "min_us": min(samples),
+        "median_us": statistics.median(samples),
+        "max_us": max(samples),
+        "calls_per_round": number,
+    }
+
+# ===============================================================================
+# BENCHMARK CASES
+# ===============================================================================
+
+def _cycle(items: List) -> Callable[[], object]:
+    """Return a function that hands out `items` one by one, forever."""
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+
+    return next_item
+
+
+def build_benchmarks() -> List[Benchmark]:
+    """
+    Create every benchmark case with fresh state.
+
+    Budgets are deliberately generous (several times the cost on a laptop)
+    so they only trip on real regressions, not on a slower CI machine.
+    """
+    benches: List[Benchmark] = []
+
+    # --- RateLimiter.is_allowed: many clients, bounded deques ---
+    limiter = RateLimiter(max_requests=20, time_window=60)
+    next_ip = _cycle([f"10.0.{i // 256}.{i % 256}" for i in range(5000)])
+    benches.append(Benchmark("rate_limiter.is_allowed", lambda: limiter.is_allowed(next_ip()), 25))
+
+    # --- InputValidator on the three corpora ---
+    validator = InputValidator()
+    corpora = {
+        "realistic": REALISTIC_MESSAGES,
+        "1000_chars": LONG_MESSAGES,
+        "adversarial": ADVERSARIAL_MESSAGES,
+    }
+    budgets = {
+        "validate_message": {"realistic": 40, "1000_chars": 400, "adversarial": 400},
+        "is_spam_message": {"realistic": 30, "1000_chars": 300, "adversarial": 300},
+        "sanitize_message": {"realistic": 20, "1000_chars": 200, "adversarial": 200},
+    }
+    for corpus_name, corpus in corpora.items():
+        nxt = _cycle(corpus)
+        benches.append(Benchmark(
+            f"validator.validate_message[{corpus_name}]",
+            lambda nxt=nxt: validator.validate_message(nxt()),
+            budgets["validate_message"][corpus_name],
+        ))
+        nxt = _cycle(corpus)
+        benches.append(Benchmark(
+            f"validator._is_spam_message[{corpus_name}]",
+            lambda nxt=nxt: validator._is_spam_message(nxt()),
+            budgets["is_spam_message"][corpus_name],
+        ))
+        nxt = _cycle(corpus)
+        benches.append(Benchmark(
+            f"validator.sanitize_message[{corpus_name}]",
+            lambda nxt=nxt: validator.sanitize_message(nxt()),
+            budgets["sanitize_message"][corpus_name],
+        ))
+
+    # --- ConversationManager.add_message on a long session ---
+    manager = ConversationManager()
+    add_session = manager.create_session()
+    next_text = _cycle(REALISTIC_MESSAGES + LONG_MESSAGES)
+    benches.append(Benchmark(
+        "conversation_manager.add_message",
+        lambda: manager.add_message(add_session, "user", next_text()),
+        30,
+    ))
+
+    # --- create_enhanced_prompt against the global manager ---
+    prompt_manager = chatbot.conversation_manager
+    short_session = prompt_manager.create_session()
+    long_session = prompt_manager.create_session()
+    for turn in range(LONG_SESSION_TURNS):
+        role = "user" if turn % 2 == 0 else "assistant"
+        prompt_manager.add_message(long_session, role, LONG_MESSAGES[turn % len(LONG_MESSAGES)])
+    next_prompt = _cycle(REALISTIC_MESSAGES)
+    benches.append(Benchmark(
+        "create_enhanced_prompt[new_session]",
+        lambda: chatbot.create_enhanced_prompt(short_session, next_prompt()),
+        50,
+    ))
+    benches.append(Benchmark(
+        f"create_enhanced_prompt[{LONG_SESSION_TURNS}_turns]",
+        lambda: chatbot.create_enhanced_prompt(long_session, next_prompt()),
+        500,
+    ))
+
+    # --- AnalyticsRollups.record: one message into every resolution ---
+    rollups = AnalyticsRollups()
+    next_institute = _cycle([f"Institute {i}" for i in range(50)] + [None])
+    next_personality = _cycle(list(chatbot.TherapyAssistant.THERAPY_PERSONALITIES))
+    benches.append(Benchmark(
+        "analytics_rollups.record",
+        lambda: rollups.record(next_institute(), next_personality(), False, True),
+        20,
+    ))
+
+    # --- SearchIndex.search with a few hundred thousand messages indexed ---
+    index = SearchIndex()
+    rng = random.Random(36)
+    corpus = REALISTIC_MESSAGES + LONG_MESSAGES
+    for i in range(SEARCH_INDEX_MESSAGES):
+        text = corpus[rng.randrange(len(corpus))]
+        if i % 50 == 0:
+            text += f" I'm worried about CS{100 + i % 400} this week"
+        index.add_message(f"session-{i // 20}", i % 20 + 1, text)
+    index.flush()
+    next_query = _cycle(["panic attack", "sleep exams", "roommate", "cs101", "parents comparing cousin",
+                         "nothing matches this query"])
+    benches.append(Benchmark(
+        f"search_index.search[{SEARCH_INDEX_MESSAGES}_messages]",
+        lambda: index.search(next_query(), limit=20),
+        5000,
+    ))
+
+    # --- RiskClassifier.score_batch: one full micro-batch (skipped without numpy) ---
+    classifier = RiskClassifier()
+    if classifier.load():
+        for corpus_name, corpus, budget_us in (("realistic", REALISTIC_MESSAGES, 150),
+                                               ("1000_chars", LONG_MESSAGES, 3000)):
+            batch = (corpus * RISK_BATCH_SIZE)[:RISK_BATCH_SIZE]
+            benches.append(Benchmark(
+                f"risk_classifier.score_batch[{RISK_BATCH_SIZE}x{corpus_name}]",
+                lambda batch=batch: classifier.score_batch(batch),
+                budget_us * RISK_BATCH_SIZE,  # budget per message x batch size
+            ))
+
+    return benches
+
+# ===============================================================================
+# REPORTING AND REGRESSION CHECKS
+# ===============================================================================
+
+def check_results(results: Dict[str, Dict[str, float]], budgets: Dict[str, float],
+                  baseline: Optional[Dict[str, Dict[str, float]]], tolerance: float) -> List[str]:
+    """
+    Compare results against budgets and an optional baseline.
+
+    Args:
+        results: Benchmark name -> timing stats
+        budgets: Benchmark name -> budget in microseconds
+        baseline: Previously saved results, or None
+        tolerance: Allowed slowdown factor against the baseline (1.5 = 50% slower)
+
+    Returns:
+        List of human-readable failure messages (empty when everything passed)
+    """
+    failures = []
+    for name, stats in results.items():
+        median = stats["median_us"]
+        if median > budgets[name]:
+            failures.append(f"{name}: {median:.1f}us is over the {budgets[name]:.0f}us budget")
+        if baseline and name in baseline:
+            limit = baseline[name]["median_us"] * tolerance
+            if median > limit:
+                failures.append(
+                    f"{name}: {median:.1f}us is slower than baseline "
+                    f"{baseline[name]['median_us']:.1f}us x {tolerance}"
+                )
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the chat request path")
+    parser.add_argument("--only", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--rounds", type=int, default=7, help="Timed rounds per benchmark")
+    parser.add_argument("--save", metavar="PATH", help="Write results to a JSON baseline file")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Allowed slowdown factor against the baseline (default: 1.5)")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    # Discard the per-call debug prints so they don't flood the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        benches = build_benchmarks()
+    if args.only:
+        benches = [b for b in benches if args.only in b.name]
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':<48} {'median':>10} {'min':>10} {'budget':>10}")
+    print("-" * 82)
+    for bench in benches:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stats = run_benchmark(bench, rounds=args.rounds)
+        results[bench.name] = stats
+        flag = "" if stats["median_us"] <= bench.budget_us else "  << OVER BUDGET"
+        print(f"{bench.name:<48} {stats['median_us']:>8.1f}us {stats['min_us']:>8.1f}us "
+              f"{bench.budget_us:>8.0f}us{flag}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save}")
+
+    failures = check_results(results, {b.name: b.budget_us for b in benches}, baseline, args.tolerance)
+    if failures:
+        print("\nPERFORMANCE REGRESSIONS:")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+
+    print("\nAll benchmarks within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,24 +11,98 @@
 # ===============================================================================
 # IMPORTS AND DEPENDENCIES
 # ===============================================================================
-from fastapi import FastAPI, Request, HTTPException
+# Heavy or rarely used modules (requests, smtplib, email) are imported inside
+# the functions that need them, so spawning a worker doesn't pay for them.
+from fastapi import FastAPI, Request, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import requests
 import json
-from typing import Optional
-from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, List
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from fastapi import BackgroundTasks
-import os
+from contextlib import asynccontextmanager
 import uuid
-import smtplib
-from email.message import EmailMessage
 from datetime import datetime, timedelta
 import asyncio
+import threading
+import time
 
 # Import our custom modules
 from features import conversation_manager, format_conversation_for_ollama
-from security import rate_limiter, input_validator, error_handler
+from security import rate_limiter, input_validator, error_handler, admin_auth, print_security_summary
+from settings import get_settings
+from stats import stats_registry
+from ollama_client import model_lifecycle, model_breaker, stream_text, ModelUnavailableError
+from summarizer import ConversationSummarizer
+from prompt_templates import PromptTemplateRegistry
+from response_cache import FastJSONResponse, response_cache, cached_json_response
+from archive import ConversationArchiver, parse_time
+from search_index import search_index, tokenize, make_snippet
+from analytics import analytics_rollups
+from alerts import alert_pipeline, CrisisAlert, EXCERPT_CHARS
+from sse import coalesce_sse, encode_sse, HEARTBEAT_FRAME, HEARTBEAT_INTERVAL
+from idempotency import idempotency_registry, InFlightGeneration, GenerationAbandonedError
+from load_control import AdaptiveGenerationController, GenerationBudget
+from risk_classifier import risk_classifier, risk_level, HIGH_RISK
+from traffic_capture import traffic_recorder, TrafficCaptureMiddleware, note_generation, note_session
+from pubsub import session_broker, Subscription, TooManySubscribersError
+from profiler import (sampling_profiler, memory_tracer, ProfilerBusyError, collapse_stacks, top_functions,
+                      process_memory, pending_tasks)
+
+# ===============================================================================
+# APP LIFESPAN (STARTUP AND SHUTDOWN)
+# ===============================================================================
+# Importing this module only defines things. Everything that reads files, talks
+# to other services or prints happens here, once the server actually starts.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resolve configuration once (loads backend/.env if present)
+    settings = get_settings()
+
+    # Print masked presence of critical env vars for local debugging (do not log secrets in production)
+    def mask(s):
+        if not s:
+            return None
+        return s[:6] + '...' + str(len(s))
+    print(f"[startup] SUPABASE_URL={'set' if settings.supabase_url else 'NOT_SET'}, SUPABASE_SERVICE_ROLE_KEY={mask(settings.supabase_service_role_key)}")
+    print_security_summary()
+
+    # Precompile every personality's system prompt before the first request
+    prompt_registry.load()
+
+    # Preload the model and keep it warm during counseling hours
+    model_lifecycle.configure(settings)
+    model_lifecycle.start()
+
+    # Institutes the analytics may count when a client names one
+    analytics_rollups.configure(settings)
+
+    # Bounds for shrinking reply length and history under load
+    generation_controller.configure(settings)
+
+    # Index stored messages for /admin/search in the background, off the request path
+    search_index.start()
+
+    # Move cold sessions out of memory into compressed archive files
+    conversation_archiver.configure(settings)
+    conversation_archiver.start()
+
+    # Deliver crisis alerts in the background (email, webhook, database, log)
+    alert_pipeline.configure(settings)
+    alert_pipeline.start()
+
+    # Record anonymized request traces for replay.py (only if TRAFFIC_CAPTURE_FILE is set)
+    traffic_recorder.configure(settings)
+    traffic_recorder.start()
+
+    yield
+
+    traffic_recorder.stop()
+    alert_pipeline.stop()
+    conversation_archiver.stop()
+    search_index.stop()
+    model_lifecycle.stop()
 
 # ===============================================================================
 # FASTAPI APP INITIALIZATION
@@ -36,49 +110,24 @@ from security import rate_limiter, input_validator, error_handler
 app = FastAPI(
     title="Intelligent Chatbot API",
     description="A conversational AI with memory, personality, and security features",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    # orjson-backed (when installed) JSON for every dict returned by an endpoint
+    default_response_class=FastJSONResponse
 )
 
-try:
-    from dotenv import load_dotenv, find_dotenv  # optional: used for local development
-    # Load environment variables from backend/.env (local development)
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    # Also search up the tree as a fallback
-    discovered = find_dotenv(env_path) or find_dotenv()
-    load_dotenv(discovered or env_path, override=True)
-except Exception:
-    # Don't fail import if python-dotenv isn't installed; warn and continue.
-    print("Warning: python-dotenv not installed, .env file not loaded. Install via 'pip install python-dotenv' to load backend/.env automatically.")
-
-
-    @app.on_event("startup")
-    async def _print_env_debug():
-        # Print masked presence of critical env vars for local debugging (do not log secrets in production)
-        supa_url = os.getenv('SUPABASE_URL')
-        supa_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        def mask(s):
-            if not s:
-                return None
-            return s[:6] + '...' + str(len(s))
-        print(f"[startup] SUPABASE_URL={'set' if supa_url else 'NOT_SET'}, SUPABASE_SERVICE_ROLE_KEY={mask(supa_key)}")
-
-
-    @app.get("/health")
-    async def health():
-        supa_url = bool(os.getenv('SUPABASE_URL'))
-        supa_role = bool(os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
-        smtp_ok = all([
-            os.getenv('SMTP_HOST'),
-            os.getenv('SMTP_PORT'),
-            os.getenv('SMTP_USER'),
-            os.getenv('SMTP_PASS')
-        ])
-        return {
-            "status": "ok",
-            "supabaseUrlSet": supa_url,
-            "serviceRoleSet": supa_role,
-            "smtpConfigured": smtp_ok
-        }
+
+@app.get("/health")
+async def health():
+    settings = get_settings()
+    return {
+        "status": "ok",
+        "supabaseUrlSet": bool(settings.supabase_url),
+        "serviceRoleSet": bool(settings.supabase_service_role_key),
+        "smtpConfigured": settings.smtp_configured,
+        "model": model_lifecycle.status(),
+        "model_breaker": model_breaker.status()
+    }
 
 # Add CORS middleware to allow frontend connections
 app.add_middleware(
@@ -94,8 +143,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    # Let the frontend read ETags for conditional requests
+    expose_headers=["ETag"],
 )
 
+# Time and record replayable requests (idle unless TRAFFIC_CAPTURE_FILE is set)
+app.add_middleware(TrafficCaptureMiddleware, recorder=traffic_recorder)
+
 # ===============================================================================
 # THERAPY ASSISTANT SYSTEM PROMPTS AND CONFIGURATION
 # ===============================================================================
@@ -123,27 +177,10 @@ class TherapyAssistant:
         "top_p": 0.7
     }
     
-    # Main system prompt for MindCareAI
-    SYSTEM_PROMPT = """You are **MindCareAI**, a compassionate and intelligent therapy assistant designed to help users navigate their thoughts, emotions, and mental health struggles through natural, supportive conversation. Always introduce yourself as MindCareAI when asked and never reference any other base models. Your role is to act as a therapist would—listening attentively, asking insightful questions, and guiding the user toward self-awareness and effective coping strategies. Never dismiss a user's struggles; instead, explore their feelings further with thoughtful, open-ended questions. 
-Help them uncover underlying issues by gently encouraging reflection on their emotions, triggers, and thought patterns. Offer validation, structured guidance, and coping techniques rooted in therapeutic approaches while maintaining a warm, human-like tone. Avoid robotic or overly formal responses, and never state that you can't help—instead, always seek to understand and support. Do not provide medical diagnoses, but help users recognize emotional patterns and potential concerns. Keep the conversation focused on the user's thoughts and well-being, ensuring a safe and empathetic space for self-exploration and growth.
-Your conversations must be human like, you may use abbreviations and slang to do so. Do not go on long explanations during your conversations, instead keep it short and simple the way an actual human would. Remember to compliment or cheer up the user once in a while"""
-    
     @classmethod
-    def get_system_prompt(cls, message: str = "") -> str:
-        """Get the MindCareAI system prompt with conversation context."""
-        base_prompt = cls.SYSTEM_PROMPT
-        
-        # Add conversation context instructions
-        context_instructions = """
-
-IMPORTANT CONTEXT RULES:
-- You have access to previous conversation history when provided
-- Always acknowledge and build upon previous interactions
-- Remember user preferences, names, and topics mentioned earlier
-- If this is the start of a conversation, introduce yourself appropriately
-- Maintain consistency with your previous responses in the same conversation"""
-        
-        return base_prompt + context_instructions
+    def get_system_prompt(cls, personality: Optional[str] = None) -> str:
+        """Get the precompiled system prompt (with context rules) for a personality."""
+        return prompt_registry.get_prefix(personality or cls.CURRENT_PERSONALITY)
 
     # --- Simple heuristics used by endpoints below ---
     @staticmethod
@@ -172,15 +209,41 @@ IMPORTANT CONTEXT RULES:
             return "CBT"
         return cls.CURRENT_PERSONALITY
 
+# System prompts live in prompts/<personality>.txt and are precompiled once;
+# edits to those files are picked up automatically (see prompt_templates.py)
+prompt_registry = PromptTemplateRegistry(
+    personalities=list(TherapyAssistant.THERAPY_PERSONALITIES.keys()),
+    default_personality="MindCareAI"
+)
+
+# Number of recent messages included verbatim in the prompt. Older messages are
+# condensed into a rolling summary in the background (see summarizer.py).
+PROMPT_HISTORY_MESSAGES = 5
+conversation_summarizer = ConversationSummarizer(conversation_manager, keep_recent=PROMPT_HISTORY_MESSAGES)
+# The summary catches up every min_batch messages; until it does, the prompt
+# carries every message it doesn't cover verbatim (up to this many), so none
+# is missing from both. Normally at most keep_recent + min_batch - 1.
+PROMPT_MAX_UNSUMMARIZED = 16
+# Shrinks num_predict and the history window while the model is under load
+generation_controller = AdaptiveGenerationController(TherapyAssistant.OLLAMA_PARAMETERS,
+                                                     max_history=PROMPT_HISTORY_MESSAGES)
+# Archives cold sessions to disk and restores them on their next message
+conversation_archiver = ConversationArchiver(conversation_manager)
+# Longest accepted Idempotency-Key / client_message_id
+MAX_IDEMPOTENCY_KEY_LENGTH = 200
+
 # ===============================================================================
 # REQUEST/RESPONSE MODELS
 # ===============================================================================
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None  # Optional session ID for conversation continuity
+    institute: Optional[str] = None  # Student's institute (only trusted if known, see trusted_institute)
+    client_message_id: Optional[str] = None  # Idempotency key (same as the Idempotency-Key header)
 
 class PersonalityUpdateRequest(BaseModel):
     personality: str  # New therapeutic approach to switch to
+    session_id: Optional[str] = None  # Only change this session (default: change the default for new sessions)
 
 class CrisisCheckRequest(BaseModel):
     message: str  # Message to check for crisis indicators
@@ -206,25 +269,142 @@ def get_client_ip(request: Request) -> str:
     # Fallback to direct IP
     return request.client.host if request.client else "unknown"
 
-def create_enhanced_prompt(session_id: str, user_message: str) -> str:
-    """Create a MindCareAI prompt with conversation history."""
+def require_admin(request: Request, allowed_roles=None):
+    """
+    Raise 401 without valid credentials (missing, invalid or expired),
+    403 if they are valid but the role isn't allowed.
+    """
+    is_allowed, auth_error = admin_auth.authorize(request.headers, allowed_roles)
+    if not is_allowed:
+        status_code = 403 if auth_error == "Your role is not allowed to use this endpoint" else 401
+        raise HTTPException(status_code=status_code, detail=auth_error)
+
+async def load_archived_session(session_id: str) -> bool:
+    """
+    Bring a session the archiver moved to disk back into memory, reading the
+    archive in the threadpool (never on the event loop). Cheap when the session
+    is already in memory. Doesn't create a session that doesn't exist.
+    
+    Returns:
+        True if the session is in memory now
+    """
+    if session_id in conversation_manager:
+        return True
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, conversation_manager.load_archived, session_id)
+
+def get_session_personality(session_id: str, user_message: str = "") -> str:
+    """
+    Get the session's therapy personality, choosing one from the first message
+    if the session doesn't have one yet.
+    """
+    personality = conversation_manager.get_personality(session_id)
+    if personality is None:
+        personality = TherapyAssistant.get_appropriate_personality(user_message)
+        conversation_manager.set_personality(session_id, personality)
+    return personality
+
+def trusted_institute(headers, claimed: Optional[str]) -> Optional[str]:
+    """
+    The student's institute, from a source a client can't make up: the
+    `institute` claim of their signed login token, or else the name the client
+    sent if it is one of KNOWN_INSTITUTES. None (counted as "unknown") otherwise.
+    """
+    claims = admin_auth.verified_claims(headers)
+    if claims and isinstance(claims.get("institute"), str) and claims["institute"].strip():
+        return claims["institute"]
+    return analytics_rollups.known_institute(claimed)
+
+def record_message_analytics(chat: ChatRequest, session_id: str, clean_message: str, is_crisis: bool):
+    """Count a user message (and what the detectors found) in the analytics rollups."""
+    analytics_rollups.record(
+        institute=chat.institute,
+        personality=get_session_personality(session_id, clean_message),
+        crisis=is_crisis,
+        academic_stress=TherapyAssistant.detect_academic_stress(clean_message)
+    )
+
+def enqueue_crisis_alert(chat: ChatRequest, session_id: str, clean_message: str, source: str):
+    """Queue a crisis alert for counselors. Never waits for delivery (see alerts.py)."""
+    alert_pipeline.enqueue(CrisisAlert(
+        session_id=session_id,
+        excerpt=clean_message[:EXCERPT_CHARS],
+        source=source,
+        institute=chat.institute,
+        personality=conversation_manager.get_personality(session_id)
+    ))
+
+def get_idempotency_key(request: Request, chat: ChatRequest):
+    """
+    Read the request's idempotency key (Idempotency-Key header, or client_message_id).
+    The key is scoped to the sender (signed-in user, or client IP) and the
+    session, so a key copied from another student never returns their reply.
+
+    Returns:
+        (scoped key or None, error message or None)
+    """
+    key = request.headers.get("Idempotency-Key") or chat.client_message_id
+    if key is None:
+        return None, None
+    if not 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        return None, f"Idempotency key must be 1-{MAX_IDEMPOTENCY_KEY_LENGTH} characters"
+    claims = admin_auth.verified_claims(request.headers)
+    client = f"user:{claims['sub']}" if claims and claims.get("sub") else f"ip:{get_client_ip(request)}"
+    return idempotency_registry.scoped_key(client, chat.session_id, key), None
+
+def claim_generation(scoped_key: Optional[str], clean_message: str):
+    """
+    Find the generation a retried request should attach to, or reserve a new
+    one for this request. One synchronous step: call it before the request's
+    first await, so two duplicates arriving together can't both generate.
+
+    A generation that failed is started again (without storing the user
+    message a second time), so retrying after an error still gets a reply.
+
+    Returns:
+        (generation or None, True if it is new, error message or None). A new
+        generation must be launched, or abandoned if the request fails first.
+    """
+    generation, is_new = idempotency_registry.claim(scoped_key, clean_message)
+    if is_new:
+        return generation, True, None
+    if generation.message_hash != idempotency_registry.message_hash(clean_message):
+        return None, False, "Idempotency key was already used for a different message"
+    if generation.error is not None:
+        generation = idempotency_registry.retry(generation)
+    return generation, False, None
+
+def create_enhanced_prompt(session_id: str, user_message: str,
+                           history_messages: int = PROMPT_HISTORY_MESSAGES,
+                           history: Optional[List[Dict]] = None) -> str:
+    """
+    Create a MindCareAI prompt with conversation history (the last `history_messages` messages).
+    Pass `history` when it was already read, e.g. by append_and_get_window when the
+    user message was stored.
+    """
+    
+    # Get the precompiled system prompt for this session's personality
+    system_prompt = TherapyAssistant.get_system_prompt(get_session_personality(session_id, user_message))
     
-    # Get the main system prompt
-    system_prompt = TherapyAssistant.get_system_prompt(user_message)
+    # Get recent conversation history (only the messages that go in the prompt)
+    if history is None:
+        history = conversation_manager.get_recent_history(session_id, history_messages)
     
-    # Get conversation history (keep last 5 exchanges for context)
-    history = conversation_manager.get_conversation_history(session_id)
-    if history and len(history) > 10:  # Keep only recent context
-        history = history[-10:]
+    # Older messages are represented by the rolling summary, if there is one
+    summary = conversation_manager.get_summary(session_id)
+    summary_section = f"""
+
+Summary of earlier conversation:
+{summary.text}""" if summary else ""
     
     # Build efficient prompt with conversation history
     if history:
         context_parts = []
-        for msg in history[-5:]:  # Only last 5 messages
+        for msg in history:
             context_parts.append(f"{msg['role']}: {msg['content']}")
 
         context = "\n".join(context_parts)
-        enhanced_prompt = f"""{system_prompt}
+        enhanced_prompt = f"""{system_prompt}{summary_section}
 
 Previous conversation:
 {context}
@@ -248,6 +428,9 @@ async def send_verification_email(smtp_host, smtp_port, smtp_user, smtp_pass, fr
     subject = "Verify your MindCare account"
     body = f"Hi {full_name or 'there'},\n\nPlease verify your MindCare account by clicking the link below:\n\n{verify_link}\n\nIf you didn't request this, you can ignore this email.\n\nThanks,\nMindCare Team"
 
+    import smtplib
+    from email.message import EmailMessage
+
     msg = EmailMessage()
     msg['Subject'] = subject
     msg['From'] = from_addr
@@ -285,8 +468,11 @@ async def signup(request: Request, signup: SignUpRequest, background_tasks: Back
     - SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM
     - FRONTEND_URL (to build the verification link)
     """
-    SUPABASE_URL = os.getenv('SUPABASE_URL')
-    SERVICE_ROLE = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    import requests
+
+    settings = get_settings()
+    SUPABASE_URL = settings.supabase_url
+    SERVICE_ROLE = settings.supabase_service_role_key
     # Debug: masked presence
     def _mask(s):
         if not s:
@@ -375,15 +561,8 @@ async def signup(request: Request, signup: SignUpRequest, background_tasks: Back
         print("Warning: could not store token:", e)
 
     # Prepare SMTP send via background task
-    smtp_host = os.getenv('SMTP_HOST')
-    smtp_port = os.getenv('SMTP_PORT')
-    smtp_user = os.getenv('SMTP_USER')
-    smtp_pass = os.getenv('SMTP_PASS')
-    smtp_from = os.getenv('SMTP_FROM') or smtp_user
-    frontend_url = os.getenv('FRONTEND_URL') or 'http://localhost:8080'
-
-    if smtp_host and smtp_port and smtp_user and smtp_pass:
-        background_tasks.add_task(send_verification_email, smtp_host, smtp_port, smtp_user, smtp_pass, smtp_from, signup.email, signup.full_name, token, frontend_url)
+    if settings.smtp_configured:
+        background_tasks.add_task(send_verification_email, settings.smtp_host, settings.smtp_port, settings.smtp_user, settings.smtp_pass, settings.smtp_from, signup.email, signup.full_name, token, settings.frontend_url)
     else:
         print("SMTP not configured; skipping verification email send")
 
@@ -400,6 +579,7 @@ async def create_new_session():
     """
     try:
         session_id = conversation_manager.create_session()
+        note_session(session_id)
         return {
             "session_id": session_id, 
             "message": "New conversation started! I'm MindCareAI, here to support you through your thoughts and emotions.",
@@ -412,11 +592,78 @@ async def create_new_session():
 # ===============================================================================
 # API ENDPOINTS - MAIN CHAT FUNCTIONALITY
 # ===============================================================================
+async def generate_chat_reply(generation: InFlightGeneration, enhanced_prompt: str,
+                              budget: GenerationBudget) -> str:
+    """
+    Generate and store the reply for /chat.
+
+    Streams from Ollama (pieces go to the generation, so other requests can
+    follow along). Errors are not retried here: a second call would only add
+    load to a struggling model host. The endpoint answers with the fallback
+    reply instead, and the failure counts towards the circuit breaker.
+    """
+    session_id = generation.session_id
+    async for text_piece in generation_controller.track(stream_text(enhanced_prompt, budget.options)):
+        generation.push(text_piece)
+        session_broker.publish(session_id, {"type": "token", "text": text_piece})
+    note_generation(output_tokens=len(generation.pieces))
+    ai_response = "".join(generation.pieces).strip()
+    if not ai_response:
+        ai_response = "I apologize, but I couldn't generate a proper response. Please try again."
+    
+    # CONVERSATION STEP 4: Store AI response
+    conversation_manager.add_message(session_id, "assistant", ai_response)
+    
+    # CONVERSATION STEP 5: Refresh the rolling summary in the threadpool
+    conversation_summarizer.schedule_if_needed(session_id)
+    return ai_response
+
+def chat_success_response(session_id: str, ai_response: str, status: str = "success") -> Dict:
+    return {
+        "response": ai_response,
+        "session_id": session_id,
+        "message_count": conversation_manager.get_session_info(session_id)["message_count"],
+        "personality": get_session_personality(session_id),
+        "status": status
+    }
+
+def model_fallback_reply() -> str:
+    """
+    Reply sent right away when the AI model fails or its circuit breaker is
+    open. Lists the emergency contacts from /resources, since the student
+    may be in crisis.
+    """
+    contacts = MENTAL_HEALTH_RESOURCES["emergency_contacts"]
+    return (
+        "I'm sorry, I can't respond right now because the AI service is temporarily unavailable. "
+        "Please try again in a few minutes.\n\n"
+        "If you need to talk to someone now, please reach out:\n"
+        f"- Suicide & Crisis Lifeline: call or text {contacts['national_suicide_prevention_lifeline']}\n"
+        f"- Crisis Text Line: {contacts['crisis_text_line']}\n"
+        f"- Emergency services: {contacts['emergency_services']}\n"
+        f"- {MENTAL_HEALTH_RESOURCES['college_resources']['counseling_center']}"
+    )
+
+async def wait_for_chat_reply(generation: InFlightGeneration) -> Dict:
+    """Wait for a /chat generation; answer with the fallback reply if the model failed."""
+    import requests
+
+    try:
+        return chat_success_response(generation.session_id, await generation.wait())
+    except (requests.exceptions.RequestException, ModelUnavailableError) as e:
+        print(f"AI model unavailable, sent the fallback reply: {e}")
+        return chat_success_response(generation.session_id, model_fallback_reply(), status="fallback")
+
 @app.post("/chat")
-async def chat_endpoint(request: Request, chat: ChatRequest):
+async def chat_endpoint(request: Request, chat: ChatRequest, response: Response):
     """
     Main chat endpoint with full conversation memory, security, and personality.
+
+    Send an Idempotency-Key header (or client_message_id) to make retries safe:
+    a retry with the same key waits for the original reply instead of
+    generating (and storing) a second one.
     """
+    reserved = None  # Generation claimed for this request, until it is launched
     try:
         # SECURITY STEP 1: Rate limiting check
         client_ip = get_client_ip(request)
@@ -429,129 +676,126 @@ async def chat_endpoint(request: Request, chat: ChatRequest):
         if not is_valid:
             return error_handler.validation_error(validation_error)
         
-        # SECURITY STEP 3: Sanitize input
+        # SECURITY STEP 3: Sanitize input (and only keep an institute we can trust)
         clean_message = input_validator.sanitize_message(chat.message)
+        chat.institute = trusted_institute(request.headers, chat.institute)
         
-        # SESSION STEP 1: Handle session ID
+        # SESSION STEP 1: Validate a provided session ID
         session_id = chat.session_id
         if session_id:
-            # Validate provided session ID
             is_valid_session, session_error = input_validator.validate_session_id(session_id)
             if not is_valid_session:
                 return error_handler.validation_error(session_error)
-        else:
-            # Create new session if none provided
+        
+        # IDEMPOTENCY STEP: A retry attaches to the reply already being generated
+        # (claimed before any await, so a concurrent duplicate finds this one)
+        scoped_key, key_error = get_idempotency_key(request, chat)
+        if key_error:
+            return error_handler.validation_error(key_error)
+        generation, is_new, key_error = claim_generation(scoped_key, clean_message)
+        if key_error:
+            return error_handler.validation_error(key_error)
+        if not is_new:
+            response.headers["Idempotency-Replayed"] = "true"
+            return await wait_for_chat_reply(generation)
+        reserved = generation
+        
+        # SAFETY STEP: Count crisis indicators (cheap keyword check)
+        is_crisis = TherapyAssistant.detect_crisis(clean_message)
+        if is_crisis:
+            stats_registry.record_crisis()
+        
+        # Create new session if none provided
+        if not session_id:
             session_id = conversation_manager.create_session()
         
-        # SESSION STEP 2: Ensure session exists (create if needed)
-        session_info = conversation_manager.get_session_info(session_id)
-        if not session_info["exists"]:
-            # Auto-create the session with the provided ID
-            conversation_manager.conversations[session_id] = []
-            print(f"Auto-created session: {session_id}")
-            session_info = {"exists": True, "message_count": 0}
+        # SESSION STEP 2: Ensure session exists (create or restore from the archive if needed)
+        await load_archived_session(session_id)
+        conversation_manager.ensure_session(session_id)
+        note_session(session_id)
+        if is_crisis:
+            conversation_manager.flag_crisis(session_id)
         
-        # CONVERSATION STEP 1: Create enhanced prompt with system personality
-        enhanced_prompt = create_enhanced_prompt(session_id, clean_message)
+        # CONVERSATION STEP 1: Store user message, reading the history before it in the same step
+        # (history window and reply length shrink under load, except for crisis sessions)
+        budget = generation_controller.budget(crisis=conversation_manager.is_crisis_flagged(session_id))
+        history = conversation_manager.append_and_get_window(session_id, "user", clean_message,
+                                                             budget.history_messages, PROMPT_MAX_UNSUMMARIZED)
         
-        # CONVERSATION STEP 2: Store user message
-        conversation_manager.add_message(session_id, "user", clean_message)
+        # CONVERSATION STEP 2: Create enhanced prompt with system personality, and count
+        # the message for the analytics dashboard
+        enhanced_prompt = create_enhanced_prompt(session_id, clean_message, history=history)
+        note_generation(prompt_chars=len(enhanced_prompt), history_messages=len(history or []))
+        record_message_analytics(chat, session_id, clean_message, is_crisis)
         
-    # AI PROCESSING STEP: Send to Ollama with MindCareAI parameters
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": "gemma3:latest",
-            "prompt": enhanced_prompt,
-            # Enable streaming from Ollama - we'll consume line-delimited JSON chunks
-            "stream": True,
-            "options": TherapyAssistant.OLLAMA_PARAMETERS
-        }
-
-        # Use streamed request so we can relay partial outputs as they arrive.
-        # Keep a non-stream fallback in case the server doesn't support streaming.
-        try:
-            resp = requests.post(ollama_url, json=payload, timeout=120, stream=True)
-            resp.raise_for_status()
-
-            # Ollama streams line-delimited JSON objects. We'll iterate and
-            # concatenate any `response`/`content` fields we find. If the
-            # server returns plain text lines, we'll append them as well.
-            ai_parts = []
-            for raw_line in resp.iter_lines(decode_unicode=True):
-                if not raw_line:
-                    continue
-                # Try to parse JSON chunk
-                try:
-                    chunk = json.loads(raw_line)
-                except Exception:
-                    # Not JSON, treat as plain text
-                    ai_parts.append(raw_line)
-                    continue
-
-                # Common keys: 'response', 'content', 'delta'
-                if isinstance(chunk, dict):
-                    # 'response' may contain the full text in some endpoints
-                    if 'response' in chunk and isinstance(chunk['response'], str):
-                        ai_parts.append(chunk['response'])
-                    # 'content' may be used for incremental tokens
-                    elif 'content' in chunk and isinstance(chunk['content'], str):
-                        ai_parts.append(chunk['content'])
-                    # 'delta' may carry incremental pieces
-                    elif 'delta' in chunk:
-                        delta = chunk['delta']
-                        if isinstance(delta, str):
-                            ai_parts.append(delta)
-                        elif isinstance(delta, dict):
-                            # e.g., {'content': 'text'}
-                            content = delta.get('content') or delta.get('response')
-                            if isinstance(content, str):
-                                ai_parts.append(content)
-
-            ai_response = "".join(ai_parts).strip()
-
-            # If streaming produced no output, attempt a non-streamed fallback
-            if not ai_response:
-                # Fallback: request without streaming
-                payload['stream'] = False
-                fallback = requests.post(ollama_url, json=payload, timeout=60)
-                fallback.raise_for_status()
-                data = fallback.json()
-                ai_response = data.get('response', '') or data.get('content', '')
-                ai_response = ai_response.strip() if isinstance(ai_response, str) else ''
-        except requests.exceptions.RequestException:
-            # If streaming request failed entirely, attempt a normal blocking call
-            payload['stream'] = False
-            response = requests.post(ollama_url, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            ai_response = data.get("response", "") or data.get('content', '')
-            ai_response = ai_response.strip() if isinstance(ai_response, str) else ''
-        if not ai_response:
-            ai_response = "I apologize, but I couldn't generate a proper response. Please try again."
+        # SAFETY STEP: Escalate crisis messages to counselors (queued, delivered in the background)
+        if is_crisis:
+            enqueue_crisis_alert(chat, session_id, clean_message, "/chat")
         
-        # CONVERSATION STEP 4: Store AI response
-        conversation_manager.add_message(session_id, "assistant", ai_response)
+        # AI PROCESSING STEP: Generate the reply in a background task (see idempotency.py)
+        # so a retry of this request can wait for it instead of starting another one
+        idempotency_registry.launch(
+            generation, session_id,
+            lambda generation: generate_chat_reply(generation, enhanced_prompt, budget)
+        )
         
-        # SUCCESS RESPONSE
-        return {
-            "response": ai_response,
-            "session_id": session_id,
-            "message_count": conversation_manager.get_session_info(session_id)["message_count"],
-            "personality": "MindCareAI",
-            "status": "success"
-        }
+        # SUCCESS RESPONSE (or the fallback reply if the model is unavailable)
+        return await wait_for_chat_reply(generation)
         
-    except requests.exceptions.Timeout:
-        return error_handler.server_error("AI model response timed out. Please try again.")
-    except requests.exceptions.ConnectionError:
-        return error_handler.server_error("Could not connect to AI model. Please ensure Ollama is running.")
-    except requests.exceptions.RequestException as e:
-        return error_handler.server_error(f"AI model request failed: {str(e)}")
-    except json.JSONDecodeError as e:
-        return error_handler.server_error(f"Invalid response from AI model: {str(e)}")
     except Exception as e:
         return error_handler.server_error(f"Unexpected error: {str(e)}")
+    finally:
+        if reserved is not None:
+            idempotency_registry.abandon(reserved)
+
 
+async def stream_chat_reply(generation: InFlightGeneration, enhanced_prompt: str,
+                            budget: GenerationBudget) -> str:
+    """Stream the reply for /ai-chat into the generation and store it."""
+    completed = False
+    try:
+        async for text_piece in generation_controller.track(stream_text(enhanced_prompt, budget.options)):
+            generation.push(text_piece)
+            session_broker.publish(generation.session_id, {"type": "token", "text": text_piece})
+        completed = True
+    finally:
+        note_generation(output_tokens=len(generation.pieces))
+        # Store the reply so later turns (and summaries) can see it. What was
+        # generated before an error is only stored when no retry can follow: a
+        # retry with the same idempotency key generates and stores the reply again
+        ai_response = "".join(generation.pieces).strip()
+        if ai_response and (completed or generation.key is None):
+            conversation_manager.add_message(generation.session_id, "assistant", ai_response)
+            conversation_summarizer.schedule_if_needed(generation.session_id)
+    return ai_response
+
+def sse_chat_response(generation: InFlightGeneration, replayed: bool = False) -> StreamingResponse:
+    """Stream a generation to the client as SSE (from its first token)."""
+    import requests
+
+    async def event_stream():
+        # Tokens are batched into fewer, larger SSE frames (see sse.py);
+        # the first token is still sent the moment it arrives
+        try:
+            async for frame in coalesce_sse(generation.follow()):
+                yield frame
+        except (requests.exceptions.RequestException, ModelUnavailableError) as e:
+            # Model failed or its circuit breaker is open: send the fallback
+            # reply (with crisis resources) right away
+            print(f"AI model unavailable, sent the fallback reply: {e}")
+            fallback = model_fallback_reply()
+            yield encode_sse(f"\n\n{fallback}" if generation.pieces else fallback, event="fallback")
+        except GenerationAbandonedError:
+            # The original request failed before generating anything; a retry starts afresh
+            yield encode_sse("Sorry, your message couldn't be processed. Please send it again.", event="error")
+
+        # Signal end of stream
+        yield encode_sse("[DONE]", event="done")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if replayed:
+        headers["Idempotency-Replayed"] = "true"
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
 
 @app.post("/ai-chat")
 async def ai_chat_stream(request: Request, chat: ChatRequest):
@@ -559,7 +803,12 @@ async def ai_chat_stream(request: Request, chat: ChatRequest):
     Streamed chat endpoint using Server-Sent Events (SSE).
     This proxies Ollama's streaming output and sends token/chunk updates
     to the client as SSE `data:` events (one event per chunk).
+
+    With an Idempotency-Key header (or client_message_id), a retry replays
+    the tokens generated so far and then follows the original generation.
     """
+
+    reserved = None  # Generation claimed for this request, until it is launched
     try:
         # Security & validation (reuse existing checks)
         client_ip = get_client_ip(request)
@@ -572,101 +821,543 @@ async def ai_chat_stream(request: Request, chat: ChatRequest):
             return error_handler.validation_error(validation_error)
 
         clean_message = input_validator.sanitize_message(chat.message)
+        chat.institute = trusted_institute(request.headers, chat.institute)
 
-        session_id = chat.session_id or conversation_manager.create_session()
-        if session_id:
-            is_valid_session, session_error = input_validator.validate_session_id(session_id)
+        if chat.session_id:
+            is_valid_session, session_error = input_validator.validate_session_id(chat.session_id)
             if not is_valid_session:
                 return error_handler.validation_error(session_error)
 
-        # Build enhanced prompt
-        enhanced_prompt = create_enhanced_prompt(session_id, clean_message)
-        conversation_manager.add_message(session_id, "user", clean_message)
-
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": "gemma3:latest",
-            "prompt": enhanced_prompt,
-            "stream": True,
-            "options": TherapyAssistant.OLLAMA_PARAMETERS
-        }
+        # A retry follows the generation that is already running (or replays it).
+        # Claimed before any await, so a concurrent duplicate finds this one
+        scoped_key, key_error = get_idempotency_key(request, chat)
+        if key_error:
+            return error_handler.validation_error(key_error)
+        generation, is_new, key_error = claim_generation(scoped_key, clean_message)
+        if key_error:
+            return error_handler.validation_error(key_error)
+        if not is_new:
+            return sse_chat_response(generation, replayed=True)
+        reserved = generation
+
+        is_crisis = TherapyAssistant.detect_crisis(clean_message)
+        if is_crisis:
+            stats_registry.record_crisis()
 
-        def event_stream():
-            # Try the streaming request
-            try:
-                with requests.post(ollama_url, json=payload, stream=True, timeout=120) as resp:
-                    resp.raise_for_status()
-                    for raw_line in resp.iter_lines(decode_unicode=True):
-                        if not raw_line:
-                            continue
-                        # Try parse JSON
-                        text_piece = None
-                        try:
-                            chunk = json.loads(raw_line)
-                        except Exception:
-                            text_piece = raw_line
-
-                        if text_piece is None:
-                            # Extract common fields
-                            if isinstance(chunk, dict):
-                                if 'response' in chunk and isinstance(chunk['response'], str):
-                                    text_piece = chunk['response']
-                                elif 'content' in chunk and isinstance(chunk['content'], str):
-                                    text_piece = chunk['content']
-                                elif 'delta' in chunk:
-                                    delta = chunk['delta']
-                                    if isinstance(delta, str):
-                                        text_piece = delta
-                                    elif isinstance(delta, dict):
-                                        text_piece = delta.get('content') or delta.get('response')
-
-                        if not text_piece:
-                            continue
-
-                        # Yield as SSE data field (client will receive incrementally)
-                        # Each chunk is sent as a single 'data:' event
-                        yield f"data: {text_piece}\n\n"
-
-            except requests.exceptions.RequestException as e:
-                # On error, send an SSE event with the error message
-                yield f"event: error\ndata: {str(e)}\n\n"
-
-            # Signal end of stream
-            yield "event: done\ndata: [DONE]\n\n"
-
-        # Return StreamingResponse with correct SSE media type
-        return StreamingResponse(event_stream(), media_type="text/event-stream")
+        session_id = chat.session_id or conversation_manager.create_session()
+        await load_archived_session(session_id)
+        conversation_manager.ensure_session(session_id)
+        note_session(session_id)
+        if is_crisis:
+            conversation_manager.flag_crisis(session_id)
+
+        # Store the message and build enhanced prompt (budget shrinks under load, except for crisis sessions)
+        budget = generation_controller.budget(crisis=conversation_manager.is_crisis_flagged(session_id))
+        history = conversation_manager.append_and_get_window(session_id, "user", clean_message,
+                                                             budget.history_messages, PROMPT_MAX_UNSUMMARIZED)
+        enhanced_prompt = create_enhanced_prompt(session_id, clean_message, history=history)
+        note_generation(prompt_chars=len(enhanced_prompt), history_messages=len(history or []))
+        record_message_analytics(chat, session_id, clean_message, is_crisis)
+        if is_crisis:
+            enqueue_crisis_alert(chat, session_id, clean_message, "/ai-chat")
+
+        # Generate in a background task that outlives this request (see idempotency.py)
+        idempotency_registry.launch(
+            generation, session_id,
+            lambda generation: stream_chat_reply(generation, enhanced_prompt, budget)
+        )
+        return sse_chat_response(generation)
 
     except Exception as e:
         return error_handler.server_error(f"Streaming chat failed: {str(e)}")
+    finally:
+        if reserved is not None:
+            idempotency_registry.abandon(reserved)
+
+# ===============================================================================
+# API ENDPOINTS - LIVE SESSION MONITORING
+# ===============================================================================
+# Counselors watch a session as it happens: stored messages, the reply's tokens
+# as the model produces them, and crisis flags. Events come from the broker in
+# pubsub.py, so any number of watchers share one generation (no extra model
+# calls) and nobody polls /conversation. Over SSE: GET /admin/sessions/{id}/live;
+# over /ws/chat: a "watch" frame (see below).
+#
+# Events: message {seq, role, content, timestamp}, token {text}, crisis,
+# caught_up {last_seq} (the snapshot is done, everything after it is live) and
+# dropped {count, last_seq} (the watcher fell behind and lost events; fetch
+# /conversation/{id}?since=last_seq to fill the gap).
+
+# Stored messages sent to a new watcher that doesn't say where it left off
+LIVE_SNAPSHOT_MESSAGES = 20
+
+
+async def follow_session(subscription: Subscription, since: Optional[int] = None):
+    """
+    Events of one session for a watcher: first the stored messages after
+    `since` (or the last few), then everything that happens live. Yields None
+    after HEARTBEAT_INTERVAL seconds of silence. Ends the subscription when
+    the watcher goes away.
+
+    Args:
+        subscription: From session_broker.subscribe()
+        since: Last message seq the watcher already has
+    """
+    session_id = subscription.session_id
+    try:
+        # An idle session may have been moved to the archive
+        await load_archived_session(session_id)
+        # Subscribed before reading the snapshot: a message stored in between
+        # shows up in both, and the live copy is skipped, so none is lost
+        if since is None:
+            snapshot = conversation_manager.get_history_page(session_id, limit=LIVE_SNAPSHOT_MESSAGES)
+        else:
+            snapshot = conversation_manager.get_history_page(session_id, since=since)
+        last_seq = since or 0
+        for message in snapshot:
+            last_seq = message["seq"]
+            yield {"type": "message", **message}
+        yield {"type": "caught_up", "last_seq": last_seq}
+        
+        while True:
+            event = await subscription.get(timeout=HEARTBEAT_INTERVAL)
+            if event is not None:
+                if event["type"] == "message":
+                    if event["seq"] <= last_seq:
+                        continue
+                    last_seq = event["seq"]
+                elif event["type"] == "dropped":
+                    event = {**event, "last_seq": last_seq}
+            yield event
+    finally:
+        session_broker.unsubscribe(subscription)
+
+@app.get("/admin/sessions/{session_id}/live")
+async def admin_session_live(session_id: str, request: Request, since: Optional[int] = None):
+    """
+    Watch a session live over SSE (admin/counselor only). Each event's name is
+    its type and its data the event as JSON (see the list above).
+    Pass since=<last seq you have> when reconnecting to get only what was missed.
+    """
+    require_admin(request)
+    is_valid, validation_error = input_validator.validate_session_id(session_id)
+    if not is_valid:
+        return error_handler.validation_error(validation_error)
+    if since is not None and since < 0:
+        return error_handler.validation_error("since must be >= 0")
+    try:
+        subscription = session_broker.subscribe(session_id)
+    except TooManySubscribersError as e:
+        return error_handler.validation_error(str(e))
+
+    async def event_stream():
+        async for event in follow_session(subscription, since):
+            yield HEARTBEAT_FRAME if event is None else encode_sse(json.dumps(event), event=event["type"])
+
+    # The stream ends the subscription itself; the background task covers a
+    # client that disconnects before the stream even started
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(session_broker.unsubscribe, subscription))
+
+# ===============================================================================
+# API ENDPOINTS - WEBSOCKET CHAT
+# ===============================================================================
+# One WebSocket connection carries every chat turn: authentication and session
+# binding happen once, tokens are pushed as frames, and a counselor can follow
+# several sessions over the same socket. All frames are JSON text.
+#
+# Client -> server:
+#   {"type": "hello", "session_id"?, "institute"?, "admin_key"? | "token"?}   (first frame)
+#   {"type": "bind", "session_id"?}                      add a session (counselors)
+#   {"type": "chat", "message", "session_id"?, "request_id"?}
+#                        (counselors can only chat in sessions they created;
+#                         sessions they bind by ID are watch-only)
+#   {"type": "cancel", "session_id"?}                    stop a running generation
+#   {"type": "watch", "session_id", "since"?}            follow a session live (counselors)
+#   {"type": "unwatch", "session_id"?}
+#   {"type": "ping"}
+# Server -> client:
+#   ready / bound, token, done, cancelled, error, pong
+#   watching / unwatched, live {"session_id", "event"} (events as in /admin/sessions/{id}/live)
+#   (chat frames default to the first bound session when session_id is omitted)
+
+# Sessions one connection may bind
+WS_MAX_SESSIONS = 1
+WS_MAX_SESSIONS_COUNSELOR = 50
+# Seconds a new connection has to send its hello frame
+WS_HELLO_TIMEOUT = 10
+
+
+class ChatSocket:
+    """State of one /ws/chat connection: its bound sessions and running generations."""
+    
+    def __init__(self, websocket: WebSocket, client_ip: str, is_counselor: bool, institute: Optional[str]):
+        self.websocket = websocket
+        self.client_ip = client_ip
+        self.is_counselor = is_counselor
+        self.institute = institute
+        self.max_sessions = WS_MAX_SESSIONS_COUNSELOR if is_counselor else WS_MAX_SESSIONS
+        # Bound session ID -> whether this connection may chat in it, in bind order
+        # (the first one is the default)
+        self.sessions: Dict[str, bool] = {}
+        # session_id -> (generation task, cancel event)
+        self.generations: Dict[str, tuple] = {}
+        # Watched session_id -> (forwarding task, broker subscription)
+        self.watches: Dict[str, tuple] = {}
+        # Frames from concurrent generations are sent one at a time
+        self._send_lock = asyncio.Lock()
+    
+    async def send(self, frame: dict):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(frame))
+    
+    async def send_error(self, message: str, error_type: str = "validation", **ids):
+        await self.send({"type": "error", "error_type": error_type, "message": message, **ids})
+    
+    async def bind(self, session_id: Optional[str]) -> tuple:
+        """
+        Validate and bind a session (created, or restored from the archive, if needed).
+        
+        Returns:
+            (session_id or None, error message or None)
+        """
+        if len(self.sessions) >= self.max_sessions:
+            return None, f"At most {self.max_sessions} session(s) per connection"
+        if session_id:
+            is_valid_session, session_error = input_validator.validate_session_id(session_id)
+            if not is_valid_session:
+                return None, session_error
+            await load_archived_session(session_id)
+            conversation_manager.ensure_session(session_id)
+            # A counselor binding a student's session must not write to it as the student
+            self.sessions[session_id] = not self.is_counselor
+        else:
+            session_id = conversation_manager.create_session()
+            self.sessions[session_id] = True
+        return session_id, None
+    
+    def session_frame(self, frame_type: str, session_id: str) -> dict:
+        return {
+            "type": frame_type,
+            "session_id": session_id,
+            "personality": conversation_manager.get_personality(session_id),
+            "message_count": conversation_manager.get_last_seq(session_id)
+        }
+    
+    async def start_turn(self, frame: dict):
+        """Validate a chat frame and start its generation in a task."""
+        session_id = frame.get("session_id") or next(iter(self.sessions))
+        request_id = frame.get("request_id")
+        ids = {"session_id": session_id, "request_id": request_id}
+        if session_id not in self.sessions:
+            return await self.send_error("Session is not bound to this connection", **ids)
+        if not self.sessions[session_id]:
+            return await self.send_error("Counselors can only watch sessions they did not start", **ids)
+        if session_id in self.generations:
+            return await self.send_error("A reply is still being generated for this session", **ids)
+        
+        # Per turn we only rate limit and validate the message; auth and session lookup are done
+        is_allowed, rate_error = rate_limiter.is_allowed(self.client_ip)
+        if not is_allowed:
+            return await self.send_error(rate_error, error_type="rate_limit", **ids)
+        message = frame.get("message")
+        is_valid, validation_error = input_validator.validate_message(message if isinstance(message, str) else "")
+        if not is_valid:
+            return await self.send_error(validation_error, **ids)
+        
+        chat = ChatRequest(message=message, session_id=session_id, institute=self.institute)
+        cancel_event = threading.Event()
+        task = asyncio.get_running_loop().create_task(self.run_turn(chat, request_id, cancel_event))
+        self.generations[session_id] = (task, cancel_event)
+    
+    async def run_turn(self, chat: ChatRequest, request_id: Optional[str], cancel_event: threading.Event):
+        """Generate one reply, pushing every piece to the client as a token frame."""
+        import requests
+
+        session_id = chat.session_id
+        ids = {"session_id": session_id, "request_id": request_id}
+        ai_parts = []
+        error = None  # (message, error_type) sent after the reply is stored
+        try:
+            # The connection can outlive ARCHIVE_IDLE_MINUTES, so the session may
+            # have been archived since it was bound: restore it like /chat does
+            await load_archived_session(session_id)
+            conversation_manager.ensure_session(session_id)
+            
+            clean_message = input_validator.sanitize_message(chat.message)
+            is_crisis = TherapyAssistant.detect_crisis(clean_message)
+            if is_crisis:
+                stats_registry.record_crisis()
+                conversation_manager.flag_crisis(session_id)
+            
+            budget = generation_controller.budget(crisis=conversation_manager.is_crisis_flagged(session_id))
+            history = conversation_manager.append_and_get_window(session_id, "user", clean_message,
+                                                                 budget.history_messages, PROMPT_MAX_UNSUMMARIZED)
+            if history is None:
+                # Removed again in between (e.g. archived): nothing was stored, don't answer without context
+                error = ("Session not found, please send your message again", "server")
+            else:
+                enhanced_prompt = create_enhanced_prompt(session_id, clean_message, history=history)
+                record_message_analytics(chat, session_id, clean_message, is_crisis)
+                if is_crisis:
+                    enqueue_crisis_alert(chat, session_id, clean_message, "/ws/chat")
+                
+                pieces = stream_text(enhanced_prompt, budget.options, cancel_event)
+                async for text_piece in generation_controller.track(pieces):
+                    ai_parts.append(text_piece)
+                    session_broker.publish(session_id, {"type": "token", "text": text_piece})
+                    try:
+                        await self.send({"type": "token", "text": text_piece, **ids})
+                    except (WebSocketDisconnect, RuntimeError, OSError):
+                        # The client left mid-turn: stop generating, but keep what was streamed
+                        cancel_event.set()
+                    if cancel_event.is_set():
+                        break
+        except (requests.exceptions.RequestException, ModelUnavailableError) as e:
+            print(f"AI model unavailable, sent the fallback reply: {e}")
+            error = (model_fallback_reply(), "model_unavailable")
+        except Exception as e:
+            error = (f"AI model request failed: {str(e)}", "server")
+        finally:
+            self.generations.pop(session_id, None)
+        
+        # Store what the student saw (the partial reply if cancelled) before sending
+        # anything else, so history stays consistent even if the client is gone
+        ai_response = "".join(ai_parts).strip()
+        if ai_response:
+            conversation_manager.add_message(session_id, "assistant", ai_response)
+            conversation_summarizer.schedule_if_needed(session_id)
+        try:
+            if error:
+                await self.send_error(error[0], error_type=error[1], **ids)
+            frame = self.session_frame("cancelled" if cancel_event.is_set() else "done", session_id)
+            await self.send({**frame, "request_id": request_id, "response": ai_response})
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            pass  # Connection closed; the reply is already stored
+    
+    def watch(self, session_id, since=None) -> Optional[str]:
+        """
+        Start forwarding a session's live events to this connection (counselors only).
+        
+        Returns:
+            An error message, or None if watching started
+        """
+        if not self.is_counselor:
+            return "Only counselors can watch sessions"
+        if not isinstance(session_id, str):
+            return "session_id is required"
+        is_valid_session, session_error = input_validator.validate_session_id(session_id)
+        if not is_valid_session:
+            return session_error
+        if since is not None and (not isinstance(since, int) or since < 0):
+            return "since must be an integer >= 0"
+        if session_id in self.watches:
+            return "Already watching this session"
+        if len(self.watches) >= self.max_sessions:
+            return f"At most {self.max_sessions} watched session(s) per connection"
+        try:
+            subscription = session_broker.subscribe(session_id)
+        except TooManySubscribersError as e:
+            return str(e)
+        task = asyncio.get_running_loop().create_task(self.forward_live(subscription, since))
+        self.watches[session_id] = (task, subscription)
+        return None
+    
+    async def forward_live(self, subscription: Subscription, since: Optional[int]):
+        """Send a watched session's events as live frames until unwatched or disconnected."""
+        session_id = subscription.session_id
+        try:
+            async for event in follow_session(subscription, since):
+                # The socket has its own ping frames; no heartbeats needed
+                if event is not None:
+                    await self.send({"type": "live", "session_id": session_id, "event": event})
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Connection closed; the receive loop cleans up
+    
+    def unwatch(self, session_id: Optional[str] = None) -> bool:
+        """Stop watching one session (or all of them)."""
+        targets = [session_id] if session_id else list(self.watches)
+        stopped = False
+        for target in targets:
+            watch = self.watches.pop(target, None)
+            if watch:
+                watch[0].cancel()
+                # The task may be cancelled before it ever ran
+                session_broker.unsubscribe(watch[1])
+                stopped = True
+        return stopped
+    
+    def cancel(self, session_id: Optional[str] = None) -> bool:
+        """Stop the running generation of one session (or of all sessions)."""
+        targets = [session_id] if session_id else list(self.generations)
+        cancelled = False
+        for target in targets:
+            generation = self.generations.get(target)
+            if generation:
+                generation[1].set()
+                cancelled = True
+        return cancelled
+
+
+def authorize_websocket(websocket: WebSocket, hello: dict) -> bool:
+    """Counselor/admin check using the handshake headers or the hello frame's credentials."""
+    is_allowed, _ = admin_auth.authorize(websocket.headers)
+    if is_allowed:
+        return True
+    headers = {}
+    if isinstance(hello.get("admin_key"), str):
+        headers["x-admin-key"] = hello["admin_key"]
+    if isinstance(hello.get("token"), str):
+        headers["authorization"] = f"Bearer {hello['token']}"
+    if not headers:
+        return False
+    is_allowed, _ = admin_auth.authorize(headers)
+    return is_allowed
+
+
+@app.websocket("/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    """
+    Chat over a single WebSocket connection (see the protocol above).
+    Compared to /ai-chat there is no per-turn HTTP request, CORS preflight or
+    session lookup: only rate limiting and message validation run per turn.
+    """
+    await websocket.accept()
+    client_ip = websocket.client.host if websocket.client else "unknown"
+    try:
+        hello = json.loads(await asyncio.wait_for(websocket.receive_text(), timeout=WS_HELLO_TIMEOUT))
+    except (asyncio.TimeoutError, ValueError):
+        await websocket.close(code=1008, reason="Expected a hello frame")
+        return
+    except WebSocketDisconnect:
+        return
+    if not isinstance(hello, dict) or hello.get("type") != "hello":
+        await websocket.close(code=1008, reason="Expected a hello frame")
+        return
+    
+    is_counselor = authorize_websocket(websocket, hello)
+    # The hello frame's token stands in for headers browsers can't set on a WebSocket
+    token = hello.get("token")
+    claim_headers = {"authorization": f"Bearer {token}"} if isinstance(token, str) else websocket.headers
+    institute = trusted_institute(claim_headers, hello.get("institute"))
+    socket = ChatSocket(websocket, client_ip, is_counselor, institute)
+    session_id, bind_error = await socket.bind(hello.get("session_id"))
+    if bind_error:
+        await websocket.close(code=1008, reason=bind_error)
+        return
+    await socket.send({**socket.session_frame("ready", session_id),
+                       "counselor": is_counselor, "max_sessions": socket.max_sessions})
+    
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except ValueError:
+                await socket.send_error("Frames must be JSON")
+                continue
+            if not isinstance(frame, dict):
+                await socket.send_error("Frames must be JSON objects")
+                continue
+            frame_type = frame.get("type")
+            
+            if frame_type == "chat":
+                await socket.start_turn(frame)
+            elif frame_type == "cancel":
+                if not socket.cancel(frame.get("session_id")):
+                    await socket.send_error("Nothing to cancel", session_id=frame.get("session_id"))
+            elif frame_type == "bind":
+                bound_id, bind_error = await socket.bind(frame.get("session_id"))
+                if bind_error:
+                    await socket.send_error(bind_error, session_id=frame.get("session_id"))
+                else:
+                    await socket.send(socket.session_frame("bound", bound_id))
+            elif frame_type == "watch":
+                watch_error = socket.watch(frame.get("session_id"), frame.get("since"))
+                if watch_error:
+                    await socket.send_error(watch_error, session_id=frame.get("session_id"))
+                else:
+                    await socket.send({"type": "watching", "session_id": frame["session_id"]})
+            elif frame_type == "unwatch":
+                if not socket.unwatch(frame.get("session_id")):
+                    await socket.send_error("Not watching that session", session_id=frame.get("session_id"))
+                else:
+                    await socket.send({"type": "unwatched", "session_id": frame.get("session_id")})
+            elif frame_type == "ping":
+                await socket.send({"type": "pong"})
+            else:
+                await socket.send_error(f"Unknown frame type: {frame_type}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # The client is gone: stop generating replies nobody will read
+        socket.cancel()
+        socket.unwatch()
 
 # ===============================================================================
 # API ENDPOINTS - CONVERSATION HISTORY
 # ===============================================================================
 @app.get("/conversation/{session_id}")
-async def get_conversation(session_id: str):
+async def get_conversation(session_id: str, request: Request, response: Response,
+                           limit: Optional[int] = None, before: Optional[int] = None,
+                           since: Optional[int] = None):
     """
-    Retrieve the full conversation history for a specific session.
+    Retrieve the conversation history for a specific session.
     Useful for debugging or displaying chat history.
+    
+    Query parameters (all optional; without them the full history is returned):
+    - limit: Maximum number of messages to return (1-200)
+    - before: Page backwards - only messages with seq < before (use next_before from the previous page)
+    - since: Delta sync - only messages with seq > since (use last_seq from the previous poll)
+    
+    Responses carry an ETag. Sending it back in If-None-Match returns 304 Not Modified
+    when no messages were added and the personality hasn't changed.
     """
     try:
         # Validate session ID format
         is_valid, validation_error = input_validator.validate_session_id(session_id)
         if not is_valid:
             return error_handler.validation_error(validation_error)
+        if limit is not None and not 1 <= limit <= 200:
+            return error_handler.validation_error("limit must be between 1 and 200")
+        if (before is not None and before < 1) or (since is not None and since < 0):
+            return error_handler.validation_error("before must be >= 1 and since must be >= 0")
+        # An idle session may have been moved to the archive
+        await load_archived_session(session_id)
+        
+        # The version of a conversation is its newest seq plus its personality,
+        # so checking for changes is O(1) whatever the history length. Each page
+        # is a different representation, so the page parameters are part of its ETag
+        last_seq = conversation_manager.get_last_seq(session_id)
+        personality = conversation_manager.get_personality(session_id) or TherapyAssistant.CURRENT_PERSONALITY
+        paginated = limit is not None or before is not None or since is not None
+        page = f"-l{limit}-b{before}-s{since}" if paginated else ""
+        etag = f'W/"{last_seq}-{personality}{page}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
         
         # Get conversation data
-        history = conversation_manager.get_conversation_history(session_id)
         session_info = conversation_manager.get_session_info(session_id)
+        if paginated:
+            history = conversation_manager.get_history_page(session_id, limit=limit, before=before, since=since)
+        else:
+            history = conversation_manager.get_conversation_history(session_id)
         
-        return {
+        response.headers["ETag"] = etag
+        result = {
             "session_id": session_id,
             "exists": session_info["exists"],
             "message_count": session_info["message_count"],
             "conversation": history,
-            "personality": TherapyAssistant.CURRENT_PERSONALITY,
+            "personality": personality,
+            "last_seq": last_seq,
             "status": "success"
         }
+        if paginated:
+            first_seq = history[0]["seq"] if history else None
+            # Cursor for the next (older) page, or None once the start is reached
+            result["next_before"] = first_seq if first_seq and first_seq > 1 and since is None else None
+        return result
     except Exception as e:
         return error_handler.server_error(f"Failed to retrieve conversation: {str(e)}")
 
@@ -674,27 +1365,48 @@ async def get_conversation(session_id: str):
 # API ENDPOINTS - PERSONALITY MANAGEMENT
 # ===============================================================================
 @app.get("/personality")
-async def get_current_personality():
+async def get_current_personality(request: Request):
     """Get information about the current therapy assistant configuration and available therapeutic approaches."""
-    return {
-        "current_personality": TherapyAssistant.CURRENT_PERSONALITY,
+    current = TherapyAssistant.CURRENT_PERSONALITY
+    # Serialized once per default personality; a POST /personality switches to another cache key
+    payload = response_cache.get_or_build(("personality", current), lambda: {
+        "current_personality": current,
         "available_personalities": list(TherapyAssistant.THERAPY_PERSONALITIES.keys()),
-        "description": TherapyAssistant.THERAPY_PERSONALITIES[TherapyAssistant.CURRENT_PERSONALITY],
+        "description": TherapyAssistant.THERAPY_PERSONALITIES[current],
         "therapeutic_focus": "College student mental health support and professional referrals",
         "status": "success"
-    }
+    })
+    # no-cache: clients may keep it but must revalidate (cheap 304) since the default can change
+    return cached_json_response(request, payload, cache_control="no-cache")
 
 @app.post("/personality")
 async def update_personality(request: PersonalityUpdateRequest):
     """
-    Change the therapy assistant's therapeutic approach. This affects the default approach for new conversations.
-    The system still dynamically selects the most appropriate approach based on message content.
+    Change the therapy assistant's therapeutic approach.
+    With a session_id, only that conversation switches approach. Without one, this changes
+    the default approach for new conversations (which may still pick CBT for academic stress).
     """
     try:
         if request.personality not in TherapyAssistant.THERAPY_PERSONALITIES:
             available = list(TherapyAssistant.THERAPY_PERSONALITIES.keys())
             return error_handler.validation_error(f"Invalid therapeutic approach. Available options: {available}")
         
+        if request.session_id:
+            is_valid_session, session_error = input_validator.validate_session_id(request.session_id)
+            if not is_valid_session:
+                return error_handler.validation_error(session_error)
+            await load_archived_session(request.session_id)
+            old_personality = conversation_manager.get_personality(request.session_id) or TherapyAssistant.CURRENT_PERSONALITY
+            if not conversation_manager.set_personality(request.session_id, request.personality):
+                return error_handler.session_error("Session not found")
+            return {
+                "message": f"Therapeutic approach for this session updated from '{old_personality}' to '{request.personality}'",
+                "session_id": request.session_id,
+                "new_personality": request.personality,
+                "description": TherapyAssistant.THERAPY_PERSONALITIES[request.personality],
+                "status": "success"
+            }
+        
         old_personality = TherapyAssistant.CURRENT_PERSONALITY
         TherapyAssistant.CURRENT_PERSONALITY = request.personality
         
@@ -708,6 +1420,21 @@ async def update_personality(request: PersonalityUpdateRequest):
     except Exception as e:
         return error_handler.server_error(f"Failed to update therapeutic approach: {str(e)}")
 
+@app.post("/personality/reload")
+async def reload_personality_templates(request: Request):
+    """Reload the personality prompt files from prompts/ without restarting the server (admin only)."""
+    require_admin(request, allowed_roles=("admin",))
+    try:
+        version = prompt_registry.load()
+        return {
+            "message": "Personality prompt templates reloaded",
+            "version": version,
+            "personalities": list(prompt_registry.prefixes.keys()),
+            "status": "success"
+        }
+    except Exception as e:
+        return error_handler.server_error(f"Failed to reload prompt templates: {str(e)}")
+
 # ===============================================================================
 # API ENDPOINTS - SYSTEM STATUS
 # ===============================================================================
@@ -715,10 +1442,9 @@ async def update_personality(request: PersonalityUpdateRequest):
 async def system_status():
     """Get overall system status and statistics."""
     try:
-        all_sessions = conversation_manager.list_all_sessions()
         return {
             "status": "running",
-            "active_sessions": len(all_sessions),
+            "active_sessions": stats_registry.active_sessions,
             "current_personality": TherapyAssistant.CURRENT_PERSONALITY,
             "therapeutic_focus": "College student mental health support",
             "crisis_detection": "Enabled with automatic referral suggestions",
@@ -732,6 +1458,286 @@ async def system_status():
     except Exception as e:
         return error_handler.server_error(f"Failed to get system status: {str(e)}")
 
+@app.get("/admin/stats")
+async def admin_stats(request: Request):
+    """
+    Live counters for the admin analytics dashboard (admin/counselor only).
+    Read in constant time from the stats registry, however many sessions exist.
+    """
+    require_admin(request)
+    return {
+        **stats_registry.snapshot(),
+        "alerts": alert_pipeline.status(),
+        "idempotency": idempotency_registry.status(),
+        "generation_budget": generation_controller.status(),
+        "risk_classifier": risk_classifier.status(),
+        "traffic_capture": traffic_recorder.status(),
+        "live_monitoring": session_broker.status(),
+        "status": "success"
+    }
+
+@app.get("/admin/analytics/rollups")
+async def admin_analytics_rollups(request: Request, resolution: str = "hour", since: Optional[str] = None,
+                                  until: Optional[str] = None, institute: Optional[str] = None,
+                                  personality: Optional[str] = None, group_by: Optional[str] = None):
+    """
+    Message, crisis and academic stress counts per time bucket (admin/counselor only).
+    Answered from fixed-size rollups (see analytics.py), not by rescanning history.
+    
+    Query parameters (all optional):
+    - resolution: "minute" (last 24h), "hour" (last 14 days) or "day" (last year); default "hour"
+    - since / until: ISO times; default is the last 24 buckets
+    - institute / personality: only count this institute or personality
+    - group_by: "institute" or "personality" to split each bucket
+    """
+    require_admin(request)
+    try:
+        ring = analytics_rollups.rings.get(resolution)
+        if ring is None:
+            return error_handler.validation_error(f"resolution must be one of: {', '.join(analytics_rollups.rings)}")
+        try:
+            end = datetime.fromisoformat(until).timestamp() if until else time.time()
+            start = datetime.fromisoformat(since).timestamp() if since else end - 24 * ring.width
+        except ValueError:
+            return error_handler.validation_error("since and until must be ISO 8601 times")
+        if start >= end:
+            return error_handler.validation_error("since must be before until")
+        
+        buckets = analytics_rollups.query(resolution, start, end, institute=institute,
+                                          personality=personality, group_by=group_by)
+        return {
+            "resolution": resolution,
+            "since": datetime.fromtimestamp(start).isoformat(),
+            "until": datetime.fromtimestamp(end).isoformat(),
+            "buckets": buckets,
+            "status": "success"
+        }
+    except ValueError as e:
+        return error_handler.validation_error(str(e))
+    except Exception as e:
+        return error_handler.server_error(f"Failed to get analytics: {str(e)}")
+
+@app.get("/admin/search")
+async def admin_search(request: Request, q: str, limit: int = 20):
+    """
+    Find sessions that mention a topic, e.g. "panic attack" or a course code
+    (admin/counselor only). Uses the inverted index, so it never scans conversations.
+    
+    Query parameters:
+    - q: Search text; sessions must contain every word
+    - limit: Maximum number of sessions (1-100, default 20)
+    
+    Returns ranked session IDs, each with a snippet of its best matching message.
+    Archived sessions are found too; their snippets are read from the archive file.
+    """
+    require_admin(request)
+    if not 1 <= len(q) <= 200:
+        return error_handler.validation_error("q must be 1-200 characters")
+    if not 1 <= limit <= 100:
+        return error_handler.validation_error("limit must be between 1 and 100")
+    try:
+        start = time.perf_counter()
+        hits = search_index.search(q, limit=limit)
+        terms = tokenize(q)
+        results = []
+        loop = asyncio.get_event_loop()
+        for session_id, score, matches, seq in hits:
+            snippet = None
+            archived = session_id not in conversation_manager
+            if archived:
+                # Evicted to the archive: its postings stay, the text is on disk
+                header, record = await loop.run_in_executor(
+                    None, conversation_archiver.read_message, session_id, seq
+                )
+                crisis = bool(header and header.get("crisis"))
+                if record is not None:
+                    snippet = {
+                        "seq": seq,
+                        "role": record["role"],
+                        "text": make_snippet(record["content"], terms),
+                        "timestamp": record["timestamp"]
+                    }
+            else:
+                crisis = conversation_manager.is_crisis_flagged(session_id)
+                message = conversation_manager.get_message(session_id, seq) if seq else None
+                if message is not None:
+                    snippet = {
+                        "seq": seq,
+                        "role": message.role,
+                        "text": make_snippet(message.content, terms),
+                        "timestamp": message.timestamp.isoformat()
+                    }
+            results.append({
+                "session_id": session_id,
+                "score": score,
+                "matches": matches,
+                "crisis": crisis,
+                "archived": archived,
+                "snippet": snippet
+            })
+        return {
+            "query": q,
+            "terms": list(dict.fromkeys(terms)),
+            "results": results,
+            "took_ms": round((time.perf_counter() - start) * 1000, 3),
+            "index": search_index.stats(),
+            "status": "success"
+        }
+    except Exception as e:
+        return error_handler.server_error(f"Search failed: {str(e)}")
+
+@app.get("/admin/export")
+async def admin_export(request: Request, since: Optional[str] = None, until: Optional[str] = None,
+                       crisis_only: bool = False, compress: bool = True):
+    """
+    Download every conversation (in memory and archived) as NDJSON (admin/counselor only).
+    The export is streamed and gzip-compressed on the fly, so memory use stays
+    the same however many sessions there are. See archive.py for the record format.
+    
+    Query parameters (all optional):
+    - since / until: ISO times; only messages with since <= timestamp < until
+    - crisis_only: only sessions flagged for crisis indicators
+    - compress: gzip the output (default true)
+    """
+    require_admin(request)
+    try:
+        since_time = parse_time(since)
+        until_time = parse_time(until)
+    except ValueError:
+        return error_handler.validation_error("since and until must be ISO 8601 times")
+    
+    filename = f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson" + (".gz" if compress else "")
+    return StreamingResponse(
+        conversation_archiver.export(since_time, until_time, crisis_only, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/admin/archive/run")
+async def admin_archive_run(request: Request, idle_minutes: Optional[int] = None):
+    """
+    Archive cold sessions right now instead of waiting for the next pass (admin only).
+    """
+    require_admin(request, allowed_roles=("admin",))
+    if idle_minutes is not None and idle_minutes < 0:
+        return error_handler.validation_error("idle_minutes must be >= 0")
+    try:
+        archived = await conversation_archiver.archive_cold_sessions(idle_minutes)
+        return {
+            "archived": archived,
+            "active_sessions": stats_registry.active_sessions,
+            "archive": conversation_archiver.status(),
+            "status": "success"
+        }
+    except Exception as e:
+        return error_handler.server_error(f"Archive run failed: {str(e)}")
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 5.0, interval_ms: float = 10.0,
+                        output: str = "collapsed", idle: bool = False, limit: int = 30):
+    """
+    Sample every thread's stack for `seconds` and show where the time went (admin only).
+    output=collapsed returns collapsed stacks as text, ready for flamegraph.pl or
+    speedscope.app; output=json returns the hottest functions and stacks.
+    Set idle=true to keep threads that are only waiting (e.g. the event loop in select).
+    """
+    require_admin(request, allowed_roles=("admin",))
+    if not 0 < seconds <= sampling_profiler.max_seconds:
+        return error_handler.validation_error(f"seconds must be between 0 and {sampling_profiler.max_seconds:g}")
+    if not 1 <= interval_ms <= 1000:
+        return error_handler.validation_error("interval_ms must be between 1 and 1000")
+    if output not in ("collapsed", "json"):
+        return error_handler.validation_error("output must be 'collapsed' or 'json'")
+    if not 1 <= limit <= 500:
+        return error_handler.validation_error("limit must be between 1 and 500")
+    try:
+        result = await sampling_profiler.profile(seconds, interval_ms / 1000, include_idle=idle)
+    except ProfilerBusyError as e:
+        return error_handler.validation_error(str(e))
+    except Exception as e:
+        return error_handler.server_error(f"Profiling failed: {str(e)}")
+
+    stacks = result.pop("stacks")
+    if output == "collapsed":
+        return PlainTextResponse(collapse_stacks(stacks), headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Overhead-Pct": str(result["overhead_pct"])
+        })
+    return {
+        **result,
+        "interval_ms": interval_ms,
+        "top_functions": top_functions(stacks, limit),
+        "top_stacks": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(limit)],
+        "status": "success"
+    }
+
+@app.get("/admin/memory")
+async def admin_memory(request: Request):
+    """
+    Memory held by the process and by each in-memory structure (admin only):
+    sessions, rate limiter keys, pending background tasks and caches.
+    """
+    require_admin(request, allowed_roles=("admin",))
+    try:
+        # Walking every session and counting objects takes a while: keep it off the event loop
+        loop = asyncio.get_event_loop()
+        sessions = await loop.run_in_executor(None, conversation_manager.memory_usage)
+        process = await loop.run_in_executor(None, process_memory)
+        return {
+            "process": process,
+            "sessions": sessions,
+            "rate_limiter": rate_limiter.memory_usage(),
+            "background_tasks": pending_tasks(),
+            "idempotency": idempotency_registry.status(),
+            "search_index": search_index.stats(),
+            "alerts": alert_pipeline.status(),
+            "tracemalloc": memory_tracer.status(),
+            "status": "success"
+        }
+    except Exception as e:
+        return error_handler.server_error(f"Memory report failed: {str(e)}")
+
+@app.post("/admin/memory/trace/start")
+async def admin_memory_trace_start(request: Request, frames: int = 1):
+    """
+    Start tracing allocations with tracemalloc and take a baseline snapshot (admin only).
+    Every allocation is slower while tracing is on: stop it when done.
+    """
+    require_admin(request, allowed_roles=("admin",))
+    if not 1 <= frames <= 25:
+        return error_handler.validation_error("frames must be between 1 and 25")
+    loop = asyncio.get_event_loop()
+    started = await loop.run_in_executor(None, memory_tracer.start, frames)
+    return {"started": started, "tracemalloc": memory_tracer.status(), "status": "success"}
+
+@app.get("/admin/memory/trace/diff")
+async def admin_memory_trace_diff(request: Request, limit: int = 20, group_by: str = "lineno", reset: bool = True):
+    """
+    Allocations that grew since the last snapshot, largest first (admin only).
+    With reset=true (the default) this snapshot becomes the baseline, so
+    calling it every few minutes shows what keeps growing.
+    """
+    require_admin(request, allowed_roles=("admin",))
+    if not 1 <= limit <= 200:
+        return error_handler.validation_error("limit must be between 1 and 200")
+    if group_by not in memory_tracer.GROUP_BY:
+        return error_handler.validation_error(f"group_by must be one of: {', '.join(memory_tracer.GROUP_BY)}")
+    try:
+        loop = asyncio.get_event_loop()
+        diff = await loop.run_in_executor(None, memory_tracer.diff, limit, group_by, reset)
+    except Exception as e:
+        return error_handler.server_error(f"Memory diff failed: {str(e)}")
+    if diff is None:
+        return error_handler.validation_error("Memory tracing is off (POST /admin/memory/trace/start first)")
+    return {**diff, "status": "success"}
+
+@app.post("/admin/memory/trace/stop")
+async def admin_memory_trace_stop(request: Request):
+    """Stop tracing allocations (admin only)."""
+    require_admin(request, allowed_roles=("admin",))
+    stopped = memory_tracer.stop()
+    return {"stopped": stopped, "tracemalloc": memory_tracer.status(), "status": "success"}
+
 # ===============================================================================
 # API ENDPOINTS - THERAPY-SPECIFIC FEATURES
 # ===============================================================================
@@ -740,15 +1746,27 @@ async def crisis_check(request: CrisisCheckRequest):
     """
     Check if a message contains crisis indicators for immediate intervention.
     This endpoint can be used for pre-screening or admin monitoring.
+
+    Combines the keyword check with the risk classifier (risk_classifier.py),
+    which also catches paraphrases. risk_score is a calibrated probability
+    (null if the classifier is unavailable).
     """
     try:
-        is_crisis = TherapyAssistant.detect_crisis(request.message)
+        keyword_match = TherapyAssistant.detect_crisis(request.message)
+        # Scored in a worker thread, batched with concurrent checks
+        risk_score = await risk_classifier.score(request.message)
+        is_crisis = keyword_match or (risk_score is not None and risk_score >= HIGH_RISK)
+        if is_crisis:
+            stats_registry.record_crisis()
         is_academic_stress = TherapyAssistant.detect_academic_stress(request.message)
         recommended_approach = TherapyAssistant.get_appropriate_personality(request.message)
         
         return {
             "message": request.message[:100] + "..." if len(request.message) > 100 else request.message,
             "crisis_detected": is_crisis,
+            "keyword_match": keyword_match,
+            "risk_score": risk_score,
+            "risk_level": risk_level(risk_score),
             "academic_stress_detected": is_academic_stress,
             "recommended_approach": recommended_approach,
             "urgent_referral_needed": is_crisis,
@@ -757,45 +1775,50 @@ async def crisis_check(request: CrisisCheckRequest):
     except Exception as e:
         return error_handler.server_error(f"Failed to perform crisis check: {str(e)}")
 
+# Mental health resources and emergency contacts for college students.
+# Never changes at runtime, so it is serialized and compressed only once.
+MENTAL_HEALTH_RESOURCES = {
+    "emergency_contacts": {
+        "national_suicide_prevention_lifeline": "988",
+        "crisis_text_line": "Text HOME to 741741",
+        "emergency_services": "911"
+    },
+    "college_resources": {
+        "counseling_center": "Contact your college counseling center during business hours",
+        "student_health_center": "Many colleges offer mental health services through student health",
+        "resident_advisor": "RAs are trained to help connect students with resources",
+        "academic_advisor": "Can help with academic stress and accommodations"
+    },
+    "online_resources": {
+        "mental_health_america": "https://www.mhanational.org/",
+        "nami_college_resources": "https://www.nami.org/Your-Journey/Kids-Teens-and-Young-Adults/College-Students",
+        "crisis_chat": "https://suicidepreventionlifeline.org/chat/"
+    },
+    "self_care_tips": [
+        "Maintain regular sleep schedule (7-9 hours)",
+        "Practice deep breathing exercises",
+        "Stay connected with friends and family",
+        "Engage in regular physical activity",
+        "Limit caffeine and alcohol",
+        "Take breaks from social media",
+        "Practice mindfulness or meditation"
+    ],
+    "when_to_seek_help": [
+        "Persistent feelings of sadness or hopelessness",
+        "Difficulty concentrating on academics",
+        "Changes in sleep or eating patterns",
+        "Increased irritability or anxiety",
+        "Thoughts of self-harm or suicide",
+        "Substance use as coping mechanism",
+        "Social isolation lasting more than a few days"
+    ],
+    "status": "success"
+}
+
 @app.get("/resources")
-async def get_mental_health_resources():
+async def get_mental_health_resources(request: Request):
     """
     Provide mental health resources and emergency contacts for college students.
     """
-    return {
-        "emergency_contacts": {
-            "national_suicide_prevention_lifeline": "988",
-            "crisis_text_line": "Text HOME to 741741",
-            "emergency_services": "911"
-        },
-        "college_resources": {
-            "counseling_center": "Contact your college counseling center during business hours",
-            "student_health_center": "Many colleges offer mental health services through student health",
-            "resident_advisor": "RAs are trained to help connect students with resources",
-            "academic_advisor": "Can help with academic stress and accommodations"
-        },
-        "online_resources": {
-            "mental_health_america": "https://www.mhanational.org/",
-            "nami_college_resources": "https://www.nami.org/Your-Journey/Kids-Teens-and-Young-Adults/College-Students",
-            "crisis_chat": "https://suicidepreventionlifeline.org/chat/"
-        },
-        "self_care_tips": [
-            "Maintain regular sleep schedule (7-9 hours)",
-            "Practice deep breathing exercises",
-            "Stay connected with friends and family",
-            "Engage in regular physical activity",
-            "Limit caffeine and alcohol",
-            "Take breaks from social media",
-            "Practice mindfulness or meditation"
-        ],
-        "when_to_seek_help": [
-            "Persistent feelings of sadness or hopelessness",
-            "Difficulty concentrating on academics",
-            "Changes in sleep or eating patterns",
-            "Increased irritability or anxiety",
-            "Thoughts of self-harm or suicide",
-            "Substance use as coping mechanism",
-            "Social isolation lasting more than a few days"
-        ],
-        "status": "success"
-    }
+    payload = response_cache.get_or_build("resources", lambda: MENTAL_HEALTH_RESOURCES)
+    return cached_json_response(request, payload, cache_control="public, max-age=3600")
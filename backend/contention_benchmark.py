@@ -0,0 +1,180 @@
+# ===============================================================================
+# CONTENTION_BENCHMARK.PY - SESSION STORE UNDER MANY THREADS
+# ===============================================================================
+# This file measures how the ConversationManager holds up when many threads
+# (threadpool endpoints, summary jobs, the archiver) use it at the same time:
+# - Each thread picks random sessions and either stores a message with
+#   append_and_get_window (as the chat endpoints do) or reads the prompt
+#   window with get_recent_history
+# - The same load runs against a store with a single shard (one global lock)
+#   and against the sharded store, and reports throughput and p99 latency
+# - Afterwards every session is checked: sequence numbers must be 1..N with no
+#   gaps or duplicates, and no message may be lost
+#
+# Each store runs several times (alternating) and the medians are compared.
+# The script exits with code 1 if a consistency check fails or if the sharded
+# store's p99 latency is over budget; the throughput ratio is only reported,
+# since on a small machine it is mostly noise. Python threads share one interpreter lock, so don't expect the
+# throughput to scale with the thread count; what sharding removes is threads
+# queueing on each other's lock while one of them is preempted inside it.
+# With many more threads than cores, p99 mostly measures the interpreter's
+# thread switch interval (5ms), not the store.
+#
+# Usage (from the backend folder):
+#   python contention_benchmark.py
+#   python contention_benchmark.py --threads 32 --sessions 1000 --seconds 5
+# ===============================================================================
+
+import argparse
+import contextlib
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from features import ConversationManager
+
+MESSAGES = [
+    "I have three exams next week and I can't focus on anything.",
+    "My roommate and I keep arguing about small things.",
+    "I slept maybe four hours last night, again.",
+    "Thanks, that breathing exercise actually helped a bit.",
+    "I don't know if I chose the right major.",
+]
+
+# ===============================================================================
+# LOAD
+# ===============================================================================
+
+def run_load(shard_count: int, threads: int, sessions: int, seconds: float,
+             write_ratio: float, window: int) -> Dict:
+    """
+    Hammer one ConversationManager from `threads` threads for `seconds` seconds.
+
+    Returns:
+        Dictionary with ops/sec, p99 latency (us), appends and consistency errors
+    """
+    manager = ConversationManager(shard_count=shard_count)
+    session_ids = [manager.create_session() for _ in range(sessions)]
+    for session_id in session_ids:
+        for i in range(window):
+            manager.add_message(session_id, "user" if i % 2 == 0 else "assistant", MESSAGES[i % len(MESSAGES)])
+
+    start_barrier = threading.Barrier(threads + 1)
+    stop = threading.Event()
+    latencies: List[List[float]] = [[] for _ in range(threads)]
+    appends = [0] * threads
+
+    def worker(index: int):
+        rng = random.Random(index)
+        timings = latencies[index]
+        start_barrier.wait()
+        while not stop.is_set():
+            session_id = rng.choice(session_ids)
+            began = time.perf_counter()
+            if rng.random() < write_ratio:
+                manager.append_and_get_window(session_id, "user", rng.choice(MESSAGES), window)
+                appends[index] += 1
+            else:
+                manager.get_recent_history(session_id, window)
+            timings.append(time.perf_counter() - began)
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    began = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    # Every append must have landed exactly once, in seq order
+    errors = 0
+    stored = 0
+    for session_id in session_ids:
+        messages = manager.get_messages(session_id) or []
+        stored += len(messages)
+        if [m.seq for m in messages] != list(range(1, len(messages) + 1)):
+            errors += 1
+    if stored != sessions * window + sum(appends):
+        errors += 1
+
+    all_latencies = sorted(t for timings in latencies for t in timings)
+    return {
+        "ops_per_sec": len(all_latencies) / elapsed,
+        "p99_us": all_latencies[int(len(all_latencies) * 0.99)] * 1e6 if all_latencies else 0.0,
+        "median_us": statistics.median(all_latencies) * 1e6 if all_latencies else 0.0,
+        "appends": sum(appends),
+        "errors": errors
+    }
+
+# ===============================================================================
+# MAIN
+# ===============================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Measure session store throughput under many threads")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent threads (default: 16)")
+    parser.add_argument("--sessions", type=int, default=500, help="Sessions to spread the load over")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Duration of each run")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per store (default: 3)")
+    parser.add_argument("--shards", type=int, default=16, help="Shards in the sharded store (default: 16)")
+    parser.add_argument("--write-ratio", type=float, default=0.3,
+                        help="Share of operations that store a message (default: 0.3)")
+    parser.add_argument("--window", type=int, default=6, help="History window read per operation")
+    parser.add_argument("--p99-budget-us", type=float, default=10000,
+                        help="Budget for the sharded store's p99 latency (default: 10000us)")
+    args = parser.parse_args(argv)
+
+    runs: Dict[int, List[Dict]] = {1: [], args.shards: []}
+    # add_message prints every message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(args.runs):
+            for shard_count in runs:
+                runs[shard_count].append(run_load(shard_count, args.threads, args.sessions, args.seconds,
+                                                  args.write_ratio, args.window))
+    results = {
+        shard_count: {
+            **{key: statistics.median(r[key] for r in store_runs)
+               for key in ("ops_per_sec", "median_us", "p99_us", "appends")},
+            "errors": sum(r["errors"] for r in store_runs)
+        }
+        for shard_count, store_runs in runs.items()
+    }
+
+    print(f"{args.threads} threads, {args.sessions} sessions, {args.write_ratio:.0%} writes "
+          f"(median of {args.runs} runs)\n")
+    print(f"{'store':<14} {'ops/sec':>10} {'median':>10} {'p99':>10} {'appends':>10}")
+    print("-" * 58)
+    for shard_count, result in results.items():
+        label = f"{shard_count} shard" + ("s" if shard_count != 1 else "")
+        print(f"{label:<14} {result['ops_per_sec']:>10.0f} {result['median_us']:>8.1f}us "
+              f"{result['p99_us']:>8.1f}us {result['appends']:>10.0f}")
+
+    single, sharded = results[1], results[args.shards]
+    print(f"\nsharded / single lock throughput: {sharded['ops_per_sec'] / single['ops_per_sec']:.2f}x")
+
+    failures = []
+    for shard_count, result in results.items():
+        if result["errors"]:
+            failures.append(f"{shard_count} shard(s): {result['errors']} consistency errors (lost or reordered messages)")
+    if sharded["p99_us"] > args.p99_budget_us:
+        failures.append(f"sharded p99 latency {sharded['p99_us']:.0f}us is over budget")
+
+    if failures:
+        print("\nCONTENTION REGRESSIONS:")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    print("\nSession store within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
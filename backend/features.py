@@ -1,8 +1,13 @@
 # Import necessary modules
-from typing import List, Dict, Optional  # For type hints to make code clearer
+from typing import List, Dict, Optional, Tuple, Callable  # For type hints to make code clearer
 from datetime import datetime  # To timestamp messages
+import sys  # To estimate memory use
 import uuid  # To generate unique session IDs
-from dataclasses import dataclass  # Makes creating simple classes easier
+from dataclasses import dataclass, field  # Makes creating simple classes easier
+from session_store import ShardedSessionStore, SessionShard  # Lock-striped storage for sessions
+from stats import stats_registry  # Running counters for /status and the admin dashboard
+from search_index import search_index  # Full-text search for the admin dashboard
+from pubsub import session_broker  # Live feed of session activity for counselors
 
 # This decorator automatically creates __init__, __repr__, and other methods
 @dataclass
@@ -14,6 +19,7 @@ class MessageData:
     role: str      # Either "user" or "assistant" - who sent the message
     content: str   # The actual message text
     timestamp: datetime  # When the message was created
+    seq: int = 0   # Position in the session, starting at 1 (used as a history cursor)
     
     # This method runs automatically when creating a new MessageData
     def __post_init__(self):
@@ -21,17 +27,63 @@ class MessageData:
         if not hasattr(self, 'timestamp') or self.timestamp is None:
             self.timestamp = datetime.now()
 
+@dataclass
+class ConversationSummary:
+    """
+    A rolling summary of the older part of a conversation.
+    It stands in for the messages that no longer fit in the prompt.
+    """
+    text: str              # The summary itself
+    covered_messages: int  # How many messages (from the start) the summary covers
+    updated: datetime      # When the summary was last refreshed
+
+@dataclass
+class SessionRecord:
+    """
+    Everything kept in memory for one session.
+    Only read or change it while holding its shard's lock (see session_store.py).
+    """
+    messages: List[MessageData] = field(default_factory=list)
+    last_activity: datetime = field(default_factory=datetime.now)
+    summary: Optional[ConversationSummary] = None   # Rolling summary of older messages
+    summary_in_progress: bool = False               # A summary is being generated right now
+    personality: Optional[str] = None               # Therapy personality (e.g. "CBT")
+    crisis: bool = False                            # A crisis indicator was detected
+
 class ConversationManager:
     """
     Manages all conversations in memory.
     Each conversation is identified by a unique session_id.
+    
+    Sessions live in a sharded store: every method locks only the shard of the
+    session it works on, so it is safe to call from any thread (threadpool
+    endpoints, summary jobs, the archiver) without serializing all sessions
+    behind one lock.
     """
     
-    def __init__(self):
-        # Dictionary to store all conversations
-        # Key: session_id (string), Value: list of MessageData objects
-        self.conversations: Dict[str, List[MessageData]] = {}
-        print("ConversationManager initialized - ready to store conversations!")
+    def __init__(self, shard_count: int = 16):
+        """
+        Args:
+            shard_count: Number of independently locked shards
+        """
+        # Key: session_id (string), Value: SessionRecord with its messages and state.
+        # Each shard keeps its sessions least recently active first, so cold
+        # sessions can be found without scanning everything.
+        self.store = ShardedSessionStore(shard_count)
+        # Optional hook that brings an archived session back into memory
+        # (set by the ConversationArchiver in archive.py)
+        self.session_loader: Optional[Callable[[str], bool]] = None
+    
+    def _touch(self, shard: SessionShard, session_id: str, record: SessionRecord):
+        """Marks a session as active right now (the shard lock must be held)."""
+        record.last_activity = datetime.now()
+        shard.touch(session_id)
+    
+    def __contains__(self, session_id: str) -> bool:
+        """`session_id in manager`: is the session held in memory?"""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            return session_id in shard.sessions
     
     def create_session(self) -> str:
         """
@@ -42,11 +94,83 @@ class ConversationManager:
         session_id = str(uuid.uuid4())
         
         # Initialize empty conversation for this session
-        self.conversations[session_id] = []
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            shard.sessions[session_id] = SessionRecord()
+        stats_registry.record_session_created()
         
         print(f"New session created: {session_id}")
         return session_id
     
+    def ensure_session(self, session_id: str) -> bool:
+        """
+        Makes sure a session with this ID exists (e.g. one the client generated).
+        
+        Returns:
+            True if the session was created, False if it already existed
+        """
+        if session_id in self:
+            return False
+        # A session that went cold may have been archived to disk
+        if self.load_archived(session_id):
+            return False
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            # Another thread may have created it in the meantime
+            if session_id in shard.sessions:
+                return False
+            shard.sessions[session_id] = SessionRecord()
+        stats_registry.record_session_created()
+        print(f"Auto-created session: {session_id}")
+        return True
+    
+    def _append(self, session_id: str, role: str, content: str, window: int = 0,
+                max_unsummarized: int = 0) -> Optional[Tuple[MessageData, List[Dict]]]:
+        """
+        Appends a message and reads the `window` messages before it, in one
+        step under the shard lock. The window is widened to reach back to the
+        first message the rolling summary doesn't cover, up to
+        `max_unsummarized` messages.
+        
+        Returns:
+            (the new message, the window as role/content dicts), or None if
+            the session doesn't exist
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return None
+            messages = record.messages
+            if max_unsummarized > window:
+                covered = record.summary.covered_messages if record.summary else 0
+                window = max(window, min(len(messages) - covered, max_unsummarized))
+            history = [{"role": m.role, "content": m.content} for m in messages[-window:]] if window > 0 else []
+            # Create a new message with current timestamp and the next sequence number
+            message = MessageData(
+                role=role,
+                content=content,
+                timestamp=datetime.now(),
+                seq=len(messages) + 1
+            )
+            messages.append(message)
+            self._touch(shard, session_id, record)
+            # Both are constant time and never block; doing them under the shard
+            # lock hands messages to the index and to watchers in seq order
+            search_index.add_message(session_id, message.seq, content)
+            session_broker.publish(session_id, {
+                "type": "message",
+                "seq": message.seq,
+                "role": role,
+                "content": content,
+                "timestamp": message.timestamp.isoformat()
+            })
+        
+        # Counters have their own lock; don't hold the shard for them
+        stats_registry.record_message(role)
+        print(f"Message added to session {session_id}: {role} - {content[:50]}...")
+        return message, history
+    
     def add_message(self, session_id: str, role: str, content: str) -> bool:
         """
         Adds a new message to an existing conversation.
@@ -59,23 +183,40 @@ class ConversationManager:
         Returns:
             True if successful, False if session doesn't exist
         """
-        # Check if the session exists
-        if session_id not in self.conversations:
+        if self._append(session_id, role, content) is None:
             print(f"Session {session_id} not found!")
             return False
+        return True
+    
+    def append_and_get_window(self, session_id: str, role: str, content: str,
+                                 limit: int, max_unsummarized: int = 0) -> Optional[List[Dict]]:
+        """
+        Adds a message and returns the `limit` messages that came right before
+        it, atomically: a reply being stored at the same moment (e.g. by a
+        retried request) lands either fully before or fully after this message,
+        never in the middle of the window used for the prompt.
         
-        # Create a new message with current timestamp
-        message = MessageData(
-            role=role,
-            content=content,
-            timestamp=datetime.now()
-        )
-        
-        # Add the message to the conversation
-        self.conversations[session_id].append(message)
+        The rolling summary is only updated every few messages, so the
+        messages between the end of the summary and the last `limit` would be
+        in neither. With `max_unsummarized`, the window reaches back to the
+        end of the summary (at most that many messages).
         
-        print(f"Message added to session {session_id}: {role} - {content[:50]}...")
-        return True
+        Args:
+            session_id: The conversation to add to
+            role: "user" or "assistant"
+            content: The message text
+            limit: How many earlier messages to return
+            max_unsummarized: Most messages to return to cover everything the summary doesn't
+            
+        Returns:
+            The earlier messages in the format AI models expect (oldest first),
+            or None if the session doesn't exist
+        """
+        result = self._append(session_id, role, content, window=limit, max_unsummarized=max_unsummarized)
+        if result is None:
+            print(f"Session {session_id} not found!")
+            return None
+        return result[1]
     
     def get_conversation_history(self, session_id: str) -> List[Dict]:
         """
@@ -87,22 +228,207 @@ class ConversationManager:
         Returns:
             List of dictionaries in format AI models expect
         """
-        # Check if session exists
-        if session_id not in self.conversations:
-            print(f"Session {session_id} not found!")
-            return []
-        
-        # Convert our MessageData objects to dictionaries the AI can understand
-        history = []
-        for message in self.conversations[session_id]:
-            history.append({
-                "role": message.role,
-                "content": message.content
-            })
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            # Check if session exists
+            if record is None:
+                print(f"Session {session_id} not found!")
+                return []
+            
+            # Convert our MessageData objects to dictionaries the AI can understand
+            history = [{"role": message.role, "content": message.content} for message in record.messages]
         
         print(f"Retrieved {len(history)} messages from session {session_id}")
         return history
     
+    def get_messages(self, session_id: str) -> Optional[List[MessageData]]:
+        """
+        Snapshot of a session's messages (None if the session isn't in memory).
+        The list is a copy, so it can be read without holding any lock.
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return list(record.messages) if record is not None else None
+    
+    def get_message(self, session_id: str, seq: int) -> Optional[MessageData]:
+        """One message by its sequence number (None if there is no such message)."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None or not 1 <= seq <= len(record.messages):
+                return None
+            return record.messages[seq - 1]
+    
+    def get_last_seq(self, session_id: str) -> int:
+        """Sequence number of the newest message in a session (0 if none)."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return len(record.messages) if record is not None else 0
+    
+    def get_last_activity(self, session_id: str) -> Optional[datetime]:
+        """When the session was last active (None if it isn't in memory)."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return record.last_activity if record is not None else None
+    
+    def get_history_page(self, session_id: str, limit: Optional[int] = None,
+                         before: Optional[int] = None, since: Optional[int] = None) -> List[Dict]:
+        """
+        Gets part of a conversation using message sequence numbers as cursors.
+        Messages are stored in seq order (message N is at index N-1), so this
+        only touches the messages it returns.
+        
+        Args:
+            session_id: Which conversation to retrieve
+            limit: Maximum number of messages to return (None = no limit)
+            before: Only messages with seq < before (page backwards through history)
+            since: Only messages with seq > since (fetch what's new since the last poll)
+            
+        Returns:
+            List of message dictionaries with seq, role, content and timestamp (oldest first)
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None or not record.messages:
+                return []
+            messages = record.messages
+            
+            start = max(since or 0, 0)
+            end = len(messages) if before is None else min(max(before - 1, 0), len(messages))
+            if limit is not None:
+                if since is not None:
+                    # Delta sync: oldest new messages first, the client asks again for the rest
+                    end = min(end, start + limit)
+                else:
+                    # Backwards paging: the newest `limit` messages before the cursor
+                    start = max(start, end - limit)
+            page = messages[start:end]
+        
+        return [
+            {
+                "seq": m.seq,
+                "role": m.role,
+                "content": m.content,
+                "timestamp": m.timestamp.isoformat()
+            }
+            for m in page
+        ]
+    
+    def get_recent_history(self, session_id: str, limit: int) -> List[Dict]:
+        """
+        Gets only the last `limit` messages, formatted like get_conversation_history.
+        Building a prompt then costs the same no matter how long the session is.
+        
+        Args:
+            session_id: Which conversation to retrieve
+            limit: Maximum number of messages to return
+            
+        Returns:
+            List of dictionaries in format AI models expect (oldest first)
+        """
+        if limit <= 0:
+            return []
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return []
+            return [{"role": m.role, "content": m.content} for m in record.messages[-limit:]]
+    
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        """Gets the rolling summary for a session, if one has been made yet."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return record.summary if record is not None else None
+    
+    def claim_messages_to_summarize(self, session_id: str, keep_recent: int,
+                                    min_batch: int) -> Optional[Tuple[str, List[MessageData], int]]:
+        """
+        Picks the messages that have dropped out of the prompt window but are
+        not in the summary yet, and marks the session as being summarized.
+        
+        Args:
+            session_id: Which conversation to check
+            keep_recent: How many recent messages the prompt includes verbatim
+            min_batch: Minimum number of new messages worth summarizing
+            
+        Returns:
+            (previous summary text, messages to fold in, new covered count),
+            or None if there isn't enough to summarize or a summary is already running
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None or record.summary_in_progress:
+                return None
+            
+            previous = record.summary
+            covered = previous.covered_messages if previous else 0
+            target = len(record.messages) - keep_recent
+            if target - covered < min_batch:
+                return None
+            
+            record.summary_in_progress = True
+            previous_text = previous.text if previous else ""
+            return previous_text, record.messages[covered:target], target
+    
+    def is_summary_in_progress(self, session_id: str) -> bool:
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return record is not None and record.summary_in_progress
+    
+    def store_summary(self, session_id: str, text: str, covered_messages: int):
+        """Saves a new rolling summary and releases the session's summary claim."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return
+            record.summary_in_progress = False
+            record.summary = ConversationSummary(
+                text=text,
+                covered_messages=covered_messages,
+                updated=datetime.now()
+            )
+        print(f"Summary updated for session {session_id}: covers {covered_messages} messages")
+    
+    def release_summary_claim(self, session_id: str):
+        """Releases a summary claim without saving (e.g. the model call failed)."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is not None:
+                record.summary_in_progress = False
+    
+    def get_personality(self, session_id: str) -> Optional[str]:
+        """Gets the therapy personality chosen for a session (None if not chosen yet)."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return record.personality if record is not None else None
+    
+    def set_personality(self, session_id: str, personality: str) -> bool:
+        """
+        Sets the therapy personality for one session only.
+        
+        Returns:
+            True if successful, False if session doesn't exist
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return False
+            record.personality = personality
+            return True
+    
     def get_session_info(self, session_id: str) -> Dict:
         """
         Gets information about a specific session.
@@ -110,21 +436,164 @@ class ConversationManager:
         Returns:
             Dictionary with session stats
         """
-        if session_id not in self.conversations:
+        message_count = None
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is not None:
+                message_count = len(record.messages)
+        if message_count is None:
             return {"exists": False, "message_count": 0}
         
         return {
             "exists": True,
-            "message_count": len(self.conversations[session_id]),
+            "message_count": message_count,
             "created": True  # In a real app, you'd track creation time
         }
     
+    def flag_crisis(self, session_id: str):
+        """Marks a session as having shown crisis indicators."""
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return
+            record.crisis = True
+        session_broker.publish(session_id, {"type": "crisis"})
+    
+    def is_crisis_flagged(self, session_id: str) -> bool:
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            return record is not None and record.crisis
+    
+    def get_cold_sessions(self, cutoff: datetime, limit: int = 1000) -> List[str]:
+        """
+        Gets sessions with no activity since `cutoff`, least recently active first.
+        Only looks at the cold end of each shard, not at every session.
+        
+        Args:
+            cutoff: Sessions last active before this time are cold
+            limit: Maximum number of sessions to return
+        """
+        return self.store.least_recently_active(cutoff, limit)
+    
+    def load_archived(self, session_id: str) -> bool:
+        """
+        Brings an archived session back into memory, if there is one.
+        
+        Returns:
+            True if the session was restored
+        """
+        if session_id in self:
+            return True
+        if self.session_loader is None:
+            return False
+        return self.session_loader(session_id)
+    
+    def restore_session(self, session_id: str, messages: List[MessageData], personality: Optional[str] = None,
+                        summary: Optional[ConversationSummary] = None, crisis: bool = False) -> bool:
+        """
+        Puts a previously archived session back into memory. Does nothing if
+        the session is already there (e.g. another request restored it first
+        and may have added messages since).
+        
+        Args:
+            session_id: The session to restore
+            messages: Its messages, in seq order
+            personality: Its therapy personality, if one was chosen
+            summary: Its rolling summary, if one was made
+            crisis: Whether it was flagged for crisis indicators
+        
+        Returns:
+            True if the session was restored, False if it was already in memory
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            if session_id in shard.sessions:
+                return False
+            shard.sessions[session_id] = SessionRecord(
+                messages=messages,
+                summary=summary,
+                personality=personality or None,
+                crisis=crisis
+            )
+            shard.touch(session_id)
+            for message in messages:
+                search_index.add_message(session_id, message.seq, message.content)
+        stats_registry.record_session_restored()
+        print(f"Session restored from archive: {session_id}")
+        return True
+    
+    def remove_session(self, session_id: str, expected_messages: Optional[int] = None,
+                       keep_search_index: bool = False) -> bool:
+        """
+        Removes a session and everything stored with it from memory.
+        
+        Args:
+            session_id: The session to remove
+            expected_messages: Only remove it if it still has exactly this many
+                               messages (so a message that just arrived isn't lost)
+            keep_search_index: Leave its postings in the search index (the session
+                               was archived, so it should stay searchable)
+        
+        Returns:
+            True if the session was removed
+        """
+        shard = self.store.shard(session_id)
+        with shard.lock:
+            record = shard.sessions.get(session_id)
+            if record is None:
+                return False
+            if expected_messages is not None and len(record.messages) != expected_messages:
+                return False
+            del shard.sessions[session_id]
+        if not keep_search_index:
+            search_index.remove_session(session_id)
+        stats_registry.record_session_evicted()
+        return True
+    
+    def memory_usage(self) -> Dict:
+        """
+        Approximate memory held by sessions (for the admin memory report).
+        Walks every message, one shard at a time, so call it off the event loop.
+        
+        Returns:
+            Dictionary with session and message counts, approximate bytes and
+            the size of the smallest and largest shard
+        """
+        sessions = 0
+        messages = 0
+        approx_bytes = 0
+        shard_sizes = []
+        for shard in self.store.shards:
+            with shard.lock:
+                shard_sizes.append(len(shard.sessions))
+                for session_id, record in shard.sessions.items():
+                    sessions += 1
+                    messages += len(record.messages)
+                    approx_bytes += (sys.getsizeof(session_id) + sys.getsizeof(record) + sys.getsizeof(record.__dict__)
+                                     + sys.getsizeof(record.messages))
+                    for message in record.messages:
+                        approx_bytes += (sys.getsizeof(message) + sys.getsizeof(message.__dict__)
+                                         + sys.getsizeof(message.content) + sys.getsizeof(message.timestamp))
+                    if record.summary is not None:
+                        approx_bytes += sys.getsizeof(record.summary) + sys.getsizeof(record.summary.text)
+        return {
+            "sessions": sessions,
+            "messages": messages,
+            "approx_bytes": approx_bytes,
+            "shards": len(shard_sizes),
+            "smallest_shard": min(shard_sizes),
+            "largest_shard": max(shard_sizes)
+        }
+    
     def list_all_sessions(self) -> List[str]:
         """
         Returns a list of all active session IDs.
         Useful for debugging or admin purposes.
         """
-        return list(self.conversations.keys())
+        return self.store.session_ids()
 
 # Create a global instance that will be shared across the application
 # This stays in memory as long as the server is running
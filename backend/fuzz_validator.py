@@ -0,0 +1,154 @@
+# ===============================================================================
+# FUZZ_VALIDATOR.PY - DIFFERENTIAL FUZZING AND WORST-CASE TIMING FOR VALIDATION
+# ===============================================================================
+# This file checks the linear-time InputValidator in two ways:
+# - Differential fuzzing: random and adversarial messages must give the same
+#   harmful/spam verdict as the original backtracking regexes
+# - Worst-case timing: no single message (up to MAX_MESSAGE_LENGTH) may take
+#   longer than the per-message budget to validate
+#
+# Usage (from the backend folder):
+#   python fuzz_validator.py                     # 20000 random cases
+#   python fuzz_validator.py --cases 200000 --seed 7
+#   python fuzz_validator.py --budget-ms 1.0
+# ===============================================================================
+
+import argparse
+import contextlib
+import os
+import random
+import re
+import sys
+import time
+from typing import List, Optional
+
+with open(os.devnull, "w") as _devnull, contextlib.redirect_stdout(_devnull):
+    from security import InputValidator
+
+# ===============================================================================
+# REFERENCE IMPLEMENTATION (the original backtracking regexes)
+# ===============================================================================
+
+LEGACY_HARMFUL_PATTERNS = [
+    re.compile(r'<script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>', re.IGNORECASE),
+    re.compile(r'javascript:', re.IGNORECASE),
+    re.compile(r'vbscript:', re.IGNORECASE),
+    re.compile(r'on\w+\s*=', re.IGNORECASE),
+]
+LEGACY_REPEAT_PATTERN = re.compile(r'(.)\1{10,}')
+
+
+def legacy_is_harmful(message: str) -> bool:
+    """Original harmful-content check."""
+    return any(pattern.search(message) for pattern in LEGACY_HARMFUL_PATTERNS)
+
+
+def legacy_is_spam(message: str) -> bool:
+    """Original spam check."""
+    if LEGACY_REPEAT_PATTERN.search(message):
+        return True
+    words = message.split()
+    if len(words) > 3:
+        word_counts = {}
+        for word in words:
+            word_counts[word.lower()] = word_counts.get(word.lower(), 0) + 1
+            if word_counts[word.lower()] > len(words) * 0.5:
+                return True
+    return False
+
+# ===============================================================================
+# INPUT GENERATION
+# ===============================================================================
+
+# Fragments that exercise every branch of the harmful-content checks
+FRAGMENTS = [
+    "<", ">", "/", "=", " ", "  ", "\t", "\n", "_", "a", "x", "1", "on", "On", "ON",
+    "<script", "<SCRIPT", "<scripts", "<script>", "</script>", "</SCRIPT>", "</script",
+    "javascript:", "JavaScript:", "vbscript:", "javascript", "onclick", "onload =",
+    "button=", "on=", "exam", "I feel", "help", "é", "ß", "²", "aaaaa", "zzzzzz",
+]
+
+# Hand-written worst cases for the original patterns
+ADVERSARIAL_TEMPLATES = [
+    lambda n: "<script" + "<" * (n - 7),
+    lambda n: "<script " + "<a" * ((n - 8) // 2),
+    lambda n: ("<script>" * n)[:n],
+    lambda n: ("on" * n)[:n],
+    lambda n: "on" + "a" * (n - 3) + " ",
+    lambda n: ("aaaaaaaaaab" * n)[:n],
+    lambda n: ("<script\t<" * n)[:n],
+    lambda n: ("onx " * n)[:n - 1] + "=",
+    lambda n: "".join(chr(0x61 + (i % 26)) * 10 for i in range(n // 10)),
+]
+
+
+def random_message(rng: random.Random, max_length: int) -> str:
+    """Build a random message from FRAGMENTS, at most `max_length` characters."""
+    target = rng.randint(1, max_length)
+    parts: List[str] = []
+    size = 0
+    while size < target:
+        fragment = rng.choice(FRAGMENTS)
+        parts.append(fragment)
+        size += len(fragment)
+    return "".join(parts)[:target]
+
+# ===============================================================================
+# FUZZ AND TIMING RUNS
+# ===============================================================================
+
+def time_validation(validator: InputValidator, message: str) -> float:
+    """Return the time in milliseconds to fully validate one message."""
+    start = time.perf_counter()
+    validator.validate_message(message)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Fuzz the linear-time input validator")
+    parser.add_argument("--cases", type=int, default=20000, help="Number of random messages")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed")
+    parser.add_argument("--budget-ms", type=float, default=1.0,
+                        help="Worst-case validation time allowed per message (default: 1.0ms)")
+    args = parser.parse_args(argv)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        validator = InputValidator()
+    max_length = validator.MAX_MESSAGE_LENGTH
+    rng = random.Random(args.seed)
+
+    # --- Differential fuzzing against the original regexes ---
+    mismatches = []
+    for _ in range(args.cases):
+        message = random_message(rng, rng.choice([16, 64, max_length]))
+        if validator._contains_harmful_content(message) != legacy_is_harmful(message):
+            mismatches.append(("harmful", message))
+        if validator._is_spam_message(message) != legacy_is_spam(message):
+            mismatches.append(("spam", message))
+    print(f"Differential fuzzing: {args.cases} cases, {len(mismatches)} mismatches")
+    for kind, message in mismatches[:10]:
+        print(f"- {kind} verdict differs for {message!r}")
+
+    # --- Worst-case timing at the maximum message length ---
+    worst_ms = 0.0
+    worst_message = ""
+    corpus = [template(max_length) for template in ADVERSARIAL_TEMPLATES]
+    corpus += [random_message(rng, max_length) for _ in range(200)]
+    for message in corpus:
+        # Best of 5 runs, so a scheduler hiccup isn't reported as a slow input
+        elapsed = min(time_validation(validator, message) for _ in range(5))
+        if elapsed > worst_ms:
+            worst_ms, worst_message = elapsed, message
+    print(f"Worst-case validation time: {worst_ms:.3f}ms "
+          f"(budget {args.budget_ms:.3f}ms) for {worst_message[:40]!r}...")
+
+    if mismatches or worst_ms > args.budget_ms:
+        print("FAILED")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
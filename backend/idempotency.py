@@ -0,0 +1,253 @@
+# ===============================================================================
+# IDEMPOTENCY.PY - IN-FLIGHT DEDUPLICATION OF CHAT GENERATIONS
+# ===============================================================================
+# This file handles:
+# - Running each chat reply as a background task that outlives the request,
+#   so a client that times out and retries doesn't lose the reply
+# - Remembering replies by idempotency key (the Idempotency-Key header or
+#   client_message_id in the request body), so a retry attaches to the
+#   generation that is still running, or gets the finished result, instead of
+#   starting a second model call and storing the message twice
+#
+# Keys are scoped to the client (auth subject or IP) and session they were
+# sent with, so one client's key never reaches another client's reply. A key
+# is reserved in the same synchronous step that looks it up, so two duplicates
+# arriving together can't both start a generation.
+# Finished replies are kept for `ttl` seconds; running ones are never dropped.
+# ===============================================================================
+
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import time
+
+
+class GenerationAbandonedError(Exception):
+    """The request that reserved a generation failed before starting it."""
+
+# ===============================================================================
+# ONE GENERATION
+# ===============================================================================
+
+class InFlightGeneration:
+    """
+    One chat reply being generated. Any number of requests can follow it:
+    follow() replays the pieces produced so far and then waits for more,
+    wait() just waits for the final reply.
+    """
+
+    def __init__(self, key: Optional[str], session_id: Optional[str], message_hash: str):
+        self.key = key
+        self.session_id = session_id
+        self.message_hash = message_hash
+        self.pieces = []
+        self.response: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.attached = 0          # Duplicate requests that joined this generation
+        self.producer = None       # Set by IdempotencyRegistry.launch (used by retry)
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake everyone waiting and start a fresh event for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def push(self, piece: str):
+        """Add a generated piece of text."""
+        self.pieces.append(piece)
+        self._notify()
+
+    def finish(self, response: str):
+        self.response = response
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def fail(self, error: BaseException):
+        self.error = error
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """
+        Yield every piece, from the first one, as it becomes available.
+
+        Raises:
+            The generation's error, after the pieces produced before it
+        """
+        index = 0
+        while True:
+            while index < len(self.pieces):
+                yield self.pieces[index]
+                index += 1
+            if self.done:
+                break
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def wait(self) -> str:
+        """
+        Wait for the final reply.
+
+        Raises:
+            The generation's error, if it failed
+        """
+        while not self.done:
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+# ===============================================================================
+# REGISTRY
+# ===============================================================================
+
+class IdempotencyRegistry:
+    """
+    Idempotency key -> InFlightGeneration.
+    Keys are scoped to the session they were used with.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 10000):
+        """
+        Args:
+            ttl: Seconds a finished reply can still be replayed
+            max_entries: Finished replies remembered at most (oldest dropped first)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Running generations by key, and finished ones in the order they finished
+        self._running: Dict[str, InFlightGeneration] = {}
+        self._finished: "OrderedDict[str, InFlightGeneration]" = OrderedDict()
+        # Keeps running tasks referenced until they finish
+        self._tasks = set()
+        self.started = 0
+        self.replayed = 0
+
+    @staticmethod
+    def scoped_key(client: str, session_id: Optional[str], key: Optional[str]) -> Optional[str]:
+        """
+        Args:
+            client: Who sent the request (auth subject, or client IP)
+            session_id: Session the request named (None if it starts one)
+            key: The client's idempotency key
+        """
+        return f"{client}:{session_id or ''}:{key}" if key else None
+
+    @staticmethod
+    def message_hash(message: str) -> str:
+        return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
+    def _expire(self):
+        """Drop finished entries older than ttl, or the oldest ones over max_entries."""
+        now = time.monotonic()
+        while self._finished:
+            generation = next(iter(self._finished.values()))
+            if now - generation.finished_at < self.ttl and len(self._finished) <= self.max_entries:
+                break
+            self._finished.popitem(last=False)
+
+    def claim(self, scoped_key: Optional[str], message: str) -> Tuple[InFlightGeneration, bool]:
+        """
+        Find the generation for a key (reserved, running, or finished within
+        ttl), or reserve a new one under it. Synchronous, so nothing can claim
+        the same key in between: call it before the request's first await.
+
+        Args:
+            scoped_key: Key from scoped_key() (None = not deduplicated)
+            message: The user message (to detect a key reused for another message)
+
+        Returns:
+            (generation, True if it is new). A new generation must be passed to
+            launch(), or to abandon() if the request fails before that.
+        """
+        if scoped_key is not None:
+            self._expire()
+            generation = self._running.get(scoped_key) or self._finished.get(scoped_key)
+            if generation is not None:
+                generation.attached += 1
+                self.replayed += 1
+                return generation, False
+        generation = InFlightGeneration(scoped_key, None, self.message_hash(message))
+        if scoped_key is not None:
+            self._running[scoped_key] = generation
+        return generation, True
+
+    def launch(self, generation: InFlightGeneration, session_id: str,
+               producer: Callable[[InFlightGeneration], Awaitable[str]]):
+        """
+        Start a claimed generation in a background task.
+
+        Args:
+            generation: New generation from claim()
+            session_id: Session the reply belongs to
+            producer: Coroutine function that pushes pieces and returns the full reply
+        """
+        generation.session_id = session_id
+        generation.producer = producer
+        self._launch(generation)
+
+    def abandon(self, generation: InFlightGeneration):
+        """
+        Release a claimed generation that was never launched (no-op once it
+        was). Requests that attached to it fail; a later retry starts afresh.
+        """
+        if generation.producer is not None or generation.done:
+            return
+        if generation.key is not None and self._running.get(generation.key) is generation:
+            del self._running[generation.key]
+        generation.fail(GenerationAbandonedError("The original request failed before its reply was started"))
+
+    def retry(self, failed: InFlightGeneration) -> InFlightGeneration:
+        """
+        Run a failed generation's producer again under the same key. The user
+        message was already stored by the first attempt, so only the reply is
+        generated again.
+
+        Args:
+            failed: A generation that finished with an error
+
+        Returns:
+            The new generation
+        """
+        generation = InFlightGeneration(failed.key, failed.session_id, failed.message_hash)
+        generation.producer = failed.producer
+        generation.attached = failed.attached
+        if failed.key is not None:
+            self._finished.pop(failed.key, None)
+        self._launch(generation)
+        return generation
+
+    def _launch(self, generation: InFlightGeneration):
+        if generation.key is not None:
+            self._running[generation.key] = generation
+        task = asyncio.get_running_loop().create_task(self._run(generation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.started += 1
+
+    async def _run(self, generation: InFlightGeneration):
+        try:
+            generation.finish(await generation.producer(generation))
+        except Exception as e:
+            generation.fail(e)
+        finally:
+            if generation.key is not None:
+                self._running.pop(generation.key, None)
+                self._finished[generation.key] = generation
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._tasks),
+            "remembered": len(self._running) + len(self._finished),
+            "started": self.started,
+            "replayed": self.replayed
+        }
+
+# Global registry shared by /chat and /ai-chat
+idempotency_registry = IdempotencyRegistry()
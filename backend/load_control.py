@@ -0,0 +1,208 @@
+# ===============================================================================
+# LOAD_CONTROL.PY - LOAD-ADAPTIVE GENERATION BUDGETS
+# ===============================================================================
+# This file handles:
+# - Watching how many generations are running and how fast the model is
+#   producing tokens right now
+# - Turning that into a "pressure" level between 0 (idle) and 1 (overloaded)
+# - Shrinking the reply length (num_predict) and the prompt's history window
+#   under pressure, within configured bounds, and restoring them as load drops
+#
+# Crisis messages always get the full budget. The pressure level rises at once
+# but falls back gradually (per finished generation, and with time when no
+# generation finishes), so budgets don't flap between two requests.
+# num_ctx is never changed: a different context size makes Ollama reload the
+# model, which would cost far more than it saves.
+# ===============================================================================
+
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+import threading
+import time
+
+from settings import Settings
+
+# ===============================================================================
+# BUDGET
+# ===============================================================================
+
+@dataclass(frozen=True)
+class GenerationBudget:
+    """What one generation may use."""
+    options: Dict[str, Any]     # Ollama parameters (num_predict adjusted)
+    history_messages: int       # Recent messages included in the prompt
+    level: float                # Pressure level the budget was chosen at (0-1)
+
+# ===============================================================================
+# CONTROLLER
+# ===============================================================================
+
+class AdaptiveGenerationController:
+    """
+    Chooses generation budgets from the current load.
+
+    Pressure is the larger of:
+    - queue pressure: running generations above `target_in_flight`, reaching 1
+      at `max_in_flight`
+    - speed pressure: how far the recent tokens per second fell below the
+      model's uncontended speed; slowdowns up to 20% are ignored, and it
+      reaches 1 at half the uncontended speed
+    """
+
+    def __init__(self, base_options: Dict[str, Any], max_history: int, min_num_predict: int = 120,
+                 min_history: int = 2, target_in_flight: int = 2, max_in_flight: int = 8,
+                 speed_alpha: float = 0.3, restore_rate: float = 0.2, restore_half_life: float = 30.0):
+        """
+        Initialize the controller (no load yet, so budgets start at the maximum).
+
+        Args:
+            base_options: Full-budget Ollama parameters (num_predict is the upper bound)
+            max_history: Full-budget history window
+            min_num_predict: Smallest num_predict used under pressure
+            min_history: Smallest history window used under pressure
+            target_in_flight: Running generations the model handles without slowing down
+            max_in_flight: Running generations at which budgets reach their minimum
+            speed_alpha: Weight of the newest generation in the tokens/second averages
+            restore_rate: Share of the gap closed per finished generation when pressure drops
+            restore_half_life: Seconds in which the gap halves when no generation finishes
+        """
+        self.base_options = dict(base_options)
+        self.max_num_predict = base_options["num_predict"]
+        self.max_history = max_history
+        self.min_num_predict = min(min_num_predict, self.max_num_predict)
+        self.min_history = min(min_history, max_history)
+        self.target_in_flight = target_in_flight
+        self.max_in_flight = max(max_in_flight, target_in_flight + 1)
+        self.speed_alpha = speed_alpha
+        self.restore_rate = restore_rate
+        self.restore_half_life = restore_half_life
+
+        self.in_flight = 0
+        self.level = 0.0
+        self._decayed_at = time.monotonic()
+        # Recent tokens/second, and the speed seen when the model wasn't contended
+        self.tokens_per_second: Optional[float] = None
+        self.baseline_tokens_per_second: Optional[float] = None
+        self.reduced_budgets = 0
+        self._lock = threading.Lock()
+
+    def configure(self, settings: Settings):
+        """Apply the ADAPTIVE_* bounds from settings (call on startup)."""
+        self.min_num_predict = min(settings.adaptive_min_num_predict, self.max_num_predict)
+        self.min_history = min(settings.adaptive_min_history, self.max_history)
+        self.target_in_flight = settings.adaptive_target_in_flight
+        self.max_in_flight = max(settings.adaptive_max_in_flight, self.target_in_flight + 1)
+
+    def _pressure(self, include_speed: bool = True) -> float:
+        queue_pressure = (self.in_flight - self.target_in_flight) / (self.max_in_flight - self.target_in_flight)
+        speed_pressure = 0.0
+        if include_speed and self.tokens_per_second and self.baseline_tokens_per_second:
+            slowdown = 1 - self.tokens_per_second / self.baseline_tokens_per_second
+            speed_pressure = (slowdown - 0.2) / 0.3
+        return min(max(queue_pressure, speed_pressure, 0.0), 1.0)
+
+    def _update_level(self):
+        # Back off at once, recover gradually
+        self._decay()
+        pressure = self._pressure()
+        if pressure >= self.level:
+            self.level = pressure
+        else:
+            self.level -= (self.level - pressure) * self.restore_rate
+            if self.level < 0.01:
+                self.level = 0.0
+
+    def _decay(self):
+        """
+        Let the level fall with time, so it doesn't stay high after a burst
+        until the next generation finishes. The measured speed is only as
+        recent as the last finished generation, so only queue pressure holds
+        the level up here; a still-slow model raises it again at once.
+        """
+        now = time.monotonic()
+        elapsed, self._decayed_at = now - self._decayed_at, now
+        floor = self._pressure(include_speed=False)
+        if self.level > floor and elapsed > 0:
+            self.level = floor + (self.level - floor) * 0.5 ** (elapsed / self.restore_half_life)
+            if self.level < 0.01:
+                self.level = 0.0
+
+    def budget(self, crisis: bool = False) -> GenerationBudget:
+        """
+        Budget for the next generation.
+
+        Args:
+            crisis: The message was flagged as a crisis (always gets the full budget)
+        """
+        with self._lock:
+            self._decay()
+            level = 0.0 if crisis else self.level
+            if level > 0:
+                self.reduced_budgets += 1
+        return self._budget_at(level)
+
+    def _budget_at(self, level: float) -> GenerationBudget:
+        num_predict = round(self.max_num_predict - level * (self.max_num_predict - self.min_num_predict))
+        history = round(self.max_history - level * (self.max_history - self.min_history))
+        return GenerationBudget(options={**self.base_options, "num_predict": num_predict},
+                                history_messages=history, level=round(level, 3))
+
+    def generation_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self._update_level()
+
+    def generation_finished(self, tokens: int, decode_seconds: float):
+        """
+        Record a finished generation.
+
+        Args:
+            tokens: Pieces streamed (Ollama streams one token per piece)
+            decode_seconds: Time from the first to the last piece
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if tokens > 1 and decode_seconds > 0:
+                speed = (tokens - 1) / decode_seconds
+                self.tokens_per_second = self._average(self.tokens_per_second, speed)
+                if self.in_flight < self.target_in_flight:
+                    # Uncontended run: this is the model's normal speed
+                    self.baseline_tokens_per_second = self._average(self.baseline_tokens_per_second, speed)
+            self._update_level()
+
+    def _average(self, average: Optional[float], value: float) -> float:
+        return value if average is None else average + self.speed_alpha * (value - average)
+
+    async def track(self, pieces: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Pass a generation's pieces through while counting it as running and
+        measuring its speed.
+        """
+        self.generation_started()
+        tokens = 0
+        first = last = None
+        try:
+            async for piece in pieces:
+                last = time.monotonic()
+                if first is None:
+                    first = last
+                tokens += 1
+                yield piece
+        finally:
+            self.generation_finished(tokens, (last - first) if tokens > 1 else 0.0)
+
+    def status(self) -> Dict[str, Any]:
+        """Controller state for the admin dashboard."""
+        with self._lock:
+            self._decay()
+            budget = self._budget_at(self.level)
+            return {
+                "in_flight": self.in_flight,
+                "level": round(self.level, 3),
+                "num_predict": budget.options["num_predict"],
+                "history_messages": budget.history_messages,
+                "tokens_per_second": round(self.tokens_per_second, 1) if self.tokens_per_second else None,
+                "baseline_tokens_per_second": round(self.baseline_tokens_per_second, 1)
+                if self.baseline_tokens_per_second else None,
+                "reduced_budgets": self.reduced_budgets
+            }
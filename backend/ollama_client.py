@@ -0,0 +1,558 @@
+# ===============================================================================
+# OLLAMA_CLIENT.PY - SHARED SETTINGS AND HELPERS FOR THE LOCAL OLLAMA MODEL
+# ===============================================================================
+# This file handles:
+# - Where the Ollama server lives and which model we use
+# - Extracting text from Ollama's streamed JSON chunks
+# - Simple non-streamed generation for background jobs (e.g. summaries)
+# - Streamed generation for async code (WebSocket chat), with cancellation
+# - A circuit breaker that stops calling Ollama while it is failing or too slow,
+#   so requests fail fast instead of piling up behind long timeouts
+# - Model warm-up and keep-alive, so students don't hit a cold model load
+# ===============================================================================
+
+from typing import Optional, Dict, Any, Tuple, AsyncIterator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import json
+import threading
+import time
+
+from settings import get_settings, Settings
+
+# The Ollama URL and model name come from settings.py (OLLAMA_BASE_URL, OLLAMA_MODEL).
+# `requests` is imported inside the functions that use it, so importing this
+# module (and starting a worker) doesn't pay for it up front.
+
+# ===============================================================================
+# RESPONSE PARSING
+# ===============================================================================
+
+def extract_text_piece(raw_line: str) -> Optional[str]:
+    """
+    Pull the generated text out of one line of Ollama's streamed output.
+
+    Ollama streams line-delimited JSON objects. Depending on the endpoint the
+    text is under 'response', 'content' or 'delta'. Plain-text lines are
+    returned unchanged.
+
+    Args:
+        raw_line: One decoded line from the streaming response
+
+    Returns:
+        The text in this line, or None if it carries no text
+    """
+    try:
+        chunk = json.loads(raw_line)
+    except Exception:
+        # Not JSON, treat as plain text
+        return raw_line
+
+    if not isinstance(chunk, dict):
+        return None
+
+    # 'response' may contain the full text in some endpoints
+    if 'response' in chunk and isinstance(chunk['response'], str):
+        return chunk['response']
+    # 'content' may be used for incremental tokens
+    if 'content' in chunk and isinstance(chunk['content'], str):
+        return chunk['content']
+    # 'delta' may carry incremental pieces, e.g. 'text' or {'content': 'text'}
+    if 'delta' in chunk:
+        delta = chunk['delta']
+        if isinstance(delta, str):
+            return delta
+        if isinstance(delta, dict):
+            content = delta.get('content') or delta.get('response')
+            if isinstance(content, str):
+                return content
+    return None
+
+# ===============================================================================
+# CIRCUIT BREAKER
+# ===============================================================================
+
+class ModelUnavailableError(Exception):
+    """Raised instead of calling Ollama while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of recent Ollama calls and stops sending new ones while
+    Ollama is failing or too slow.
+
+    - CLOSED: calls go through. When at least `failure_rate` of the last
+      `window` calls failed (a call slower than `slow_call_seconds` counts as
+      a failure), the breaker opens.
+    - OPEN: calls are refused right away (ModelUnavailableError) for
+      `open_seconds`.
+    - HALF_OPEN: up to `half_open_probes` real calls are let through as probes.
+      A successful probe closes the breaker, a failed one opens it again.
+
+    Latency is judged on the time to the first token for streamed calls, and
+    on the whole call otherwise. Thread-safe: outcomes are recorded from the
+    threads that read Ollama's responses.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 30.0, open_seconds: float = 30.0, half_open_probes: int = 1):
+        """
+        Initialize a closed breaker.
+
+        Args:
+            window: Number of recent calls the failure rate is computed over
+            min_calls: Calls needed in the window before the breaker can open
+            failure_rate: Share of failed (or slow) calls that opens the breaker
+            slow_call_seconds: Calls slower than this count as failures
+            open_seconds: How long the breaker stays open before probing
+            half_open_probes: Calls let through at a time while probing
+        """
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)   # True = failed or slow
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.last_failure: Optional[str] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Ask to make a call. Every allowed call must be followed by
+        record_success() or record_failure().
+
+        Returns:
+            False if the call should not be made (the breaker is open)
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self.probes_in_flight = 0
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+                self.probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.times_opened += 1
+        print(f"Ollama circuit breaker opened: {self.last_failure}")
+
+    def record_success(self, latency: float):
+        """Record a call that worked, `latency` seconds after it was made."""
+        if latency > self.slow_call_seconds:
+            self.record_failure(f"slow response ({latency:.1f}s)")
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                # The probe worked: Ollama is back
+                self.state = self.CLOSED
+                self.outcomes.clear()
+                print("Ollama circuit breaker closed")
+            elif self.state == self.CLOSED:
+                self.outcomes.append(False)
+
+    def record_failure(self, reason: str):
+        """Record a call that failed (error, timeout or too slow)."""
+        with self._lock:
+            self.last_failure = reason
+            if self.state == self.HALF_OPEN:
+                self._open()
+            elif self.state == self.CLOSED:
+                self.outcomes.append(True)
+                failures = sum(self.outcomes)
+                if len(self.outcomes) >= self.min_calls and failures >= self.failure_rate * len(self.outcomes):
+                    self._open()
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state for the /health endpoint."""
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(self.open_seconds - (time.monotonic() - self.opened_at), 0), 1)
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": sum(self.outcomes),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": retry_in,
+                "last_failure": self.last_failure
+            }
+
+# ===============================================================================
+# NON-STREAMED GENERATION
+# ===============================================================================
+
+def generate_text(prompt: str, options: Dict[str, Any], timeout: int = 60) -> str:
+    """
+    Run a single non-streamed generation and return the text.
+
+    This is a blocking call - use it from background tasks or a threadpool,
+    never directly inside an async endpoint.
+
+    Args:
+        prompt: Full prompt to send
+        options: Ollama model parameters (temperature, num_predict, ...)
+        timeout: Request timeout in seconds
+
+    Returns:
+        The generated text, stripped (empty string if the model returned nothing)
+
+    Raises:
+        requests.exceptions.RequestException: If Ollama can't be reached or fails
+        ModelUnavailableError: If the circuit breaker is open
+    """
+    import requests
+    
+    settings = get_settings()
+    payload = {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": model_lifecycle.keep_alive,
+        "options": options
+    }
+    if not model_breaker.allow():
+        raise ModelUnavailableError("AI model is temporarily unavailable")
+    start = time.monotonic()
+    try:
+        response = requests.post(settings.ollama_generate_url, json=payload, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        model_breaker.record_failure(str(e))
+        raise
+    model_breaker.record_success(time.monotonic() - start)
+    # Only background jobs (summaries) use non-streamed generation
+    model_lifecycle.record_use(student_request=False)
+    data = response.json()
+    text = data.get('response', '') or data.get('content', '')
+    return text.strip() if isinstance(text, str) else ''
+
+# ===============================================================================
+# STREAMED GENERATION (ASYNC)
+# ===============================================================================
+
+# Marks the end of a stream on the bridge queue
+_STREAM_END = object()
+
+# Threads reading model responses. A stream holds its thread for the whole
+# generation, so model calls get their own pool: archive restores, index
+# flushes and alert delivery on the default executor never queue behind them.
+GENERATION_THREADS = 40
+_generation_executor: Optional[ThreadPoolExecutor] = None
+
+
+def generation_executor() -> ThreadPoolExecutor:
+    """The thread pool for blocking model calls (created on first use)."""
+    global _generation_executor
+    if _generation_executor is None:
+        _generation_executor = ThreadPoolExecutor(max_workers=GENERATION_THREADS, thread_name_prefix="generation")
+    return _generation_executor
+
+
+async def stream_text(prompt: str, options: Dict[str, Any], cancel_event: Optional[threading.Event] = None,
+                      timeout: int = 120) -> AsyncIterator[str]:
+    """
+    Stream generated text pieces into async code.
+
+    The blocking HTTP stream is read in a worker thread, which hands every
+    piece to the event loop through an asyncio.Queue. Setting `cancel_event`
+    (or closing this generator early) makes the thread stop reading and close
+    the connection to Ollama after the current chunk.
+
+    Args:
+        prompt: Full prompt to send
+        options: Ollama model parameters
+        cancel_event: Set it to stop the generation early
+        timeout: Request timeout in seconds
+
+    Yields:
+        Text pieces as Ollama produces them
+
+    Raises:
+        requests.exceptions.RequestException: If Ollama can't be reached or fails
+        ModelUnavailableError: If the circuit breaker is open
+    """
+    if not model_breaker.allow():
+        raise ModelUnavailableError("AI model is temporarily unavailable")
+    settings = get_settings()
+    payload = {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": model_lifecycle.keep_alive,
+        "options": options
+    }
+    # Set when the consumer goes away, without touching the caller's cancel_event
+    stop_event = threading.Event()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def read_stream():
+        import requests
+
+        start = time.monotonic()
+        first_token_latency = None
+        try:
+            with requests.post(settings.ollama_generate_url, json=payload, stream=True, timeout=timeout) as resp:
+                resp.raise_for_status()
+                for raw_line in resp.iter_lines(decode_unicode=True):
+                    if stop_event.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                        break
+                    if not raw_line:
+                        continue
+                    text_piece = extract_text_piece(raw_line)
+                    if text_piece:
+                        if first_token_latency is None:
+                            first_token_latency = time.monotonic() - start
+                        loop.call_soon_threadsafe(queue.put_nowait, text_piece)
+            model_breaker.record_success(first_token_latency if first_token_latency is not None
+                                         else time.monotonic() - start)
+            model_lifecycle.record_use()
+        except Exception as e:
+            model_breaker.record_failure(str(e))
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    loop.run_in_executor(generation_executor(), read_stream)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stop the reader thread if the consumer went away early
+        stop_event.set()
+
+# ===============================================================================
+# MODEL LIFECYCLE (WARM-UP AND KEEP-ALIVE)
+# ===============================================================================
+
+class ModelLifecycleManager:
+    """
+    Keeps the Ollama model loaded when students are likely to be chatting.
+    
+    - Preloads the model when the server starts
+    - Every generation sends a keep_alive hint so Ollama doesn't unload it
+    - During counseling hours, or hours that have been busy recently, it pings
+      the model before the keep_alive runs out if nobody else has used it
+    """
+    
+    # Load states reported on /health
+    COLD = "cold"
+    LOADING = "loading"
+    READY = "ready"
+    ERROR = "error"
+    
+    def __init__(self, keep_alive_minutes: int = 30, counseling_hours: Tuple[int, int] = (8, 22),
+                 check_interval: int = 60, traffic_threshold: float = 3.0, traffic_decay: float = 0.5):
+        """
+        Initialize the lifecycle manager.
+        
+        Args:
+            keep_alive_minutes: How long Ollama keeps the model loaded after a request
+            counseling_hours: (start_hour, end_hour) when the model is always kept warm
+            check_interval: Seconds between keep-alive checks
+            traffic_threshold: Recent requests in an hour slot needed to keep it warm
+                               outside counseling hours
+            traffic_decay: How much every hour slot's count is reduced per day
+                           that passes (0.5 = yesterday counts half as much as today)
+        """
+        self.keep_alive = f"{keep_alive_minutes}m"
+        self.keep_alive_seconds = keep_alive_minutes * 60
+        self.counseling_hours = counseling_hours
+        self.check_interval = check_interval
+        self.traffic_threshold = traffic_threshold
+        self.traffic_decay = traffic_decay
+        
+        self.state = self.COLD
+        self.last_error: Optional[str] = None
+        self.last_used: Optional[datetime] = None
+        self.last_load_ms: Optional[float] = None
+        self.warmups = 0
+        
+        # Decayed student request counts per hour of the day, used to predict busy hours
+        self.hourly_traffic = [0.0] * 24
+        self._traffic_decayed_at: Optional[datetime] = None
+        self._traffic_lock = threading.Lock()
+        self._keep_alive_task: Optional[asyncio.Task] = None
+    
+    def configure(self, settings: Settings):
+        """Apply keep-alive and counseling-hours settings (call before start())."""
+        self.keep_alive = f"{settings.ollama_keep_alive_minutes}m"
+        self.keep_alive_seconds = settings.ollama_keep_alive_minutes * 60
+        self.counseling_hours = settings.counseling_hours
+    
+    def record_use(self, now: Optional[datetime] = None, student_request: bool = True):
+        """
+        Note that the model just answered a request (so it is loaded).
+        
+        Args:
+            now: When (defaults to now)
+            student_request: Count it towards the hourly traffic. Keep-alive
+                             pings and summaries don't say when students chat
+        """
+        now = now or datetime.now()
+        self.last_used = now
+        self.state = self.READY
+        self.last_error = None
+        if student_request:
+            with self._traffic_lock:
+                self._decay_traffic(now)
+                self.hourly_traffic[now.hour] += 1
+    
+    def _decay_traffic(self, now: datetime):
+        """Decay every hour slot by the time passed since the last decay (hold _traffic_lock)."""
+        if self._traffic_decayed_at is not None:
+            days = (now - self._traffic_decayed_at).total_seconds() / 86400
+            if days <= 0:
+                return
+            factor = self.traffic_decay ** days
+            self.hourly_traffic = [count * factor for count in self.hourly_traffic]
+        self._traffic_decayed_at = now
+    
+    def is_traffic_expected(self, now: Optional[datetime] = None) -> bool:
+        """
+        Predict whether students are likely to chat around this time.
+        
+        Returns:
+            True during counseling hours, or if this hour or the next one
+            has been busy on recent days
+        """
+        now = now or datetime.now()
+        start_hour, end_hour = self.counseling_hours
+        if start_hour <= now.hour < end_hour:
+            return True
+        next_hour = (now.hour + 1) % 24
+        # Decay first: a slot that was busy once cools down even if nobody uses it again
+        with self._traffic_lock:
+            self._decay_traffic(now)
+        return max(self.hourly_traffic[now.hour], self.hourly_traffic[next_hour]) >= self.traffic_threshold
+    
+    def should_ping(self, now: Optional[datetime] = None) -> bool:
+        """True if the model should be pinged now to stop it from being unloaded."""
+        now = now or datetime.now()
+        if not self.is_traffic_expected(now):
+            return False
+        if self.state != self.READY or self.last_used is None:
+            return True
+        # Ping once less than two check intervals of keep_alive are left
+        idle = (now - self.last_used).total_seconds()
+        return idle >= self.keep_alive_seconds - 2 * self.check_interval
+    
+    def warm_up(self) -> bool:
+        """
+        Load the model into memory (blocking call - run it in a threadpool).
+        An empty prompt makes Ollama load the model without generating anything.
+        
+        Returns:
+            True if the model is loaded
+        """
+        import requests
+        
+        settings = get_settings()
+        self.state = self.LOADING
+        payload = {"model": settings.ollama_model, "prompt": "", "keep_alive": self.keep_alive}
+        start = time.perf_counter()
+        try:
+            response = requests.post(settings.ollama_generate_url, json=payload, timeout=300)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.state = self.ERROR
+            self.last_error = str(e)
+            print(f"Model warm-up failed: {e}")
+            return False
+        
+        self.last_load_ms = (time.perf_counter() - start) * 1000
+        self.warmups += 1
+        self.record_use(student_request=False)
+        print(f"Model {settings.ollama_model} warm ({self.last_load_ms:.0f}ms), keep_alive={self.keep_alive}")
+        return True
+    
+    def refresh_state(self):
+        """
+        Ask Ollama which models are loaded right now (blocking call).
+        Catches the model being unloaded behind our back (e.g. Ollama restarted).
+        """
+        import requests
+        
+        settings = get_settings()
+        try:
+            response = requests.get(settings.ollama_ps_url, timeout=5)
+            response.raise_for_status()
+            loaded = [m.get("name") or m.get("model") for m in response.json().get("models", [])]
+        except Exception:
+            # Older Ollama versions have no /api/ps; keep our own view
+            return
+        if settings.ollama_model in loaded:
+            if self.state != self.LOADING:
+                self.state = self.READY
+        elif self.state == self.READY:
+            self.state = self.COLD
+    
+    async def _keep_alive_loop(self):
+        """Background loop: check the model every check_interval seconds."""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await loop.run_in_executor(None, self.refresh_state)
+                if self.should_ping():
+                    await loop.run_in_executor(generation_executor(), self.warm_up)
+            except Exception as e:
+                print(f"Model keep-alive check failed: {e}")
+    
+    def start(self):
+        """Preload the model and start the keep-alive loop (call on server startup)."""
+        loop = asyncio.get_event_loop()
+        # Don't hold up startup while the model loads
+        loop.run_in_executor(generation_executor(), self.warm_up)
+        self._keep_alive_task = loop.create_task(self._keep_alive_loop())
+    
+    def stop(self):
+        """Stop the keep-alive loop (call on server shutdown)."""
+        if self._keep_alive_task:
+            self._keep_alive_task.cancel()
+            self._keep_alive_task = None
+    
+    def status(self) -> Dict[str, Any]:
+        """Model load state for the /health endpoint."""
+        return {
+            "model": get_settings().ollama_model,
+            "state": self.state,
+            "keep_alive": self.keep_alive,
+            "last_used": self.last_used.isoformat() if self.last_used else None,
+            "last_load_ms": round(self.last_load_ms, 1) if self.last_load_ms is not None else None,
+            "warmups": self.warmups,
+            "traffic_expected": self.is_traffic_expected(),
+            "last_error": self.last_error
+        }
+
+# Global instance shared by the endpoints and background jobs.
+# Settings are applied in the app's lifespan (see chatbot.py) via configure().
+model_lifecycle = ModelLifecycleManager(keep_alive_minutes=30, counseling_hours=(8, 22))
+
+# Guards every chat and summary call to Ollama (state shown on /health)
+model_breaker = CircuitBreaker()
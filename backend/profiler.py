@@ -0,0 +1,335 @@
+# ===============================================================================
+# PROFILER.PY - ON-DEMAND CPU SAMPLING AND MEMORY INTROSPECTION
+# ===============================================================================
+# This file handles:
+# - A sampling profiler: for N seconds, a background thread records the stack
+#   of every other thread (sys._current_frames) at a fixed interval. Nothing
+#   is instrumented, so the server runs at full speed between samples
+# - Output as collapsed stacks ("thread;outer;inner count" per line), which
+#   flamegraph.pl and speedscope.app turn into a flamegraph, or as JSON with
+#   the hottest functions
+# - tracemalloc snapshot diffs: start tracing, then ask what was allocated
+#   (and not freed) since the last snapshot, by source line
+# - Process-level numbers (RSS, garbage collector, threads, asyncio tasks)
+#
+# Everything here is off until an admin asks for it. tracemalloc slows down
+# every allocation while it is on, so stop it when done.
+# ===============================================================================
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Innermost frames of a thread that is waiting (for work, a lock or the network),
+# not running Python code: left out unless asked for, so profiles show CPU time
+IDLE_FRAMES = {
+    "select (selectors.py)",
+    "wait (threading.py)",
+    "_wait_for_tstate_lock (threading.py)",
+    "_worker (thread.py)",
+    "get (queue.py)",
+    "accept (socket.py)",
+    "readinto (socket.py)",
+}
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+# ===============================================================================
+# CPU SAMPLING
+# ===============================================================================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def collapse_stacks(stacks: Counter) -> str:
+    """Collapsed stack format: one "frame;frame;frame count" line per stack, most samples first."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks: Counter, limit: int = 30) -> List[Dict[str, Any]]:
+    """
+    Functions by samples spent in them (self) and under them (total).
+    A function that appears twice in one stack (recursion) counts once in total.
+    """
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]  # Drop the thread name
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [{"function": function, "self": own[function], "total": samples}
+            for function, samples in total.most_common(limit)]
+
+
+class SamplingProfiler:
+    """
+    Records every thread's stack at a fixed interval. One profile at a time;
+    it runs in its own thread so it can sample the event loop thread too.
+    """
+
+    def __init__(self, max_seconds: float = 60.0):
+        """
+        Args:
+            max_seconds: Longest profile allowed
+        """
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.profiles = 0
+        self.last_profile: Optional[str] = None
+
+    def sample(self, seconds: float, interval: float = 0.01, include_idle: bool = False) -> Dict[str, Any]:
+        """
+        Profile for `seconds` (blocking - use profile() from async code).
+
+        Args:
+            seconds: How long to sample
+            interval: Seconds between samples
+            include_idle: Also keep stacks of threads that are only waiting
+
+        Returns:
+            {"stacks": Counter of collapsed stacks, "samples", "seconds", "overhead_pct"}
+
+        Raises:
+            ProfilerBusyError: Another profile is running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            own_thread = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            sampling_time = 0.0
+            names: Dict[int, str] = {}
+            start = time.perf_counter()
+            deadline = start + min(seconds, self.max_seconds)
+            next_tick = start
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if samples % 100 == 0:
+                    # Threads come and go (thread pools); refresh their names now and then
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_thread:
+                        continue
+                    frames = []
+                    while frame is not None:
+                        frames.append(_frame_label(frame))
+                        frame = frame.f_back
+                    if not frames or (not include_idle and frames[0] in IDLE_FRAMES):
+                        continue
+                    frames.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(frames))] += 1
+                samples += 1
+                sampling_time += time.perf_counter() - now
+                next_tick += interval
+                time.sleep(max(next_tick - time.perf_counter(), 0))
+            elapsed = time.perf_counter() - start
+        finally:
+            self._lock.release()
+
+        self.profiles += 1
+        self.last_profile = datetime.now().isoformat()
+        return {
+            "stacks": stacks,
+            "samples": samples,
+            "seconds": round(elapsed, 3),
+            "overhead_pct": round(sampling_time / elapsed * 100, 2) if elapsed else 0.0
+        }
+
+    async def profile(self, seconds: float, interval: float = 0.01, include_idle: bool = False) -> Dict[str, Any]:
+        """Run sample() in the profiler's own thread and wait for it without blocking the event loop."""
+        if self._lock.locked():
+            raise ProfilerBusyError("A profile is already running")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.sample, seconds, interval, include_idle)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._lock.locked(),
+            "profiles": self.profiles,
+            "last_profile": self.last_profile
+        }
+
+# ===============================================================================
+# MEMORY TRACING
+# ===============================================================================
+
+def _short_path(filename: str) -> str:
+    """Path relative to the backend folder, or the last two parts for library code."""
+    if filename.startswith(BACKEND_DIR):
+        return os.path.relpath(filename, BACKEND_DIR)
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+class MemoryTracer:
+    """
+    tracemalloc snapshots on demand. start() takes a baseline; every diff()
+    reports what changed since the previous snapshot and (by default) makes
+    the new snapshot the baseline, so repeated diffs show steady growth.
+    """
+
+    GROUP_BY = ("lineno", "filename", "traceback")
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self.frames = 1
+        self.started_at: Optional[str] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        # Leave out tracemalloc's own bookkeeping and the import machinery
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def start(self, frames: int = 1) -> bool:
+        """
+        Start tracing allocations and take the baseline snapshot (blocking).
+
+        Args:
+            frames: Stack frames stored per allocation (more = slower, but allows group_by="traceback")
+
+        Returns:
+            False if tracing was already on
+        """
+        with self._lock:
+            if self.tracing:
+                return False
+            self.frames = frames
+            tracemalloc.start(frames)
+            self._baseline = self._snapshot()
+            self.started_at = datetime.now().isoformat()
+            return True
+
+    def diff(self, limit: int = 20, group_by: str = "lineno", reset: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Compare a new snapshot with the baseline (blocking).
+
+        Args:
+            limit: Number of locations to return (largest growth first)
+            group_by: "lineno", "filename" or "traceback"
+            reset: Make the new snapshot the baseline for the next diff
+
+        Returns:
+            The diff, or None if tracing is off
+        """
+        with self._lock:
+            if not self.tracing or self._baseline is None:
+                return None
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._baseline, group_by)
+            if reset:
+                self._baseline = snapshot
+        stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "growth_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            "top": [
+                {
+                    "location": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+                    if group_by == "traceback" else
+                    f"{_short_path(stat.traceback[0].filename)}"
+                    + (f":{stat.traceback[0].lineno}" if group_by == "lineno" else ""),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count_diff": stat.count_diff,
+                    "size_kb": round(stat.size / 1024, 1)
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+    def stop(self) -> bool:
+        """Stop tracing and drop the baseline. Returns False if tracing was off."""
+        with self._lock:
+            if not self.tracing:
+                return False
+            tracemalloc.stop()
+            self._baseline = None
+            self.started_at = None
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "tracing": self.tracing,
+            "frames": self.frames if self.tracing else None,
+            "started_at": self.started_at
+        }
+
+# ===============================================================================
+# PROCESS
+# ===============================================================================
+
+def process_memory() -> Dict[str, Any]:
+    """
+    Resident memory now and at peak (MB, where the platform tells us), garbage
+    collector and thread counts (blocking: counting objects takes a while on a
+    big heap).
+    """
+    rss_mb = None
+    try:
+        with open("/proc/self/statm") as fh:
+            rss_mb = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    peak_mb = None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    return {
+        "rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+        "peak_rss_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "gc_counts": gc.get_count(),
+        # Objects the garbage collector tracks (containers, instances); growth between calls hints at a leak
+        "gc_objects": len(gc.get_objects()),
+        "threads": threading.active_count()
+    }
+
+
+def pending_tasks(limit: int = 15) -> Dict[str, Any]:
+    """asyncio tasks not yet finished, grouped by the coroutine they run (call from the event loop)."""
+    tasks = [task for task in asyncio.all_tasks() if not task.done()]
+    by_coroutine = Counter(getattr(task.get_coro(), "__qualname__", repr(task.get_coro())) for task in tasks)
+    return {
+        "total": len(tasks),
+        "by_coroutine": [{"coroutine": name, "count": count} for name, count in by_coroutine.most_common(limit)]
+    }
+
+# Global instances used by the admin endpoints
+sampling_profiler = SamplingProfiler()
+memory_tracer = MemoryTracer()
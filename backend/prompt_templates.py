@@ -0,0 +1,154 @@
+# ===============================================================================
+# PROMPT_TEMPLATES.PY - PER-PERSONALITY SYSTEM PROMPTS LOADED FROM FILES
+# ===============================================================================
+# This file handles:
+# - Loading one system prompt file per therapy personality from prompts/
+# - Precompiling each personality into a ready-to-use prompt prefix
+# - Hot-reloading the files when they change, without restarting the server
+#
+# prompts/<default personality>.txt holds the base MindCareAI prompt. The other
+# files (CBT.txt, Mindfulness.txt, ...) hold approach-specific guidance that is
+# added after the base prompt.
+# ===============================================================================
+
+from typing import Dict, List, Optional
+import os
+import time
+
+# Folder with one <personality>.txt file per therapy approach
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Appended to every personality's prompt
+CONTEXT_RULES = """
+
+IMPORTANT CONTEXT RULES:
+- You have access to previous conversation history when provided
+- Always acknowledge and build upon previous interactions
+- Remember user preferences, names, and topics mentioned earlier
+- If this is the start of a conversation, introduce yourself appropriately
+- Maintain consistency with your previous responses in the same conversation"""
+
+# ===============================================================================
+# TEMPLATE REGISTRY
+# ===============================================================================
+
+class PromptTemplateRegistry:
+    """
+    Holds a precompiled system prompt prefix for every personality.
+
+    Prefixes are built once when the files are loaded, so building a chat
+    prompt is just a dictionary lookup. A reload builds a brand new dictionary
+    and swaps it in with one assignment, so readers never need a lock.
+    """
+
+    def __init__(self, personalities: List[str], default_personality: str,
+                 directory: str = PROMPTS_DIR, check_interval: float = 5.0):
+        """
+        Initialize the registry (files are loaded on first use or by load()).
+
+        Args:
+            personalities: Personality names; each one is loaded from <name>.txt
+            default_personality: Personality whose file holds the base prompt
+            directory: Folder containing the prompt files
+            check_interval: Seconds between checks for changed files (0 disables)
+        """
+        self.personalities = list(personalities)
+        self.default_personality = default_personality
+        self.directory = directory
+        self.check_interval = check_interval
+
+        self.prefixes: Dict[str, str] = {}
+        self.version = 0
+        self._mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+
+    def _path(self, personality: str) -> str:
+        return os.path.join(self.directory, f"{personality}.txt")
+
+    def _file_mtimes(self) -> Dict[str, float]:
+        """Modification time of every prompt file (0 for missing files)."""
+        mtimes = {}
+        for personality in self.personalities:
+            try:
+                mtimes[personality] = os.path.getmtime(self._path(personality))
+            except OSError:
+                mtimes[personality] = 0.0
+        return mtimes
+
+    def _read(self, personality: str) -> Optional[str]:
+        try:
+            with open(self._path(personality), "r", encoding="utf-8") as fh:
+                return fh.read().strip()
+        except OSError:
+            return None
+
+    def load(self) -> int:
+        """
+        Read every prompt file and rebuild all prefixes.
+
+        Returns:
+            The new registry version number
+
+        Raises:
+            FileNotFoundError: If the default personality's base prompt is missing
+        """
+        mtimes = self._file_mtimes()
+        base = self._read(self.default_personality)
+        if not base:
+            raise FileNotFoundError(f"Base prompt not found: {self._path(self.default_personality)}")
+
+        prefixes = {}
+        for personality in self.personalities:
+            if personality == self.default_personality:
+                prefixes[personality] = base + CONTEXT_RULES
+                continue
+            guidance = self._read(personality)
+            if guidance is None:
+                print(f"Warning: no prompt file for personality '{personality}', using the base prompt")
+                prefixes[personality] = base + CONTEXT_RULES
+            else:
+                prefixes[personality] = base + "\n\n" + guidance + CONTEXT_RULES
+
+        # Swap in the new prefixes in one step
+        self.prefixes = prefixes
+        self._mtimes = mtimes
+        self._last_check = time.monotonic()
+        self.version += 1
+        print(f"Prompt templates loaded (version {self.version}): {', '.join(prefixes)}")
+        return self.version
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the prompt files if any of them changed on disk.
+
+        Returns:
+            True if the templates were reloaded
+        """
+        self._last_check = time.monotonic()
+        if self._file_mtimes() == self._mtimes:
+            return False
+        try:
+            self.load()
+        except FileNotFoundError as e:
+            # Keep serving the last good templates
+            print(f"Warning: prompt reload failed, keeping version {self.version}: {e}")
+            return False
+        return True
+
+    def get_prefix(self, personality: str) -> str:
+        """
+        Get the precompiled system prompt for a personality.
+
+        Args:
+            personality: Personality name (unknown names get the default prompt)
+
+        Returns:
+            The full system prompt, including the context rules
+        """
+        if not self.prefixes:
+            self.load()
+        elif self.check_interval and time.monotonic() - self._last_check >= self.check_interval:
+            self.reload_if_changed()
+
+        prefixes = self.prefixes
+        return prefixes.get(personality) or prefixes[self.default_personality]
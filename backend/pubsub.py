@@ -0,0 +1,162 @@
+# ===============================================================================
+# PUBSUB.PY - LIVE FAN-OUT OF SESSION ACTIVITY
+# ===============================================================================
+# This file handles:
+# - An in-process broker: stored messages, streamed tokens and crisis flags
+#   are published per session, and every subscriber of that session gets them
+# - Publishing from any thread: events published outside the event loop are
+#   handed to it with call_soon_threadsafe
+# - Bounded per-subscriber queues: a subscriber that can't keep up loses its
+#   oldest events (and is told how many), it never slows down the publisher
+#   or the other subscribers
+#
+# Publishing to a session nobody watches is a single dictionary lookup, so the
+# chat path pays nothing when no counselor is connected. Several counselors
+# can watch one generation live without any extra model calls.
+# ===============================================================================
+
+from collections import deque
+from typing import Any, Dict, Optional, Set
+import asyncio
+import threading
+
+
+class TooManySubscribersError(Exception):
+    """Raised when a session (or the whole broker) has no room for another subscriber."""
+
+# ===============================================================================
+# SUBSCRIPTION
+# ===============================================================================
+
+class Subscription:
+    """
+    One subscriber's view of a session: a bounded queue that drops its oldest
+    event when full. Only used on the event loop thread.
+    """
+
+    def __init__(self, session_id: str, max_events: int):
+        self.session_id = session_id
+        self._events: deque = deque(maxlen=max_events)
+        self._ready = asyncio.Event()
+        self.dropped = 0          # Dropped since the last get() (reported to the subscriber)
+        self.dropped_total = 0
+
+    def push(self, event: Dict[str, Any]):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+            self.dropped_total += 1
+        self._events.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout: Seconds to wait (None = forever)
+
+        Returns:
+            The next event, a {"type": "dropped", "count": N} event first if
+            events were lost, or None on timeout
+        """
+        while not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.dropped:
+            count, self.dropped = self.dropped, 0
+            return {"type": "dropped", "count": count}
+        return self._events.popleft()
+
+# ===============================================================================
+# BROKER
+# ===============================================================================
+
+class SessionBroker:
+    """
+    Session ID -> subscriptions. Subscribe and unsubscribe on the event loop;
+    publish from anywhere.
+    """
+
+    def __init__(self, max_events: int = 256, max_per_session: int = 20, max_total: int = 500):
+        """
+        Args:
+            max_events: Events queued per subscriber before the oldest are dropped
+            max_per_session: Subscribers allowed on one session
+            max_total: Subscribers allowed in total
+        """
+        self.max_events = max_events
+        self.max_per_session = max_per_session
+        self.max_total = max_total
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self._dropped_closed = 0  # Dropped by subscriptions that have ended
+
+    def subscribe(self, session_id: str) -> Subscription:
+        """
+        Start receiving a session's events (call from the event loop).
+
+        Raises:
+            TooManySubscribersError: The session or the broker is full
+        """
+        if self.subscribers >= self.max_total:
+            raise TooManySubscribersError("Too many live subscribers, try again later")
+        topic = self._topics.setdefault(session_id, set())
+        if len(topic) >= self.max_per_session:
+            raise TooManySubscribersError("Too many live subscribers for this session")
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        subscription = Subscription(session_id, self.max_events)
+        topic.add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        topic = self._topics.get(subscription.session_id)
+        if topic is None or subscription not in topic:
+            return
+        topic.discard(subscription)
+        self.subscribers -= 1
+        self._dropped_closed += subscription.dropped_total
+        if not topic:
+            del self._topics[subscription.session_id]
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return session_id in self._topics
+
+    def publish(self, session_id: str, event: Dict[str, Any]):
+        """
+        Send an event to everyone watching a session. Never blocks; safe to
+        call from any thread.
+        """
+        if session_id not in self._topics:
+            return
+        self.published += 1
+        if threading.get_ident() == self._loop_thread:
+            self._deliver(session_id, event)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, session_id, event)
+
+    def _deliver(self, session_id: str, event: Dict[str, Any]):
+        for subscription in self._topics.get(session_id, ()):
+            subscription.push(event)
+            self.delivered += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "sessions_watched": len(self._topics),
+            "subscribers": self.subscribers,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self._dropped_closed + sum(subscription.dropped_total
+                                                  for topic in list(self._topics.values()) for subscription in topic)
+        }
+
+# Global broker: features.py and chatbot.py publish, /admin/sessions/{id}/live subscribes
+session_broker = SessionBroker()
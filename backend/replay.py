@@ -0,0 +1,549 @@
+# ===============================================================================
+# REPLAY.PY - RE-DRIVE CAPTURED TRAFFIC AND COMPARE LATENCY DISTRIBUTIONS
+# ===============================================================================
+# This file handles:
+# - Reading a capture written by traffic_capture.py (TRAFFIC_CAPTURE_FILE)
+# - A fake Ollama that answers every prompt with as many tokens as the
+#   original request produced, at a fixed speed, so runs are repeatable and
+#   only the backend's own latency changes between builds
+# - Replaying the capture against a build: same endpoints, sessions, clients,
+#   retries and message sizes, at the original inter-arrival times or faster
+#   (messages are synthetic text of the original length)
+# - Comparing the latency distributions (p50/p90/p99 per endpoint) of two runs
+#   and failing if the new one is slower than the tolerance allows
+#
+# Usage (from the backend folder):
+#   python replay.py run traffic.ndjson --out base.ndjson            # starts this build on a fake Ollama
+#   python replay.py run traffic.ndjson --speed 4 --out new.ndjson   # 4x the original request rate
+#   python replay.py compare base.ndjson new.ndjson --tolerance 1.2
+#   python replay.py summary traffic.ndjson                          # latencies seen in production
+#
+# To replay against a server started some other way, point its OLLAMA_BASE_URL
+# at `python replay.py fake-ollama traffic.ndjson --port 11435` and use
+# `run --url`.
+# ===============================================================================
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Neutral words for synthetic messages (no crisis or spam triggers)
+FILLER_WORDS = [
+    "today", "class", "week", "study", "friends", "library", "project", "morning", "notes",
+    "lecture", "coffee", "weekend", "schedule", "group", "assignment", "campus", "music",
+    "evening", "plan", "reading", "walk", "lunch", "exam", "topic", "semester", "room",
+    "quiet", "busy", "late", "early", "long", "short", "maybe", "really", "still", "again",
+]
+
+# Percentiles compared between runs
+PERCENTILES = (50, 90, 99)
+
+# ===============================================================================
+# TRACES
+# ===============================================================================
+
+def load_traces(path: str, max_gap: float = 10.0) -> List[Dict[str, Any]]:
+    """
+    Read a capture file, oldest request first.
+
+    Every trace gets an `offset` (seconds from the first request). Gaps longer
+    than `max_gap` (idle nights, restarts between segments) are shortened to
+    `max_gap`. It also gets a `message` number: retries (same idempotency key)
+    share the number of the first attempt, so they resend the same message.
+    """
+    traces = []
+    segment_start = 0.0
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "v" in record:
+                # Segment header: trace times are relative to its start
+                segment_start = datetime.fromisoformat(record["start"]).timestamp() if "start" in record else 0.0
+                continue
+            record["at"] = segment_start + record.get("t", 0) / 1000
+            traces.append(record)
+    traces.sort(key=lambda r: r["at"])
+
+    offset = 0.0
+    first_attempts: Dict[tuple, int] = {}
+    for index, record in enumerate(traces):
+        if index:
+            offset += min(max(record["at"] - traces[index - 1]["at"], 0.0), max_gap)
+        record["offset"] = offset
+        if record.get("rk"):
+            record["message"] = first_attempts.setdefault((record.get("sh"), record["rk"]), index)
+        else:
+            record["message"] = index
+    return traces
+
+
+def synthetic_message(index: int, length: int) -> str:
+    """
+    Neutral text of about `length` characters, the same for the same trace
+    every time. It starts with a unique tag so the fake Ollama can tell
+    requests apart.
+    """
+    rng = random.Random(index)
+    words = [f"r{index}"]
+    size = len(words[0])
+    while size < length:
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length].rstrip()
+
+
+def expected_tokens(traces: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Synthetic message -> output tokens its original request produced."""
+    return {synthetic_message(t["message"], t["ml"]): t["ot"] for t in traces if "ml" in t and "ot" in t}
+
+# ===============================================================================
+# FAKE OLLAMA
+# ===============================================================================
+
+class FakeOllama:
+    """
+    Stands in for Ollama's /api/generate and /api/ps. A prompt whose user
+    message is in `tokens` gets that many tokens back; anything else (and
+    summaries) gets `default_tokens`.
+    """
+
+    def __init__(self, tokens: Dict[str, int], model: str = "gemma3:latest", first_token_ms: float = 150,
+                 token_ms: float = 20, default_tokens: int = 60):
+        """
+        Args:
+            tokens: User message -> number of tokens to answer with
+            model: Model name reported by /api/ps
+            first_token_ms: Delay before the first token (prompt processing)
+            token_ms: Delay between tokens
+            default_tokens: Tokens for prompts not found in `tokens`
+        """
+        self.tokens = tokens
+        self.model = model
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.default_tokens = default_tokens
+        self.calls = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def tokens_for(self, prompt: str) -> int:
+        # Prompts end with "User: <message>\n\nMindCareAI:" (see create_enhanced_prompt)
+        start = prompt.rfind("User: ")
+        end = prompt.rfind("\n\nMindCareAI:")
+        if start < 0 or end < start:
+            return self.default_tokens
+        return self.tokens.get(prompt[start + len("User: "):end], self.default_tokens)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send_json({"models": [{"name": fake.model}]})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                prompt = payload.get("prompt", "")
+                fake.calls += 1
+                if not prompt:
+                    # Warm-up request: just "load" the model
+                    return self._send_json({"model": fake.model, "response": "", "done": True})
+                count = fake.tokens_for(prompt)
+                time.sleep(fake.first_token_ms / 1000)
+                if not payload.get("stream", True):
+                    time.sleep(count * fake.token_ms / 1000)
+                    return self._send_json({"response": " ".join(["word"] * count), "done": True})
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(count):
+                    if i:
+                        time.sleep(fake.token_ms / 1000)
+                    self._chunk(json.dumps({"response": " word" if i else "Word", "done": False}) + "\n")
+                self._chunk(json.dumps({"response": "", "done": True, "eval_count": count}) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, text: str):
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self, port: int = 0) -> str:
+        """Serve in a background thread. Returns the base URL."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+# ===============================================================================
+# REPLAY
+# ===============================================================================
+
+class Replayer:
+    """
+    Sends the captured requests to `base_url` at their (scaled) original
+    times. Requests are dispatched on schedule whether or not earlier ones
+    have finished, as real clients would.
+    """
+
+    def __init__(self, base_url: str, traces: List[Dict[str, Any]], speed: float = 1.0,
+                 workers: int = 200, timeout: float = 120.0):
+        """
+        Args:
+            base_url: Backend to replay against
+            traces: From load_traces()
+            speed: Request rate multiplier (2 = twice as fast as captured)
+            workers: Requests that can be in flight at once
+            timeout: Seconds before a request counts as failed
+        """
+        self.base_url = base_url.rstrip("/")
+        self.traces = traces
+        self.speed = speed
+        self.workers = workers
+        self.timeout = timeout
+        # Captured hashes -> fresh IDs for this run
+        self._sessions: Dict[str, str] = {}
+        self._clients: Dict[str, str] = {}
+        self._retry_keys: Dict[str, str] = {}
+        self._ids_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _mapped(self, table: Dict[str, str], key: Optional[str], make) -> Optional[str]:
+        if key is None:
+            return None
+        with self._ids_lock:
+            if key not in table:
+                table[key] = make(len(table))
+            return table[key]
+
+    def _http(self):
+        # One connection pool per worker thread
+        import requests
+
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, trace: Dict[str, Any], late_ms: float) -> Dict[str, Any]:
+        """Send one captured request and time it like the capture middleware does."""
+        session_id = self._mapped(self._sessions, trace.get("sh"), lambda n: str(uuid.uuid4()))
+        client_ip = self._mapped(self._clients, trace.get("ch"),
+                                 lambda n: f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}")
+        retry_key = self._mapped(self._retry_keys, trace.get("rk"), lambda n: str(uuid.uuid4()))
+
+        route = trace["p"]
+        path = route.replace("{session_id}", session_id or str(uuid.uuid4()))
+        headers = {"X-Forwarded-For": client_ip} if client_ip else {}
+        if retry_key:
+            headers["Idempotency-Key"] = retry_key
+        body = None
+        if "ml" in trace:
+            body = {"message": synthetic_message(trace["message"], trace["ml"])}
+            if session_id and route != "/crisis-check":
+                body["session_id"] = session_id
+
+        result = {"p": route, "m": trace.get("m", "GET"), "late": round(late_ms, 1)}
+        start = time.perf_counter()
+        first_byte = None
+        content = b""
+        try:
+            with self._http().request(result["m"], self.base_url + path, json=body, headers=headers,
+                                      timeout=self.timeout, stream=True) as response:
+                result["s"] = response.status_code
+                for chunk in response.iter_content(chunk_size=None):
+                    if chunk and first_byte is None:
+                        first_byte = time.perf_counter()
+                    content += chunk
+        except Exception as e:
+            result["s"] = 0
+            result["error"] = type(e).__name__
+        end = time.perf_counter()
+
+        # Endpoints report most errors with status 200 and an error body
+        text = content.decode("utf-8", "replace")
+        failed = (result["s"] != 200 or "event: error" in text or "event: fallback" in text
+                  or (text.startswith("{") and '"error"' in text))
+        result["ok"] = 0 if failed else 1
+        result["f"] = round((first_byte - start) * 1000, 1) if first_byte else None
+        result["d"] = round((end - start) * 1000, 1)
+        return result
+
+    def run(self) -> List[Dict[str, Any]]:
+        """Replay every trace. Returns one result per trace, in trace order."""
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            began = time.perf_counter()
+            for trace in self.traces:
+                due = began + trace["offset"] / self.speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                late_ms = max(time.perf_counter() - due, 0.0) * 1000
+                futures.append(pool.submit(self.send, trace, late_ms))
+        return [future.result() for future in futures]
+
+# ===============================================================================
+# LOCAL SERVER
+# ===============================================================================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(ollama_url: str, model: str, archive_dir: str, timeout: float = 30.0):
+    """
+    Start this build with uvicorn, wired to the fake Ollama.
+
+    Returns:
+        (server process, base URL)
+    """
+    port = _free_port()
+    env = dict(os.environ, OLLAMA_BASE_URL=ollama_url, OLLAMA_MODEL=model,
+               ARCHIVE_DIR=archive_dir, TRAFFIC_CAPTURE_FILE="")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "chatbot:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1) as response:
+                if response.status == 200:
+                    return server, url
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise TimeoutError(f"Server did not answer {url}/health within {timeout}s")
+
+# ===============================================================================
+# LATENCY DISTRIBUTIONS
+# ===============================================================================
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no values)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)]
+
+
+def load_latencies(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Latencies per endpoint from a capture or a replay result file.
+
+    Returns:
+        {route: {"count", "errors", "d": [total ms], "f": [first byte ms]}}
+    """
+    routes: Dict[str, Dict[str, Any]] = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "v" in record:
+                continue
+            stats = routes.setdefault(record["p"], {"count": 0, "errors": 0, "d": [], "f": []})
+            stats["count"] += 1
+            ok = record.get("ok", 1 if record.get("s") == 200 else 0)
+            if not ok:
+                stats["errors"] += 1
+                continue
+            stats["d"].append(record["d"])
+            if record.get("f") is not None:
+                stats["f"].append(record["f"])
+    return routes
+
+
+def print_summary(routes: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<28} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9}   (total ms)")
+    print("-" * 78)
+    for route, stats in sorted(routes.items()):
+        values = [percentile(stats["d"], q) for q in PERCENTILES]
+        cells = "".join(f"{v:>9.1f}" if v is not None else f"{'-':>9}" for v in values)
+        print(f"{route:<28} {stats['count']:>7} {stats['errors']:>7} {cells}")
+
+
+def compare(base: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]], tolerance: float,
+            min_samples: int, min_delta_ms: float) -> List[str]:
+    """
+    Print the percentiles of two runs side by side.
+
+    Returns:
+        Descriptions of the regressions found
+    """
+    regressions = []
+    print(f"{'endpoint':<28} {'metric':<8} {'base':>9} {'new':>9} {'ratio':>7}")
+    print("-" * 66)
+    for route in sorted(set(base) & set(new)):
+        b, n = base[route], new[route]
+        for metric, label in (("d", "total"), ("f", "first")):
+            if len(b[metric]) < min_samples or len(n[metric]) < min_samples:
+                continue
+            for q in PERCENTILES:
+                before, after = percentile(b[metric], q), percentile(n[metric], q)
+                ratio = after / before if before else float("inf")
+                flag = ""
+                if ratio > tolerance and after - before > min_delta_ms:
+                    flag = "  << SLOWER"
+                    regressions.append(f"{route} {label} p{q}: {before:.1f}ms -> {after:.1f}ms ({ratio:.2f}x)")
+                print(f"{route:<28} {label + ' p' + str(q):<8} {before:>9.1f} {after:>9.1f} {ratio:>6.2f}x{flag}")
+        base_rate = b["errors"] / b["count"]
+        new_rate = n["errors"] / n["count"]
+        if new_rate > base_rate + 0.01:
+            regressions.append(f"{route} error rate: {base_rate:.1%} -> {new_rate:.1%}")
+    return regressions
+
+# ===============================================================================
+# MAIN
+# ===============================================================================
+
+def _write_results(path: str, header: Dict[str, Any], results: List[Dict[str, Any]]):
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(json.dumps(header) + "\n")
+        for result in results:
+            fh.write(json.dumps({k: v for k, v in result.items() if v is not None}, separators=(",", ":")) + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latency distributions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Replay a capture against a build")
+    run_cmd.add_argument("--url", help="Replay against this running server (default: start this build)")
+    run_cmd.add_argument("--speed", type=float, default=1.0, help="Request rate multiplier (default: 1)")
+    run_cmd.add_argument("--max-gap", type=float, default=10.0,
+                         help="Shorten pauses between requests to at most this many seconds")
+    run_cmd.add_argument("--limit", type=int, help="Replay only the first N requests")
+    run_cmd.add_argument("--workers", type=int, default=200, help="Requests in flight at most")
+    run_cmd.add_argument("--out", required=True, help="Result file (compare it with `compare`)")
+
+    fake_cmd = commands.add_parser("fake-ollama", help="Only run the fake Ollama (for `run --url`)")
+    fake_cmd.add_argument("--port", type=int, default=11435, help="Port to listen on")
+
+    for command in (run_cmd, fake_cmd):
+        command.add_argument("trace", help="Capture file (TRAFFIC_CAPTURE_FILE)")
+        command.add_argument("--model", default="gemma3:latest", help="Model name the fake Ollama reports")
+        command.add_argument("--first-token-ms", type=float, default=150, help="Fake Ollama: delay to first token")
+        command.add_argument("--token-ms", type=float, default=20, help="Fake Ollama: delay between tokens")
+
+    summary_cmd = commands.add_parser("summary", help="Latency percentiles of a capture or result file")
+    summary_cmd.add_argument("file")
+
+    compare_cmd = commands.add_parser("compare", help="Compare two runs (exit code 1 on a regression)")
+    compare_cmd.add_argument("base", help="Baseline result (or capture) file")
+    compare_cmd.add_argument("new", help="New result file")
+    compare_cmd.add_argument("--tolerance", type=float, default=1.2,
+                             help="Fail if a percentile grows by more than this factor (default: 1.2)")
+    compare_cmd.add_argument("--min-samples", type=int, default=20,
+                             help="Skip endpoints with fewer successful requests than this")
+    compare_cmd.add_argument("--min-delta-ms", type=float, default=5.0,
+                             help="Ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        print_summary(load_latencies(args.file))
+        return 0
+
+    if args.command == "compare":
+        regressions = compare(load_latencies(args.base), load_latencies(args.new),
+                              args.tolerance, args.min_samples, args.min_delta_ms)
+        if regressions:
+            print("\nLATENCY REGRESSIONS:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print("\nLatencies within tolerance.")
+        return 0
+
+    traces = load_traces(args.trace)
+    fake = FakeOllama(expected_tokens(traces), model=args.model,
+                      first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+
+    if args.command == "fake-ollama":
+        print(f"Fake Ollama on {fake.start(args.port)} ({len(fake.tokens)} known prompts), Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            fake.stop()
+        return 0
+
+    if args.limit:
+        traces = traces[:args.limit]
+    if not traces:
+        print(f"No requests in {args.trace}")
+        return 1
+    server = None
+    archive_dir = None
+    url = args.url
+    if url is None:
+        archive_dir = tempfile.TemporaryDirectory()
+        server, url = start_backend(fake.start(), args.model, archive_dir.name)
+    print(f"Replaying {len(traces)} requests ({traces[-1]['offset'] / args.speed:.0f}s at {args.speed:g}x) against {url}")
+    try:
+        results = Replayer(url, traces, speed=args.speed, workers=args.workers).run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        fake.stop()
+        if archive_dir is not None:
+            archive_dir.cleanup()
+
+    _write_results(args.out, {"v": 1, "run": datetime.now().isoformat(timespec="seconds"),
+                              "trace": args.trace, "speed": args.speed, "target": args.url or "local"}, results)
+    late = [r["late"] for r in results]
+    print_summary(load_latencies(args.out))
+    print(f"\nDispatch delay p99: {percentile(late, 99):.1f}ms (high values mean --workers is too low)")
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# ===============================================================================
+# RESPONSE_CACHE.PY - PRE-SERIALIZED, PRE-COMPRESSED JSON RESPONSES
+# ===============================================================================
+# This file handles:
+# - Fast JSON serialization for every response (orjson when installed)
+# - Caching payloads that rarely change as ready-to-send bytes, together with
+#   gzip/brotli versions and an ETag
+# - Answering conditional requests (If-None-Match) with 304 Not Modified
+#
+# orjson and brotli are optional: without them we fall back to the standard
+# json module and gzip-only compression.
+# ===============================================================================
+
+from typing import Any, Callable, Dict, Hashable
+import gzip
+import hashlib
+import json
+import threading
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # optional: much faster JSON encoding
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # optional: smaller responses than gzip for browsers that support it
+except ImportError:
+    brotli = None
+
+# ===============================================================================
+# FAST JSON SERIALIZATION
+# ===============================================================================
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (orjson if available)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse that uses orjson when installed and compact separators otherwise.
+    Used as the app's default response class, so it applies to every endpoint
+    that returns a dict.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+# ===============================================================================
+# CACHED PAYLOADS
+# ===============================================================================
+
+class CachedPayload:
+    """
+    A JSON payload serialized and compressed once, ready to be sent many times.
+    """
+
+    def __init__(self, content: Any):
+        self.body = dumps(content)
+        self.gzip_body = gzip.compress(self.body, compresslevel=9)
+        self.br_body = brotli.compress(self.body, quality=11) if brotli is not None else None
+        # Strong ETag: the hash of the uncompressed body
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+    def select_encoding(self, accept_encoding: str):
+        """
+        Pick the smallest body the client accepts.
+
+        Returns:
+            (body bytes, Content-Encoding value or None)
+        """
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        if self.br_body is not None and "br" in accepted:
+            return self.br_body, "br"
+        if "gzip" in accepted:
+            return self.gzip_body, "gzip"
+        return self.body, None
+
+
+class ResponseCache:
+    """
+    Holds CachedPayloads by key. A key should include whatever the payload
+    depends on (e.g. the current personality), so a configuration change simply
+    produces a new key instead of needing an explicit invalidation.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, CachedPayload] = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any]) -> CachedPayload:
+        """
+        Get the cached payload for `key`, building it with `builder()` on a miss.
+        """
+        payload = self._entries.get(key)
+        if payload is not None:
+            return payload
+
+        payload = CachedPayload(builder())
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Tiny cache of rarely-changing payloads: just start over
+                self._entries.clear()
+            self._entries[key] = payload
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cached_json_response(request: Request, payload: CachedPayload,
+                         cache_control: str = "no-cache") -> Response:
+    """
+    Build the HTTP response for a cached payload.
+
+    Args:
+        request: Incoming request (for If-None-Match and Accept-Encoding)
+        payload: The pre-serialized payload
+        cache_control: Cache-Control header value
+
+    Returns:
+        304 Not Modified if the client already has this version, otherwise the
+        (possibly compressed) JSON body
+    """
+    headers = {
+        "ETag": payload.etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and payload.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    body, encoding = payload.select_encoding(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Global cache for the static-ish endpoints (/resources, /personality)
+response_cache = ResponseCache()
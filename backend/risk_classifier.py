@@ -0,0 +1,429 @@
+# ===============================================================================
+# RISK_CLASSIFIER.PY - VECTORIZED CRISIS RISK SCORING
+# ===============================================================================
+# This file handles:
+# - Turning messages into hashed n-gram vectors (words, word pairs and
+#   character trigrams, so paraphrases and typos still overlap)
+# - Scoring a batch of messages against prototype phrases with one NumPy
+#   matrix multiplication, and turning the result into a calibrated risk
+#   probability (Platt scaling)
+# - Micro-batching: concurrent requests are collected for a couple of
+#   milliseconds and scored together in a worker thread, off the event loop
+#
+# It complements TherapyAssistant.detect_crisis (literal phrases). Paraphrases
+# like "I don't want to be here anymore" contain none of those phrases, but
+# they are close to the risk prototypes below.
+#
+# NumPy is imported on first use. Without it the classifier reports itself
+# unavailable and callers keep using keyword detection only.
+# ===============================================================================
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import re
+import threading
+import zlib
+
+# Hashed feature space (a power of two, so hashes are masked, not divided)
+FEATURE_DIMS = 1 << 13
+
+# Relative weight of each feature kind
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 1.5
+CHAR_TRIGRAM_WEIGHT = 0.35
+
+# Risk probabilities at or above these are "elevated" / "high"
+ELEVATED_RISK = 0.5
+HIGH_RISK = 0.8
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# ===============================================================================
+# PROTOTYPES AND CALIBRATION EXAMPLES
+# ===============================================================================
+
+# Messages that should be treated as a risk to the student's safety
+RISK_PROTOTYPES = [
+    "i want to kill myself",
+    "i want to die",
+    "i dont want to be alive anymore",
+    "i dont want to be here anymore",
+    "i wish i could disappear forever",
+    "i wish i wasnt alive",
+    "i wish i was dead",
+    "everyone would be better off without me",
+    "nobody would miss me if i was gone",
+    "i cant do this anymore i want it all to end",
+    "i just want it all to stop forever",
+    "i have no reason to live",
+    "theres no point in living",
+    "life isnt worth living",
+    "i am thinking about ending it",
+    "i have been thinking about suicide",
+    "i want to end my life",
+    "i am going to take all my pills",
+    "i have been cutting myself again",
+    "i hurt myself on purpose",
+    "i want to hurt myself",
+    "i wrote a goodbye note",
+    "this is my last night",
+    "i am saying goodbye to everyone",
+    "i feel completely hopeless and trapped",
+    "i dont see a way out",
+    "i am a burden to everyone",
+    "i want to go to sleep and never wake up",
+    "i cant go on like this",
+    "i planned how i would do it",
+    "i feel like ending it all",
+    "i am done with life",
+    "whats the point of anything anymore",
+    "i think about dying all the time",
+    "i dont want to wake up tomorrow",
+]
+
+# Everyday student messages, including stressed ones, that are not a safety risk
+SAFE_PROTOTYPES = [
+    "i am stressed about my exams",
+    "i have so many assignments due this week",
+    "my grades are dropping and i am worried",
+    "i cant sleep before my exams",
+    "i had a fight with my roommate",
+    "i feel lonely since i moved to college",
+    "my parents keep comparing me to my cousin",
+    "i am anxious about my presentation tomorrow",
+    "i had a panic attack in the library",
+    "can you help me make a study schedule",
+    "i procrastinated all week and now i am behind",
+    "i feel tired all the time",
+    "thanks that breathing exercise helped",
+    "i want to do better this semester",
+    "i dont want to go to class today",
+    "i am so done with this assignment",
+    "this exam is killing me",
+    "i am dying to go home for the break",
+    "i broke up with my girlfriend and i am sad",
+    "i miss my friends from home",
+    "i want to be here for my friends",
+    "how do i deal with test anxiety",
+    "i feel overwhelmed by everything i have to do",
+    "i am nervous about my internship interview",
+    "hi how are you",
+    "hey",
+    "hello there",
+    "ok thanks",
+    "i dont want to be here in this class",
+    "my pet died and i miss him",
+    "i couldnt get out of bed for class this week",
+    "i want to drop this class",
+    "my professor is really strict",
+    "i cant focus on studying",
+    "i feel like i am not good enough for my major",
+    "i am worried about money and rent",
+]
+
+# Labelled messages (1 = risk) used only to fit the score calibration.
+# They are deliberately different from the prototypes.
+CALIBRATION_EXAMPLES: List[Tuple[str, int]] = [
+    ("honestly i dont want to exist anymore", 1),
+    ("i keep thinking everyone would be happier if i was gone", 1),
+    ("i cant take it anymore i want to end everything", 1),
+    ("there is no point to any of this i want to die", 1),
+    ("i have the pills ready", 1),
+    ("i hurt myself again last night", 1),
+    ("i dont think i will be around much longer", 1),
+    ("i feel so hopeless i cant go on", 1),
+    ("i want to disappear and never come back", 1),
+    ("nobody would even notice if i died", 1),
+    ("i just want to sleep forever", 1),
+    ("i have been thinking about killing myself", 1),
+    ("i feel trapped and i dont see any way out", 1),
+    ("goodbye everyone this is the end", 1),
+    ("i am worthless and a burden to my family", 1),
+    ("my exams start next week and i am freaking out", 0),
+    ("i got a bad grade on my midterm", 0),
+    ("my roommate is so messy and it annoys me", 0),
+    ("i want to change my major", 0),
+    ("i feel a bit down today", 0),
+    ("this homework is going to kill me lol", 0),
+    ("i am so tired of studying", 0),
+    ("can you give me tips for sleeping better", 0),
+    ("i dont want to be here in this boring lecture", 0),
+    ("i miss home and my dog", 0),
+    ("i am nervous about making new friends", 0),
+    ("how can i stop procrastinating", 0),
+    ("i failed my quiz and i feel stupid", 0),
+    ("i want to get better grades", 0),
+    ("thank you this really helped me", 0),
+    ("hi", 0),
+    ("good morning", 0),
+    ("yes", 0),
+    ("i want to quit my part time job", 0),
+    ("my grandma passed away last month and i miss her", 0),
+    ("i wish this semester would end already", 0),
+    ("i feel like nothing matters and i want to die", 1),
+    ("im tired of living like this", 1),
+    ("i am going to end it tonight", 1),
+    ("i want to cut myself", 1),
+]
+
+# ===============================================================================
+# FEATURES
+# ===============================================================================
+
+def normalize(text: str) -> List[str]:
+    """Lowercase words, with apostrophes dropped ("don't" -> "dont")."""
+    return _WORD.findall(text.lower().replace("'", "").replace("’", ""))
+
+
+def hashed_features(text: str, dims: int = FEATURE_DIMS) -> Dict[int, float]:
+    """
+    Sparse hashed n-gram features of one message (not normalized).
+
+    Hashes use crc32, so vectors are the same in every process (Python's
+    hash() of strings changes between runs).
+
+    Returns:
+        feature index -> weight
+    """
+    words = normalize(text)
+    mask = dims - 1
+    features: Dict[int, float] = {}
+    crc32 = zlib.crc32
+    for i, word in enumerate(words):
+        encoded = word.encode()
+        index = crc32(b"w" + encoded) & mask
+        features[index] = features.get(index, 0.0) + WORD_WEIGHT
+        if i:
+            index = crc32(b"b" + words[i - 1].encode() + b" " + encoded) & mask
+            features[index] = features.get(index, 0.0) + BIGRAM_WEIGHT
+        padded = b" " + encoded + b" "
+        for j in range(len(padded) - 2):
+            index = crc32(b"c" + padded[j:j + 3]) & mask
+            features[index] = features.get(index, 0.0) + CHAR_TRIGRAM_WEIGHT
+    return features
+
+# ===============================================================================
+# CLASSIFIER
+# ===============================================================================
+
+class RiskClassifier:
+    """
+    Prototype-similarity risk classifier.
+
+    Each message vector is compared (cosine similarity) with every prototype
+    in one matrix multiplication. Its closest risk prototype and closest safe
+    prototype similarities go through a logistic model fitted on
+    CALIBRATION_EXAMPLES, giving a probability-like risk score.
+
+    Only hashed features that occur in some prototype can change a
+    similarity, so the matrices keep just those columns (a few hundred
+    instead of FEATURE_DIMS). The rest only count towards a message's norm.
+    """
+
+    def __init__(self, dims: int = FEATURE_DIMS, max_batch: int = 64, batch_window: float = 0.002):
+        """
+        Initialize the classifier (the model itself is built on first use).
+
+        Args:
+            dims: Size of the hashed feature space
+            max_batch: Messages scored together at most
+            batch_window: Seconds to wait for more messages before scoring a batch
+        """
+        self.dims = dims
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        self._np = None
+        self._columns: Dict[int, int] = {}   # Hashed feature -> matrix column
+        self._prototypes = None              # (columns x prototypes) float32, normalized
+        self._risk_count = 0                 # The first prototypes are the risk ones
+        self._weights = None                 # Logistic weights: risk sim, safe sim, bias
+        self._load_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.scored = 0
+        self.batches = 0
+
+    # --- Model ---------------------------------------------------------------
+
+    def load(self) -> bool:
+        """
+        Build the prototype matrix and fit the calibration (first call only).
+
+        Returns:
+            True if the classifier can be used (NumPy is installed)
+        """
+        with self._load_lock:
+            if self._weights is not None:
+                return True
+            if self._load_error is not None:
+                return False
+            try:
+                import numpy as np  # optional: needed for the risk classifier only
+            except ImportError:
+                self._load_error = "numpy not installed"
+                print("Warning: numpy not installed, risk classifier disabled. Install via 'pip install numpy'.")
+                return False
+            self._np = np
+
+            prototypes = RISK_PROTOTYPES + SAFE_PROTOTYPES
+            prototype_features = [hashed_features(text, self.dims) for text in prototypes]
+            for features in prototype_features:
+                for feature in features:
+                    self._columns.setdefault(feature, len(self._columns))
+            self._prototypes = np.ascontiguousarray(self._vectorize_features(prototype_features).T)
+            self._risk_count = len(RISK_PROTOTYPES)
+
+            texts, labels = zip(*CALIBRATION_EXAMPLES)
+            self._weights = self._fit_calibration(self._similarities(list(texts)),
+                                                  np.array(labels, dtype=np.float64))
+            return True
+
+    @property
+    def available(self) -> bool:
+        return self.load()
+
+    def _vectorize_features(self, feature_dicts: List[Dict[int, float]]):
+        """L2-normalized rows over the prototype columns (other features only count in the norm)."""
+        np = self._np
+        columns = self._columns
+        rows, cols, values = [], [], []
+        for row, features in enumerate(feature_dicts):
+            norm = sum(value * value for value in features.values()) ** 0.5 or 1.0
+            for feature, value in features.items():
+                column = columns.get(feature)
+                if column is not None:
+                    rows.append(row)
+                    cols.append(column)
+                    values.append(value / norm)
+        matrix = np.zeros((len(feature_dicts), len(columns)), dtype=np.float32)
+        matrix[rows, cols] = values
+        return matrix
+
+    def _similarities(self, texts: List[str]):
+        """(messages x 2): similarity to the closest risk and the closest safe prototype."""
+        np = self._np
+        similarity = self._vectorize_features([hashed_features(text, self.dims) for text in texts]) @ self._prototypes
+        return np.stack([similarity[:, :self._risk_count].max(axis=1),
+                         similarity[:, self._risk_count:].max(axis=1)], axis=1).astype(np.float64)
+
+    def _fit_calibration(self, similarities, labels, iterations: int = 50, ridge: float = 0.01):
+        """Fit sigmoid(w . [risk sim, safe sim, 1]) to the labels (Newton's method, Platt targets)."""
+        np = self._np
+        # Smoothed targets (as in Platt's paper) keep the fit from becoming overconfident
+        positives = labels.sum()
+        negatives = len(labels) - positives
+        targets = np.where(labels > 0, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+        features = np.hstack([similarities, np.ones((len(labels), 1))])
+        penalty = ridge * np.diag([1.0, 1.0, 0.0])
+        weights = np.zeros(features.shape[1])
+        for _ in range(iterations):
+            p = 1 / (1 + np.exp(-(features @ weights)))
+            gradient = features.T @ (p - targets) + penalty @ weights
+            hessian = (features * (p * (1 - p))[:, None]).T @ features + penalty + 1e-9 * np.eye(len(weights))
+            step = np.linalg.solve(hessian, gradient)
+            weights -= step
+            if np.abs(step).max() < 1e-8:
+                break
+        return weights
+
+    def score_batch(self, texts: List[str]) -> List[float]:
+        """
+        Risk scores for a batch of messages (blocking call - CPU work).
+
+        Returns:
+            One risk probability (0-1) per message
+
+        Raises:
+            RuntimeError: If NumPy is not installed
+        """
+        if not self.load():
+            raise RuntimeError(f"Risk classifier unavailable: {self._load_error}")
+        if not texts:
+            return []
+        np = self._np
+        scores = 1 / (1 + np.exp(-(self._similarities(texts) @ self._weights[:2] + self._weights[2])))
+        self.scored += len(texts)
+        self.batches += 1
+        return [round(float(score), 4) for score in scores]
+
+    # --- Micro-batching ------------------------------------------------------
+
+    async def score(self, text: str) -> Optional[float]:
+        """
+        Risk score for one message, batched with concurrent calls.
+
+        Returns:
+            Risk probability (0-1), or None if the classifier is unavailable
+        """
+        if self._load_error is not None:
+            return None
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        try:
+            return await future
+        except RuntimeError:
+            # NumPy missing (found out while loading)
+            return None
+
+    def _flush(self):
+        """Send the waiting messages to the worker thread as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._score_pending(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score_pending(self, batch: List[Tuple[str, asyncio.Future]]):
+        if self._executor is None:
+            # One worker: batches queue up behind each other instead of fighting for the GIL
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="risk-classifier")
+        try:
+            scores = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.score_batch, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(score)
+
+    def status(self) -> Dict[str, Any]:
+        """Classifier counters for the admin dashboard."""
+        return {
+            "available": self._weights is not None,
+            "error": self._load_error,
+            "scored": self.scored,
+            "batches": self.batches,
+            "average_batch": round(self.scored / self.batches, 1) if self.batches else None
+        }
+
+
+def risk_level(score: Optional[float]) -> Optional[str]:
+    """Bucket a risk score: "low", "elevated" or "high" (None if there is no score)."""
+    if score is None:
+        return None
+    if score >= HIGH_RISK:
+        return "high"
+    if score >= ELEVATED_RISK:
+        return "elevated"
+    return "low"
+
+# Global classifier used by /crisis-check
+risk_classifier = RiskClassifier()
@@ -0,0 +1,302 @@
+# ===============================================================================
+# SEARCH_INDEX.PY - INCREMENTAL FULL-TEXT SEARCH ACROSS CONVERSATIONS
+# ===============================================================================
+# This file handles:
+# - Splitting messages into search terms (lowercase words and codes like "cs101")
+# - An inverted index (term -> sessions that mention it) that is updated as
+#   messages are added, so nothing ever has to scan all conversations
+# - Indexing off the request path: storing a message only queues it, and a
+#   background task indexes the queue every second (a search, or removing a
+#   session, indexes whatever is still queued first, so results are never stale)
+# - Ranking matching sessions and pointing at the best message for a snippet
+#
+# Memory is bounded: each term remembers at most max_sessions_per_term sessions
+# (the most recently active ones), each posting keeps only its last few message
+# numbers, and the vocabulary stops growing at max_terms. Query time is bounded
+# too: only the max_candidates most recently active matching sessions are ranked.
+# Archived sessions keep their postings, so they stay searchable after they
+# leave memory; archive files are indexed once on startup (see archive.py).
+# Indexing the same message twice (e.g. when a session is restored) is a no-op.
+# ===============================================================================
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import Counter, deque
+import asyncio
+import heapq
+import math
+import re
+import threading
+
+# Words and codes: "panic", "cs101", "2nd"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{2,40}")
+
+# Very common words that would match almost every session
+STOPWORDS = frozenset("""
+a an and are as at be been but by can did do does for from had has have he her him his how i if in
+into is it its just me my no not of on or our she so than that the their them then there they this
+to too up us was we were what when where which who why will with you your im ive dont
+""".split())
+
+# ===============================================================================
+# TOKENIZATION AND SNIPPETS
+# ===============================================================================
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase search terms in `text` (stopwords removed, duplicates kept)."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def make_snippet(content: str, terms: Iterable[str], width: int = 160) -> str:
+    """
+    Cut a piece of `content` around the first query term it contains.
+
+    Args:
+        content: Full message text
+        terms: Query terms (lowercase)
+        width: Approximate snippet length in characters
+    """
+    lowered = content.lower()
+    positions = [p for p in (lowered.find(t) for t in terms) if p >= 0]
+    if len(content) <= width:
+        return content
+    center = min(positions) if positions else 0
+    start = max(0, center - width // 3)
+    end = min(len(content), start + width)
+    start = max(0, end - width)
+    return ("..." if start > 0 else "") + content[start:end].strip() + ("..." if end < len(content) else "")
+
+# ===============================================================================
+# INVERTED INDEX
+# ===============================================================================
+
+class SearchIndex:
+    """
+    Inverted index over conversation messages.
+
+    postings[term] maps session_id -> [term frequency, recent message seqs].
+    Python dicts keep insertion order, and a session is moved to the end
+    whenever it mentions the term again, so the first entry is always the
+    least recently active session (the one dropped when a term is full).
+    """
+
+    def __init__(self, max_sessions_per_term: int = 10000, max_seqs_per_posting: int = 8,
+                 max_terms: int = 500000, max_candidates: int = 2000, k1: float = 1.2,
+                 max_pending: int = 50000, flush_interval: float = 1.0):
+        """
+        Initialize an empty index.
+
+        Args:
+            max_sessions_per_term: Sessions remembered per term (oldest dropped first)
+            max_seqs_per_posting: Message numbers remembered per session and term
+            max_terms: Vocabulary limit; new terms beyond it are not indexed
+            max_candidates: Matching sessions ranked per query (most recently active first)
+            k1: Term frequency saturation for ranking (higher = repeats count more)
+            max_pending: Queued messages at most; beyond it add_message indexes the queue itself
+            flush_interval: Seconds between background indexing runs (see start())
+        """
+        self.max_sessions_per_term = max_sessions_per_term
+        self.max_seqs_per_posting = max_seqs_per_posting
+        self.max_terms = max_terms
+        self.max_candidates = max_candidates
+        self.k1 = k1
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        self.postings: Dict[str, Dict[str, list]] = {}
+        # Terms each session appears under, so a session can be removed cheaply
+        self.session_terms: Dict[str, Set[str]] = {}
+        # Messages indexed per session (seqs run 1, 2, 3...), so removing it keeps
+        # indexed_messages right and a message that is queued again is skipped
+        self.session_messages: Dict[str, int] = {}
+        self.indexed_messages = 0
+        self.dropped_postings = 0
+        # (session_id, seq, content) waiting to be indexed; deque appends are thread-safe
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_message(self, session_id: str, seq: int, content: str):
+        """
+        Queue one message for indexing (constant time; the caller may hold its own locks).
+
+        Args:
+            session_id: Session the message belongs to
+            seq: The message's sequence number in the session
+            content: Message text
+        """
+        self._pending.append((session_id, seq, content))
+        if len(self._pending) >= self.max_pending:
+            # Nobody is flushing (no event loop, e.g. scripts) or it fell far behind
+            self.flush()
+
+    def flush(self):
+        """Index every queued message (blocking - run it in a threadpool from async code)."""
+        with self._lock:
+            self._index_pending()
+
+    def _index_pending(self):
+        """Index the queue in the order messages were stored (hold _lock)."""
+        pending = self._pending
+        while pending:
+            self._index(*pending.popleft())
+
+    def _index(self, session_id: str, seq: int, content: str):
+        """Index one message (hold _lock). Cost depends only on the message length."""
+        indexed = self.session_messages.get(session_id, 0)
+        if seq <= indexed:
+            # Already indexed (restored session, or the archive indexed on startup)
+            return
+        self.session_messages[session_id] = indexed + 1
+        self.indexed_messages += 1
+        counts = Counter(tokenize(content))
+        if not counts:
+            return
+
+        known_terms = self.session_terms.setdefault(session_id, set())
+        for term, count in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                if len(self.postings) >= self.max_terms:
+                    continue
+                postings = self.postings[term] = {}
+
+            posting = postings.pop(session_id, None)
+            if posting is None:
+                posting = [0, []]
+                if len(postings) >= self.max_sessions_per_term:
+                    # Forget the least recently active session for this term
+                    del postings[next(iter(postings))]
+                    self.dropped_postings += 1
+            posting[0] += count
+            seqs = posting[1]
+            seqs.append(seq)
+            if len(seqs) > self.max_seqs_per_posting:
+                del seqs[0]
+            postings[session_id] = posting
+            known_terms.add(term)
+
+    def remove_session(self, session_id: str):
+        """Remove every posting of a session (when it is deleted, not when it is archived)."""
+        with self._lock:
+            # Queued messages of this session must not be indexed after it is gone
+            self._index_pending()
+            self.indexed_messages -= self.session_messages.pop(session_id, 0)
+            for term in self.session_terms.pop(session_id, ()):
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(session_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float, int, Optional[int]]]:
+        """
+        Find sessions that mention every term in `query`, best matches first.
+
+        Sessions are ranked by summed term weights (rarer terms weigh more,
+        repeats count with diminishing returns). Sessions where all terms occur
+        in the same message (e.g. "panic attack") get a boost.
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of sessions to return
+
+        Returns:
+            List of (session_id, score, total term hits, seq of the best message)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        with self._lock:
+            self._index_pending()
+            term_postings = [self.postings.get(term) for term in terms]
+            if any(not postings for postings in term_postings):
+                return []
+            # Start from the rarest term so the candidate set is as small as possible
+            term_postings.sort(key=len)
+            total_sessions = max(len(self.session_terms), 1)
+            weights = [math.log(1 + total_sessions / len(postings)) for postings in term_postings]
+
+            # Sessions containing every term
+            rarest = term_postings[0]
+            others = term_postings[1:]
+            if len(rarest) <= self.max_candidates:
+                # Few enough to intersect them all (set operations on dict keys run in C)
+                candidates = rarest.keys()
+                for postings in others:
+                    candidates = candidates & postings.keys()
+            else:
+                # Very common terms: rank only the most recently active matches.
+                # Walking the rarest term newest first stops early, instead of
+                # building an intersection of every session that mentions them
+                candidates = []
+                for session_id in reversed(rarest):
+                    for postings in others:
+                        if session_id not in postings:
+                            break
+                    else:
+                        candidates.append(session_id)
+                        if len(candidates) >= self.max_candidates:
+                            break
+
+            k1 = self.k1
+            weighted = list(zip(weights, term_postings))
+            scored = []
+            for session_id in candidates:
+                score = 0.0
+                hits = 0
+                for weight, postings in weighted:
+                    tf = postings[session_id][0]
+                    score += weight * tf / (tf + k1)
+                    hits += tf
+                scored.append((score, hits, session_id))
+
+            # Co-occurrence (all terms in one message) is only checked for the
+            # leading sessions; it re-orders them rather than re-ranking everything
+            best = []
+            for score, hits, session_id in heapq.nlargest(limit * 2, scored):
+                matched = [postings[session_id][1] for postings in term_postings]
+                # Best message: newest one containing every term, else the newest rare-term hit
+                common = set(matched[0]).intersection(*matched[1:]) if len(matched) > 1 else None
+                if common:
+                    score *= 1.5
+                    best_seq = max(common)
+                else:
+                    best_seq = matched[0][-1] if matched[0] else None
+                best.append((score, hits, session_id, best_seq))
+
+        best = heapq.nlargest(limit, best)
+        return [(session_id, round(score, 4), hits, best_seq) for score, hits, session_id, best_seq in best]
+
+    async def _flush_loop(self):
+        """Background loop: index the queue every flush_interval seconds."""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._pending:
+                await loop.run_in_executor(None, self.flush)
+
+    def start(self):
+        """Start indexing queued messages in the background (call on server startup)."""
+        self._task = asyncio.get_event_loop().create_task(self._flush_loop())
+
+    def stop(self):
+        """Stop the background indexing (call on server shutdown)."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Index size for the admin dashboard."""
+        with self._lock:
+            return {
+                "terms": len(self.postings),
+                "sessions": len(self.session_terms),
+                "indexed_messages": self.indexed_messages,
+                "pending_messages": len(self._pending),
+                "dropped_postings": self.dropped_postings
+            }
+
+# Global index updated by ConversationManager (features.py)
+search_index = SearchIndex()
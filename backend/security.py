@@ -8,11 +8,20 @@
 # - Request sanitization
 # ===============================================================================
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from datetime import datetime, timedelta
+import base64
+import hashlib
+import hmac
+import json
 import re
+import sys
+import time
 from collections import defaultdict, deque
 
+from settings import get_settings
+from stats import stats_registry
+
 # ===============================================================================
 # RATE LIMITING SYSTEM
 # ===============================================================================
@@ -35,7 +44,6 @@ class RateLimiter:
         self.time_window = time_window
         # Store timestamps of requests for each IP
         self.requests: Dict[str, deque] = defaultdict(deque)
-        print(f"Rate limiter initialized: {max_requests} requests per {time_window} seconds")
     
     def is_allowed(self, client_ip: str) -> tuple[bool, Optional[str]]:
         """
@@ -57,11 +65,35 @@ class RateLimiter:
         
         # Check if under the limit
         if len(client_requests) >= self.max_requests:
+            stats_registry.record_rate_limited()
             return False, f"Rate limit exceeded. Max {self.max_requests} requests per {self.time_window} seconds."
         
         # Record this request
         client_requests.append(now)
         return True, None
+    
+    def memory_usage(self) -> Dict[str, Any]:
+        """
+        How much the per-IP tracking holds (for the admin memory report).
+        Idle IPs have no requests inside the current window but keep their key.
+        
+        Returns:
+            Dictionary with key counts, stored timestamps and approximate bytes
+        """
+        cutoff_time = datetime.now() - timedelta(seconds=self.time_window)
+        entries = list(self.requests.items())
+        timestamps = sum(len(client_requests) for _, client_requests in entries)
+        idle = sum(1 for _, client_requests in entries if not client_requests or client_requests[-1] < cutoff_time)
+        # Every timestamp is a datetime of the same size
+        approx_bytes = sys.getsizeof(self.requests) + timestamps * sys.getsizeof(cutoff_time) + sum(
+            sys.getsizeof(ip) + sys.getsizeof(client_requests) for ip, client_requests in entries
+        )
+        return {
+            "keys": len(entries),
+            "idle_keys": idle,
+            "timestamps": timestamps,
+            "approx_bytes": approx_bytes
+        }
 
 # ===============================================================================
 # INPUT VALIDATION
@@ -78,16 +110,29 @@ class InputValidator:
         self.MIN_MESSAGE_LENGTH = 1
         self.MAX_SESSION_ID_LENGTH = 100
         
-        # Harmful patterns to detect (basic protection)
-        self.HARMFUL_PATTERNS = [
-            r'<script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>',  # Script tags
-            r'javascript:',  # JavaScript protocols
-            r'vbscript:',    # VBScript protocols
-            r'on\w+\s*=',    # Event handlers
-        ]
+        # Harmful content to detect (basic protection).
+        # Every check below runs in linear time over the message, so a crafted
+        # input near MAX_MESSAGE_LENGTH can't make the regex engine backtrack.
+        # The old backtracking patterns these replace were:
+        #   <script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>   (script tags)
+        #   javascript: / vbscript:                            (script protocols)
+        #   on\w+\s*=                                           (event handlers)
+        self.HARMFUL_PROTOCOLS = ('javascript:', 'vbscript:')
+        self.SCRIPT_OPEN_TAG = '<script'
+        self.SCRIPT_CLOSE_TAG = '</script>'
         
-        self.compiled_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in self.HARMFUL_PATTERNS]
-        print("Input validator initialized with security patterns")
+        # Event handlers: "\b" stops the engine from retrying inside a word, so
+        # each word is matched at most once. The "on" check happens in Python.
+        self.assignment_pattern = re.compile(r'\b(\w+)\s*=')
+        
+        # Same character 11 times in a row. A fixed count (instead of {10,})
+        # caps the work per start position at 11 steps.
+        self.repeated_char_pattern = re.compile(r'(.)\1{10}')
+        
+        self.whitespace_pattern = re.compile(r'\s+')
+        self.session_id_pattern = re.compile(
+            r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE
+        )
     
     def validate_message(self, message: str) -> tuple[bool, Optional[str]]:
         """
@@ -111,9 +156,8 @@ class InputValidator:
             return False, f"Message too long (maximum {self.MAX_MESSAGE_LENGTH} characters)"
         
         # Check for harmful content
-        for pattern in self.compiled_patterns:
-            if pattern.search(message):
-                return False, "Message contains potentially harmful content"
+        if self._contains_harmful_content(message):
+            return False, "Message contains potentially harmful content"
         
         # Check for excessive repetition (spam detection)
         if self._is_spam_message(message):
@@ -138,12 +182,64 @@ class InputValidator:
             return False, f"Session ID too long (maximum {self.MAX_SESSION_ID_LENGTH} characters)"
         
         # Check for valid UUID format (our session IDs are UUIDs)
-        uuid_pattern = r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
-        if not re.match(uuid_pattern, session_id, re.IGNORECASE):
+        if not self.session_id_pattern.match(session_id):
             return False, "Invalid session ID format"
         
         return True, None
     
+    def _contains_harmful_content(self, message: str) -> bool:
+        """
+        Detect script tags, script protocols and inline event handlers.
+        
+        Uses substring scans and a word-anchored regex, so the time taken
+        grows linearly with the message length, whatever the input.
+        
+        Args:
+            message: Message to check
+            
+        Returns:
+            True if the message contains potentially harmful content
+        """
+        lowered = message.lower()
+        
+        # Script protocols (plain substring search)
+        for protocol in self.HARMFUL_PROTOCOLS:
+            if protocol in lowered:
+                return True
+        
+        # Script tags: an opening "<script" (followed by a non-word character)
+        # with a closing "</script>" somewhere after it
+        if self._has_script_block(lowered):
+            return True
+        
+        # Event handlers: a word containing "on" plus at least one more
+        # character, followed by optional whitespace and "="
+        for match in self.assignment_pattern.finditer(lowered):
+            if 'on' in match.group(1)[:-1]:
+                return True
+        
+        return False
+    
+    def _has_script_block(self, lowered: str) -> bool:
+        """
+        Check a lowercased message for a <script ...> ... </script> block.
+        
+        Args:
+            lowered: Lowercased message
+            
+        Returns:
+            True if an opening script tag is followed by a closing one
+        """
+        start = lowered.find(self.SCRIPT_OPEN_TAG)
+        while start != -1:
+            end = start + len(self.SCRIPT_OPEN_TAG)
+            # Require a word boundary after "<script" (so "<scripts" doesn't count)
+            if end == len(lowered) or not (lowered[end].isalnum() or lowered[end] == '_'):
+                # The first valid opener decides: any closer after it is a match
+                return lowered.find(self.SCRIPT_CLOSE_TAG, end) != -1
+            start = lowered.find(self.SCRIPT_OPEN_TAG, end)
+        return False
+    
     def _is_spam_message(self, message: str) -> bool:
         """
         Detect if a message is likely spam based on repetition patterns.
@@ -155,17 +251,20 @@ class InputValidator:
             True if message appears to be spam
         """
         # Check for excessive character repetition
-        if re.search(r'(.)\1{10,}', message):  # Same character 10+ times
+        if self.repeated_char_pattern.search(message):  # Same character 10+ times
             return True
         
         # Check for excessive word repetition
         words = message.split()
         if len(words) > 3:
+            limit = len(words) * 0.5
             word_counts = {}
             for word in words:
-                word_counts[word.lower()] = word_counts.get(word.lower(), 0) + 1
-                if word_counts[word.lower()] > len(words) * 0.5:  # Word appears >50% of the time
+                word = word.lower()
+                count = word_counts.get(word, 0) + 1
+                if count > limit:  # Word appears >50% of the time
                     return True
+                word_counts[word] = count
         
         return False
     
@@ -180,13 +279,104 @@ class InputValidator:
             Cleaned message
         """
         # Remove excessive whitespace
-        message = re.sub(r'\s+', ' ', message.strip())
+        message = self.whitespace_pattern.sub(' ', message.strip())
         
         # Remove null characters
         message = message.replace('\x00', '')
         
         return message
 
+# ===============================================================================
+# ADMIN AUTHENTICATION
+# ===============================================================================
+
+class AdminAuthenticator:
+    """
+    Checks credentials for admin/counselor-only endpoints.
+    
+    Accepts either:
+    - An "X-Admin-Key" header matching the ADMIN_API_KEY environment variable
+    - An "Authorization: Bearer <jwt>" token issued by the Node auth server
+      (HS256, signed with JWT_SECRET) whose role is allowed
+    """
+    
+    def __init__(self, allowed_roles: Iterable[str] = ("admin", "counselor")):
+        self.allowed_roles = set(allowed_roles)
+    
+    @staticmethod
+    def _b64decode(segment: str) -> bytes:
+        return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    
+    def _verify_jwt(self, token: str, secret: str) -> Optional[Dict[str, Any]]:
+        """
+        Verify an HS256 JWT and return its claims (None if invalid or expired).
+        """
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(self._b64decode(header_b64))
+            if not isinstance(header, dict) or header.get("alg") != "HS256":
+                return None
+            expected = hmac.new(secret.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, self._b64decode(signature_b64)):
+                return None
+            claims = json.loads(self._b64decode(payload_b64))
+            # A validly signed token can still carry any JSON: reject it rather than fail
+            if not isinstance(claims, dict):
+                return None
+            if "exp" in claims:
+                exp = claims["exp"]
+                if isinstance(exp, bool) or not isinstance(exp, (int, float)) or exp < time.time():
+                    return None
+        except (ValueError, TypeError):
+            return None
+        return claims
+    
+    def verified_claims(self, headers) -> Optional[Dict[str, Any]]:
+        """
+        Claims of the request's bearer token, whatever its role (students too).
+        
+        Returns:
+            The claims, or None without a valid, unexpired token
+        """
+        auth_header = headers.get("authorization") or ""
+        jwt_secret = get_settings().jwt_secret
+        if not auth_header.lower().startswith("bearer ") or not jwt_secret:
+            return None
+        return self._verify_jwt(auth_header[7:].strip(), jwt_secret)
+    
+    def authorize(self, headers, allowed_roles: Optional[Iterable[str]] = None) -> tuple[bool, Optional[str]]:
+        """
+        Check whether a request may use an admin endpoint.
+        
+        Args:
+            headers: The request headers
+            allowed_roles: Roles allowed for this endpoint (default: admin and counselor)
+            
+        Returns:
+            (is_allowed: bool, error_message: Optional[str])
+        """
+        roles = set(allowed_roles) if allowed_roles is not None else self.allowed_roles
+        
+        settings = get_settings()
+        admin_key = settings.admin_api_key
+        provided_key = headers.get("x-admin-key")
+        # Compare bytes: compare_digest rejects non-ASCII str, and headers may carry any latin-1 text
+        if admin_key and provided_key and hmac.compare_digest(provided_key.encode("utf-8"),
+                                                              admin_key.encode("utf-8")):
+            return True, None
+        
+        auth_header = headers.get("authorization") or ""
+        jwt_secret = settings.jwt_secret
+        if auth_header.lower().startswith("bearer ") and jwt_secret:
+            claims = self._verify_jwt(auth_header[7:].strip(), jwt_secret)
+            if claims is None:
+                return False, "Invalid or expired token"
+            if claims.get("role") not in roles:
+                return False, "Your role is not allowed to use this endpoint"
+            return True, None
+        
+        return False, "Admin credentials required"
+
 # ===============================================================================
 # ERROR RESPONSE UTILITIES
 # ===============================================================================
@@ -244,9 +434,12 @@ class ErrorHandler:
 # Create global instances to be used across the application
 rate_limiter = RateLimiter(max_requests=20, time_window=60)  # 20 requests per minute
 input_validator = InputValidator()
+admin_auth = AdminAuthenticator(allowed_roles=("admin", "counselor"))
 error_handler = ErrorHandler()
 
-print("Security module loaded successfully!")
-print("- Rate limiter: 20 requests per 60 seconds")
-print("- Input validator: Message length 1-1000 chars, spam detection enabled")
-print("- Error handler: Standardized error responses")
\ No newline at end of file
+def print_security_summary():
+    """Print the security configuration (called once at server startup, not on import)."""
+    print("Security module loaded successfully!")
+    print(f"- Rate limiter: {rate_limiter.max_requests} requests per {rate_limiter.time_window} seconds")
+    print(f"- Input validator: Message length {input_validator.MIN_MESSAGE_LENGTH}-{input_validator.MAX_MESSAGE_LENGTH} chars, spam detection enabled")
+    print("- Error handler: Standardized error responses")
\ No newline at end of file
@@ -148,7 +148,7 @@ app.post('/student/login', async (req, res) => {
     let user = null; let selErr = null;
     let sel = await supabase
       .from('users')
-      .select('id,email,full_name,role,password_hash,metadata,is_email_verified')
+      .select('id,email,full_name,role,institute_name,password_hash,metadata,is_email_verified')
       .ilike('email', email)
       .maybeSingle();
     user = sel.data; selErr = sel.error || null;
@@ -156,7 +156,7 @@ app.post('/student/login', async (req, res) => {
       // Retry without password_hash
       sel = await supabase
         .from('users')
-        .select('id,email,full_name,role,metadata,is_email_verified')
+        .select('id,email,full_name,role,institute_name,metadata,is_email_verified')
         .ilike('email', email)
         .maybeSingle();
       user = sel.data; selErr = sel.error || null;
@@ -169,7 +169,8 @@ app.post('/student/login', async (req, res) => {
   const ok = await bcrypt.compare(password, storedHash);
     if (!ok) return res.status(401).json({ error: 'Invalid credentials' });
 
-    const token = issueToken({ sub: user.id, email: user.email, role: user.role || 'student' });
+    // The chat backend counts analytics per institute from this claim (clients can't forge it)
+    const token = issueToken({ sub: user.id, email: user.email, role: user.role || 'student', institute: user.institute_name || undefined });
     return res.json({
       status: 'ok',
       token,
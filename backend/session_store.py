@@ -0,0 +1,95 @@
+# ===============================================================================
+# SESSION_STORE.PY - LOCK-STRIPED SHARDS FOR IN-MEMORY SESSIONS
+# ===============================================================================
+# This file handles:
+# - Splitting sessions over N shards by a hash of the session ID
+# - Giving every shard its own lock, so threads working on different sessions
+#   (threadpool endpoints, summaries, archiving) rarely wait for each other,
+#   while everything done to one session is serialized
+# - Keeping every shard in least-recently-active order (an LRU), so cold
+#   sessions are found at the front of each shard without scanning
+#
+# The store only holds records; what a record contains, and what is done to it
+# while its shard is locked, is up to ConversationManager (features.py).
+# ===============================================================================
+
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, List, Tuple
+import heapq
+import threading
+
+# ===============================================================================
+# SHARD
+# ===============================================================================
+
+class SessionShard:
+    """
+    One stripe of the store: a lock and its sessions, least recently active first.
+    Only touch `sessions` while holding `lock`.
+    """
+
+    __slots__ = ("lock", "sessions")
+
+    def __init__(self):
+        # Re-entrant, so a method holding the lock can call another that takes it
+        self.lock = threading.RLock()
+        self.sessions: "OrderedDict[str, Any]" = OrderedDict()
+
+    def touch(self, session_id: str):
+        """Move a session to the most recently active end (lock must be held)."""
+        self.sessions.move_to_end(session_id)
+
+# ===============================================================================
+# STORE
+# ===============================================================================
+
+class ShardedSessionStore:
+    """
+    Session ID -> record, split over `shard_count` independently locked shards.
+
+    Records must have a `last_activity` attribute (a datetime) that is kept in
+    step with the shard order, i.e. updated together with touch().
+    """
+
+    def __init__(self, shard_count: int = 16):
+        """
+        Args:
+            shard_count: Number of shards (more shards = less lock contention)
+        """
+        self.shards = [SessionShard() for _ in range(max(shard_count, 1))]
+
+    def shard(self, session_id: str) -> SessionShard:
+        """The shard that holds (or would hold) a session."""
+        return self.shards[hash(session_id) % len(self.shards)]
+
+    def __len__(self) -> int:
+        return sum(len(shard.sessions) for shard in self.shards)
+
+    def session_ids(self) -> List[str]:
+        """Snapshot of every session ID (each shard is locked only while it is copied)."""
+        ids: List[str] = []
+        for shard in self.shards:
+            with shard.lock:
+                ids.extend(shard.sessions)
+        return ids
+
+    def least_recently_active(self, cutoff, limit: int) -> List[str]:
+        """
+        Sessions last active before `cutoff`, least recently active first.
+        Reads only the cold front of each shard.
+
+        Args:
+            cutoff: Only sessions with last_activity < cutoff
+            limit: Maximum number of sessions to return
+        """
+        per_shard: List[List[Tuple[Any, str]]] = []
+        for shard in self.shards:
+            cold = []
+            with shard.lock:
+                for session_id, record in shard.sessions.items():
+                    if record.last_activity >= cutoff or len(cold) >= limit:
+                        break
+                    cold.append((record.last_activity, session_id))
+            per_shard.append(cold)
+        return [session_id for _, session_id in islice(heapq.merge(*per_shard), limit)]
@@ -0,0 +1,154 @@
+# ===============================================================================
+# SETTINGS.PY - TYPED CONFIGURATION RESOLVED ONCE PER PROCESS
+# ===============================================================================
+# This file handles:
+# - Loading backend/.env (if present) exactly once, without searching the tree
+# - Reading every environment variable the backend uses into one typed object
+#
+# Call get_settings() anywhere; the first call does the work and every later
+# call returns the same cached object.
+# ===============================================================================
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+import os
+
+# backend/.env, next to this file
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+# Default folder for archived conversations
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+# ===============================================================================
+# SETTINGS OBJECT
+# ===============================================================================
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Every configuration value the backend reads from the environment.
+    Frozen, so it is safe to share between requests and threads.
+    """
+    # Supabase (server-side only)
+    supabase_url: Optional[str]
+    supabase_service_role_key: Optional[str]
+
+    # SMTP for verification emails
+    smtp_host: Optional[str]
+    smtp_port: Optional[str]
+    smtp_user: Optional[str]
+    smtp_pass: Optional[str]
+    smtp_from: Optional[str]
+
+    # Links and auth
+    frontend_url: str
+    jwt_secret: Optional[str]
+    admin_api_key: Optional[str]
+
+    # Ollama model server
+    ollama_base_url: str
+    ollama_model: str
+    ollama_keep_alive_minutes: int
+    counseling_hours: Tuple[int, int]
+
+    # Load-adaptive generation budgets (lower bounds used under pressure)
+    adaptive_min_num_predict: int
+    adaptive_min_history: int
+    adaptive_target_in_flight: int
+    adaptive_max_in_flight: int
+
+    # Conversation archive (cold sessions are moved out of memory)
+    archive_dir: str
+    archive_idle_minutes: int
+
+    # Institutes the analytics may count when a client names one (see analytics.py)
+    known_institutes: Tuple[str, ...]
+
+    # Crisis alert delivery (the log sink is always on)
+    alert_email_to: Tuple[str, ...]
+    alert_webhook_url: Optional[str]
+    alert_supabase_table: Optional[str]
+
+    # Anonymized request traces for replay.py (off unless a file is set)
+    traffic_capture_file: Optional[str]
+    traffic_capture_sample: float
+
+    @property
+    def smtp_configured(self) -> bool:
+        return all([self.smtp_host, self.smtp_port, self.smtp_user, self.smtp_pass])
+
+    @property
+    def ollama_generate_url(self) -> str:
+        return f"{self.ollama_base_url}/api/generate"
+
+    @property
+    def ollama_ps_url(self) -> str:
+        return f"{self.ollama_base_url}/api/ps"
+
+# ===============================================================================
+# LOADING
+# ===============================================================================
+
+def _load_env_file(path: str):
+    """Load a .env file into os.environ (optional: needs python-dotenv)."""
+    if not os.path.exists(path):
+        return
+    try:
+        from dotenv import load_dotenv  # optional: used for local development
+    except ImportError:
+        print("Warning: python-dotenv not installed, .env file not loaded. Install via 'pip install python-dotenv' to load backend/.env automatically.")
+        return
+    load_dotenv(path, override=True)
+
+
+def _parse_hours(value: str, default: Tuple[int, int]) -> Tuple[int, int]:
+    """Parse an hour range like "8-22" (falls back to `default` if malformed)."""
+    try:
+        start, end = (int(part) for part in value.split("-"))
+    except (ValueError, AttributeError):
+        return default
+    if not (0 <= start <= 24 and 0 <= end <= 24):
+        return default
+    return start, end
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Resolve the configuration (first call only; later calls are cached).
+
+    Returns:
+        The process-wide Settings object
+    """
+    _load_env_file(ENV_FILE)
+    env = os.environ
+
+    smtp_user = env.get("SMTP_USER")
+    return Settings(
+        supabase_url=env.get("SUPABASE_URL"),
+        supabase_service_role_key=env.get("SUPABASE_SERVICE_ROLE_KEY"),
+        smtp_host=env.get("SMTP_HOST"),
+        smtp_port=env.get("SMTP_PORT"),
+        smtp_user=smtp_user,
+        smtp_pass=env.get("SMTP_PASS"),
+        smtp_from=env.get("SMTP_FROM") or smtp_user,
+        frontend_url=env.get("FRONTEND_URL") or "http://localhost:8080",
+        jwt_secret=env.get("JWT_SECRET"),
+        admin_api_key=env.get("ADMIN_API_KEY"),
+        ollama_base_url=(env.get("OLLAMA_BASE_URL") or "http://localhost:11434").rstrip("/"),
+        ollama_model=env.get("OLLAMA_MODEL") or "gemma3:latest",
+        ollama_keep_alive_minutes=int(env.get("OLLAMA_KEEP_ALIVE_MINUTES") or 30),
+        counseling_hours=_parse_hours(env.get("COUNSELING_HOURS", ""), (8, 22)),
+        adaptive_min_num_predict=int(env.get("ADAPTIVE_MIN_NUM_PREDICT") or 120),
+        adaptive_min_history=int(env.get("ADAPTIVE_MIN_HISTORY") or 2),
+        adaptive_target_in_flight=int(env.get("ADAPTIVE_TARGET_IN_FLIGHT") or 2),
+        adaptive_max_in_flight=int(env.get("ADAPTIVE_MAX_IN_FLIGHT") or 8),
+        archive_dir=env.get("ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR,
+        archive_idle_minutes=int(env.get("ARCHIVE_IDLE_MINUTES") or 30),
+        known_institutes=tuple(i.strip() for i in (env.get("KNOWN_INSTITUTES") or "").split(",") if i.strip()),
+        alert_email_to=tuple(a.strip() for a in (env.get("ALERT_EMAIL_TO") or "").split(",") if a.strip()),
+        alert_webhook_url=env.get("ALERT_WEBHOOK_URL"),
+        alert_supabase_table=env.get("ALERT_SUPABASE_TABLE"),
+        traffic_capture_file=env.get("TRAFFIC_CAPTURE_FILE") or None,
+        traffic_capture_sample=min(max(float(env.get("TRAFFIC_CAPTURE_SAMPLE") or 1.0), 0.0), 1.0),
+    )
@@ -0,0 +1,128 @@
+# ===============================================================================
+# SSE.PY - SERVER-SENT EVENTS ENCODING AND FRAME COALESCING
+# ===============================================================================
+# This file handles:
+# - Encoding text as SSE events, splitting multi-line text into one "data:"
+#   line per line (so newlines inside a token survive the trip)
+# - Coalescing many tiny model tokens into fewer, larger SSE frames: the first
+#   token goes out right away, later ones are batched for a short time window
+#   or until a size threshold, whichever comes first
+# - Heartbeat comments while the model is silent, so proxies keep the
+#   connection open
+#
+# Clients join the "data:" lines of one event with "\n", as the SSE spec says.
+# ===============================================================================
+
+from typing import AsyncIterator, Optional
+import asyncio
+import re
+
+# Batch tokens for this long after the first one in a frame (seconds)
+COALESCE_WINDOW = 0.03
+# Send a frame as soon as this many characters are waiting
+MAX_FRAME_CHARS = 1024
+# Send a ": keep-alive" comment after this many silent seconds
+HEARTBEAT_INTERVAL = 15.0
+
+HEARTBEAT_FRAME = ": keep-alive\n\n"
+
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+# ===============================================================================
+# ENCODING
+# ===============================================================================
+
+def encode_sse(data: str, event: Optional[str] = None) -> str:
+    """
+    Encode one SSE event.
+
+    Args:
+        data: Event data (may contain newlines)
+        event: Optional event name (e.g. "done", "error")
+
+    Returns:
+        The event text, ending with the blank line that terminates it
+    """
+    lines = _LINE_BREAK.split(data)
+    head = f"event: {event}\n" if event else ""
+    return head + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+# ===============================================================================
+# COALESCING
+# ===============================================================================
+
+async def coalesce_sse(pieces: AsyncIterator[str], window: float = COALESCE_WINDOW,
+                       max_chars: int = MAX_FRAME_CHARS,
+                       heartbeat: float = HEARTBEAT_INTERVAL) -> AsyncIterator[str]:
+    """
+    Turn a stream of text pieces into batched SSE data events.
+
+    The very first piece is sent immediately (time to first token is unchanged).
+    After that, a frame is sent `window` seconds after its first piece arrived,
+    or as soon as `max_chars` characters are waiting. If nothing is sent for
+    `heartbeat` seconds a comment frame is sent instead.
+
+    Errors from `pieces` are raised after the pieces received so far are sent.
+
+    Args:
+        pieces: Text pieces (e.g. from ollama_client.stream_text)
+        window: Coalescing window in seconds
+        max_chars: Size threshold in characters
+        heartbeat: Seconds of silence before a heartbeat comment
+
+    Yields:
+        Encoded SSE text (data events and heartbeat comments)
+    """
+    loop = asyncio.get_running_loop()
+    iterator = pieces.__aiter__()
+    buffer = []
+    buffered = 0
+    deadline = None
+    first = True
+    last_sent = loop.time()
+    # Waiting on a task (instead of wait_for) never cancels the source on a timeout
+    next_piece = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            now = loop.time()
+            timeout = (deadline - now) if buffer else (last_sent + heartbeat - now)
+            done, _ = await asyncio.wait({next_piece}, timeout=max(timeout, 0))
+
+            if not done:
+                # Window closed (send the batch) or silence (send a heartbeat)
+                yield encode_sse("".join(buffer)) if buffer else HEARTBEAT_FRAME
+                buffer.clear()
+                buffered = 0
+                deadline = None
+                last_sent = loop.time()
+                continue
+
+            try:
+                piece = next_piece.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # Send what the client hasn't seen yet, then report the error
+                if buffer:
+                    yield encode_sse("".join(buffer))
+                raise
+            next_piece = asyncio.ensure_future(iterator.__anext__())
+
+            buffer.append(piece)
+            buffered += len(piece)
+            if first or buffered >= max_chars:
+                first = False
+                yield encode_sse("".join(buffer))
+                buffer.clear()
+                buffered = 0
+                deadline = None
+                last_sent = loop.time()
+            elif deadline is None:
+                deadline = loop.time() + window
+
+        if buffer:
+            yield encode_sse("".join(buffer))
+    finally:
+        # The client went away (or the source failed): stop waiting on the source
+        if not next_piece.done():
+            next_piece.cancel()
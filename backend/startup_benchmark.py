@@ -0,0 +1,167 @@
+# ===============================================================================
+# STARTUP_BENCHMARK.PY - IMPORT TIME AND TIME-TO-FIRST-REQUEST FOR A NEW WORKER
+# ===============================================================================
+# This file measures what every newly spawned worker pays before it can serve:
+# - Import time: how long `import chatbot` takes in a fresh interpreter
+# - Time to first request: from starting uvicorn until /health answers
+#
+# Each measurement is repeated and the median is compared against a budget;
+# the script exits with code 1 if a budget is exceeded.
+#
+# Usage (from the backend folder):
+#   python startup_benchmark.py
+#   python startup_benchmark.py --runs 10 --import-budget-ms 900
+#   python startup_benchmark.py --importtime     # also list the slowest imports
+# ===============================================================================
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must NOT be imported just by importing chatbot
+# (email.message is not listed: FastAPI already pulls it in through http.client)
+DEFERRED_MODULES = ["requests", "smtplib", "dotenv"]
+
+IMPORT_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import chatbot
+elapsed = time.perf_counter() - start
+loaded = [m for m in {DEFERRED_MODULES!r} if m in sys.modules]
+print(elapsed * 1000)
+print(",".join(loaded))
+"""
+
+# ===============================================================================
+# MEASUREMENTS
+# ===============================================================================
+
+def measure_import(python: str) -> tuple:
+    """
+    Import chatbot in a fresh interpreter.
+
+    Returns:
+        (import time in ms, list of deferred modules that were imported anyway, stdout noise)
+    """
+    result = subprocess.run([python, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    lines = result.stdout.splitlines()
+    elapsed_ms = float(lines[-2])
+    loaded = [m for m in lines[-1].split(",") if m]
+    # Anything printed before our two lines was printed by the import itself
+    noise = lines[:-2]
+    return elapsed_ms, loaded, noise
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(python: str, timeout: float = 30.0) -> float:
+    """
+    Start uvicorn and time how long it takes until GET /health succeeds.
+
+    Returns:
+        Time to first successful request in milliseconds
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [python, "-m", "uvicorn", "chatbot:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"Server did not answer {url} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def print_slowest_imports(python: str, count: int = 15):
+    """Print the modules with the largest cumulative import time (python -X importtime)."""
+    result = subprocess.run([python, "-X", "importtime", "-c", "import chatbot"], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Format: "import time: <self us> | <cumulative us> | <module>"
+        _, cumulative_us, name = [part.strip() for part in line.replace("import time:", "").split("|")]
+        rows.append((int(cumulative_us), name))
+    rows.sort(reverse=True)
+    print("\nSlowest imports (cumulative):")
+    for cumulative_us, name in rows[:count]:
+        print(f"  {cumulative_us / 1000:>8.1f}ms  {name}")
+
+# ===============================================================================
+# MAIN
+# ===============================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point. Returns the process exit code."""
+    parser = argparse.ArgumentParser(description="Measure worker import time and time to first request")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions per measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=1500,
+                        help="Budget for the median import time (default: 1500ms)")
+    parser.add_argument("--first-request-budget-ms", type=float, default=3000,
+                        help="Budget for the median time to first request (default: 3000ms)")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to benchmark")
+    args = parser.parse_args(argv)
+
+    failures = []
+
+    import_times = []
+    for _ in range(args.runs):
+        elapsed_ms, loaded, noise = measure_import(args.python)
+        import_times.append(elapsed_ms)
+    import_median = statistics.median(import_times)
+    print(f"import chatbot:        median {import_median:8.1f}ms  "
+          f"(min {min(import_times):.1f}ms, budget {args.import_budget_ms:.0f}ms)")
+    if import_median > args.import_budget_ms:
+        failures.append("import time over budget")
+    if loaded:
+        failures.append(f"modules imported eagerly: {', '.join(loaded)}")
+    if noise:
+        failures.append(f"import printed output: {noise[0]!r}")
+
+    first_request_times = [measure_first_request(args.python) for _ in range(args.runs)]
+    first_median = statistics.median(first_request_times)
+    print(f"time to first request: median {first_median:8.1f}ms  "
+          f"(min {min(first_request_times):.1f}ms, budget {args.first_request_budget_ms:.0f}ms)")
+    if first_median > args.first_request_budget_ms:
+        failures.append("time to first request over budget")
+
+    if args.importtime:
+        print_slowest_imports(args.python)
+
+    if failures:
+        print("\nSTARTUP REGRESSIONS:")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    print("\nStartup within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# ===============================================================================
+# STATS.PY - INCREMENTALLY MAINTAINED SYSTEM STATISTICS
+# ===============================================================================
+# This file keeps running counters that the rest of the backend updates as
+# things happen (session created, message added, crisis detected, ...).
+# /status and the admin dashboard read these counters in constant time
+# instead of scanning every session.
+# ===============================================================================
+
+from typing import Dict, Any
+from datetime import datetime
+import threading
+import time
+
+# ===============================================================================
+# STATS REGISTRY
+# ===============================================================================
+
+class StatsRegistry:
+    """
+    In-process counters plus a ring buffer of per-second message counts.
+
+    Counters are updated from the event loop and from threadpool workers
+    (e.g. streamed replies), so updates go through one small lock. Every
+    update and read is O(1) (the ring buffer has a fixed size).
+    """
+
+    def __init__(self, window_seconds: int = 60):
+        """
+        Initialize the registry.
+
+        Args:
+            window_seconds: Length of the sliding window for messages per minute
+        """
+        self.window_seconds = window_seconds
+        self.started = datetime.now()
+        self._lock = threading.Lock()
+
+        # Lifetime counters
+        self.total_sessions = 0       # Sessions ever created
+        self.active_sessions = 0      # Sessions currently held in memory
+        self.evicted_sessions = 0     # Sessions removed from memory
+        self.total_messages = 0
+        self.user_messages = 0
+        self.assistant_messages = 0
+        self.crisis_hits = 0
+        self.rate_limit_rejections = 0
+
+        # Ring buffer: one slot per second, tagged with the second it counts
+        self._slot_counts = [0] * window_seconds
+        self._slot_seconds = [0] * window_seconds
+        self._window_total = 0
+
+    def _advance_slot(self, second: int) -> int:
+        """Get the ring slot for `second`, clearing it if it holds an old second."""
+        index = second % self.window_seconds
+        if self._slot_seconds[index] != second:
+            self._window_total -= self._slot_counts[index]
+            self._slot_counts[index] = 0
+            self._slot_seconds[index] = second
+        return index
+
+    def record_session_created(self):
+        """A new session was created."""
+        with self._lock:
+            self.total_sessions += 1
+            self.active_sessions += 1
+
+    def record_session_evicted(self):
+        """A session was removed from memory."""
+        with self._lock:
+            self.active_sessions -= 1
+            self.evicted_sessions += 1
+
+    def record_session_restored(self):
+        """An evicted (archived) session was brought back into memory."""
+        with self._lock:
+            self.active_sessions += 1
+
+    def record_message(self, role: str):
+        """A message was added to a session."""
+        second = int(time.time())
+        with self._lock:
+            self.total_messages += 1
+            if role == "user":
+                self.user_messages += 1
+            else:
+                self.assistant_messages += 1
+            index = self._advance_slot(second)
+            self._slot_counts[index] += 1
+            self._window_total += 1
+
+    def record_crisis(self):
+        """A message matched the crisis detector."""
+        with self._lock:
+            self.crisis_hits += 1
+
+    def record_rate_limited(self):
+        """A request was rejected by the rate limiter."""
+        with self._lock:
+            self.rate_limit_rejections += 1
+
+    def messages_in_window(self) -> int:
+        """Messages added in the last `window_seconds` seconds."""
+        now = int(time.time())
+        with self._lock:
+            # Drop slots that fell out of the window since the last message
+            for index in range(self.window_seconds):
+                if now - self._slot_seconds[index] >= self.window_seconds and self._slot_counts[index]:
+                    self._window_total -= self._slot_counts[index]
+                    self._slot_counts[index] = 0
+            return self._window_total
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All statistics as a dictionary (for /status and the admin dashboard)."""
+        messages_per_minute = self.messages_in_window() * 60 / self.window_seconds
+        with self._lock:
+            return {
+                "total_sessions": self.total_sessions,
+                "active_sessions": self.active_sessions,
+                "evicted_sessions": self.evicted_sessions,
+                "total_messages": self.total_messages,
+                "user_messages": self.user_messages,
+                "assistant_messages": self.assistant_messages,
+                "messages_per_minute": round(messages_per_minute, 2),
+                "crisis_hits": self.crisis_hits,
+                "rate_limit_rejections": self.rate_limit_rejections,
+                "uptime_seconds": int((datetime.now() - self.started).total_seconds())
+            }
+
+# Global instance updated by features.py, security.py and the endpoints
+stats_registry = StatsRegistry(window_seconds=60)
@@ -0,0 +1,111 @@
+# ===============================================================================
+# SUMMARIZER.PY - ROLLING CONVERSATION SUMMARIES FOR LONG SESSIONS
+# ===============================================================================
+# The chat prompt only includes the last few messages verbatim. Once a session
+# grows past that window, this file condenses the older messages into a rolling
+# summary using the model. It runs as a background task after the response is
+# sent, so it never slows down the chat request itself.
+# ===============================================================================
+
+from typing import List
+import asyncio
+
+from features import ConversationManager, MessageData
+from ollama_client import generate_text, generation_executor
+
+# ===============================================================================
+# SUMMARY PROMPT AND PARAMETERS
+# ===============================================================================
+
+SUMMARY_PROMPT = """You are summarizing a counseling conversation between a college student (user) and MindCareAI (assistant) so it can be continued later.
+Keep the student's name if given, their main feelings and stressors, important life details, coping strategies already suggested, and any safety concerns.
+Write in the third person, in at most 120 words. Only output the summary.
+
+Summary so far:
+{previous_summary}
+
+New messages:
+{new_messages}
+
+Updated summary:"""
+
+# Lower temperature keeps summaries factual; short output keeps them cheap
+SUMMARY_PARAMETERS = {
+    "temperature": 0.3,
+    "num_ctx": 3000,
+    "num_predict": 200,
+    "top_p": 0.7
+}
+
+# ===============================================================================
+# CONVERSATION SUMMARIZER
+# ===============================================================================
+
+class ConversationSummarizer:
+    """
+    Keeps a rolling summary of everything older than the prompt window.
+    The summary is stored in the ConversationManager next to the session.
+    """
+
+    def __init__(self, manager: ConversationManager, keep_recent: int = 5, min_batch: int = 6):
+        """
+        Initialize the summarizer.
+
+        Args:
+            manager: Where conversations and their summaries are stored
+            keep_recent: Messages the prompt already includes verbatim (not summarized)
+            min_batch: Only summarize once this many messages have dropped out
+                       of the prompt window, so the model isn't called every turn
+        """
+        self.manager = manager
+        self.keep_recent = keep_recent
+        self.min_batch = min_batch
+
+    def schedule_if_needed(self, session_id: str) -> bool:
+        """
+        Start a summary update in the background if enough messages have
+        dropped out of the prompt (call from the event loop, after the reply
+        is stored).
+
+        Args:
+            session_id: Conversation to check
+
+        Returns:
+            True if a summary update was scheduled
+        """
+        claim = self.manager.claim_messages_to_summarize(session_id, self.keep_recent, self.min_batch)
+        if claim is None:
+            return False
+
+        previous_summary, messages, covered = claim
+        # A model call: it runs with the generations, not on the default executor
+        asyncio.get_running_loop().run_in_executor(generation_executor(), self.summarize, session_id,
+                                                   previous_summary, messages, covered)
+        return True
+
+    def summarize(self, session_id: str, previous_summary: str, messages: List[MessageData], covered: int):
+        """
+        Fold `messages` into the session's summary (blocking model call).
+
+        Args:
+            session_id: Conversation being summarized
+            previous_summary: Current summary text ("" if none yet)
+            messages: Messages to fold into the summary
+            covered: Total messages the new summary will cover
+        """
+        prompt = SUMMARY_PROMPT.format(
+            previous_summary=previous_summary or "(none yet)",
+            new_messages="\n".join(f"{m.role}: {m.content}" for m in messages)
+        )
+        try:
+            summary = generate_text(prompt, SUMMARY_PARAMETERS, timeout=120)
+        except Exception as e:
+            # Keep the old summary; the next turn will try again
+            print(f"Summary update failed for session {session_id}: {e}")
+            self.manager.release_summary_claim(session_id)
+            return
+
+        if not summary:
+            self.manager.release_summary_claim(session_id)
+            return
+        self.manager.store_summary(session_id, summary, covered)
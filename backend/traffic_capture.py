@@ -0,0 +1,294 @@
+# ===============================================================================
+# TRAFFIC_CAPTURE.PY - ANONYMIZED REQUEST TRACES FOR LOAD REPLAY
+# ===============================================================================
+# This file handles:
+# - An ASGI middleware that times every request to the replayable endpoints
+#   (time to first byte and total time) without touching the response
+# - Reducing each request to an anonymized trace: endpoint, status, timings,
+#   salted hashes of the session ID, client IP and idempotency key, and sizes
+#   (message length, prompt length, history window, output tokens)
+# - Appending traces to a compact NDJSON file from a background task, so the
+#   event loop never waits on the disk
+#
+# No message text, session ID or IP address is ever written. The hash salt is
+# random per process and never stored, so hashes can't be matched to real IDs
+# (or across restarts); within one process they keep requests of the same
+# session together. Capturing is off unless TRAFFIC_CAPTURE_FILE is set.
+# replay.py re-drives a capture against a build wired to a fake Ollama.
+# ===============================================================================
+
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+# Trace file format version (first field of every segment header)
+FORMAT_VERSION = 1
+
+# Endpoints worth replaying (admin, signup and WebSocket traffic is not captured)
+CAPTURED_PATHS = {
+    "/chat": "/chat",
+    "/ai-chat": "/ai-chat",
+    "/crisis-check": "/crisis-check",
+    "/new-session": "/new-session",
+    "/health": "/health",
+    "/resources": "/resources",
+}
+CONVERSATION_PREFIX = "/conversation/"
+
+# Request bodies larger than this are timed but not parsed
+MAX_BODY_BYTES = 16 * 1024
+
+# Trace fields (kept short, one line per request):
+#   t   ms since the segment header      p   route          m   HTTP method
+#   s   status                           f   ms to first body byte
+#   d   ms to the end of the response    sh  session hash   ch  client hash
+#   rk  idempotency key hash             ml  message length (characters)
+#   pc  prompt length (characters)       hm  history messages in the prompt
+#   ot  output tokens generated
+
+# Fields of the request being handled; endpoints add sizes with note_generation()
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+
+def note_generation(prompt_chars: Optional[int] = None, history_messages: Optional[int] = None,
+                    output_tokens: Optional[int] = None):
+    """
+    Add generation sizes to the trace of the request being handled (no-op when
+    not capturing). Background generation tasks inherit the request's trace,
+    so they can report how many tokens they produced.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    for key, value in (("pc", prompt_chars), ("hm", history_messages), ("ot", output_tokens)):
+        if value is not None:
+            trace[key] = value
+
+
+def note_session(session_id: str):
+    """
+    Tell the trace of the request being handled which session it used (no-op
+    when not capturing). Needed when the endpoint created the session, since
+    the request itself carried no session ID. Hashed before the trace is kept.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["_session_id"] = session_id
+
+
+def route_of(path: str) -> Optional[str]:
+    """The route template for a captured path (None = not captured)."""
+    if path in CAPTURED_PATHS:
+        return CAPTURED_PATHS[path]
+    if path.startswith(CONVERSATION_PREFIX) and "/" not in path[len(CONVERSATION_PREFIX):]:
+        return "/conversation/{session_id}"
+    return None
+
+# ===============================================================================
+# RECORDER
+# ===============================================================================
+
+class TrafficRecorder:
+    """
+    Buffers traces in memory and appends them to the capture file every
+    `flush_interval` seconds. If the disk falls behind, the oldest buffered
+    traces are dropped (and counted) instead of growing memory.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, max_buffer: int = 10000):
+        """
+        Args:
+            flush_interval: Seconds between writes to the capture file
+            max_buffer: Traces buffered at most between writes
+        """
+        self.path: Optional[str] = None
+        self.sample_rate = 1.0
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque(maxlen=max_buffer)
+        self._salt = secrets.token_bytes(16)
+        self._started_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.captured = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    def configure(self, settings):
+        """Apply TRAFFIC_CAPTURE_* settings (see settings.py)."""
+        self.path = settings.traffic_capture_file
+        self.sample_rate = settings.traffic_capture_sample
+
+    def anonymize(self, value: Optional[str]) -> Optional[str]:
+        """Salted hash of an identifier (64 bits, hex)."""
+        if not value:
+            return None
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def sampled(self, session_hash: Optional[str]) -> bool:
+        """
+        Whether to keep a request. Sampling is per session, so a kept session
+        is kept whole; requests without a session are sampled at random.
+        """
+        if self.sample_rate >= 1.0:
+            return True
+        if session_hash is None:
+            return secrets.randbelow(1 << 16) < self.sample_rate * (1 << 16)
+        return int(session_hash, 16) < self.sample_rate * (1 << 64)
+
+    def record(self, trace: Dict[str, Any]):
+        """Queue one finished trace for writing."""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        trace["t"] = round((trace["t"] - self._started_at) * 1000)
+        self._buffer.append(json.dumps({k: v for k, v in trace.items() if v is not None},
+                                       separators=(",", ":")) + "\n")
+        self.captured += 1
+
+    def _write(self, lines):
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write("".join(lines))
+
+    def flush(self):
+        """Write buffered traces to the capture file (blocking)."""
+        lines = []
+        while self._buffer:
+            lines.append(self._buffer.popleft())
+        if not lines:
+            return
+        try:
+            self._write(lines)
+        except OSError as e:
+            self.write_errors += 1
+            print(f"Traffic capture write failed: {e}")
+
+    async def _flush_loop(self):
+        """Background loop: append buffered traces every flush_interval seconds."""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await loop.run_in_executor(None, self.flush)
+
+    def start(self):
+        """Start capturing (call on server startup). No-op without a capture file."""
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Every process starts a new segment; trace times are relative to it
+        self._started_at = time.monotonic()
+        self._buffer.append(json.dumps({"v": FORMAT_VERSION, "start": datetime.now().isoformat(timespec="seconds"),
+                                        "sample": self.sample_rate}) + "\n")
+        self._task = asyncio.get_event_loop().create_task(self._flush_loop())
+        print(f"Capturing traffic to {self.path} (sample rate {self.sample_rate:g})")
+
+    def stop(self):
+        """Stop capturing and write what is left (call on server shutdown)."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            self.flush()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "file": self.path if self.enabled else None,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors
+        }
+
+# ===============================================================================
+# MIDDLEWARE
+# ===============================================================================
+
+class TrafficCaptureMiddleware:
+    """
+    Pure ASGI middleware (no extra task per request, streaming responses are
+    passed through untouched). Does nothing unless the recorder is enabled.
+    """
+
+    def __init__(self, app, recorder: TrafficRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.recorder.enabled:
+            return await self.app(scope, receive, send)
+        route = route_of(scope["path"])
+        if route is None:
+            return await self.app(scope, receive, send)
+
+        start = time.monotonic()
+        trace: Dict[str, Any] = {"t": start, "p": route, "m": scope["method"]}
+        body = bytearray()
+        state = {"status": None, "first_byte": None}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= MAX_BODY_BYTES:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body" and state["first_byte"] is None and message.get("body"):
+                state["first_byte"] = time.monotonic()
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            _current_trace.reset(token)
+            end = time.monotonic()
+            trace["s"] = state["status"]
+            trace["f"] = round((state["first_byte"] - start) * 1000, 1) if state["first_byte"] else None
+            trace["d"] = round((end - start) * 1000, 1)
+            self._describe_request(scope, bytes(body), trace)
+            if self.recorder.sampled(trace.get("sh")):
+                self.recorder.record(trace)
+
+    def _describe_request(self, scope, body: bytes, trace: Dict[str, Any]):
+        """Add the anonymized request fields (never the text itself)."""
+        # Set by the endpoint (note_session) - the only raw ID ever in a trace, removed here
+        session_id = trace.pop("_session_id", None)
+        retry_key = None
+        if session_id is None and scope["path"].startswith(CONVERSATION_PREFIX):
+            session_id = scope["path"][len(CONVERSATION_PREFIX):]
+        if body and len(body) <= MAX_BODY_BYTES:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = None
+            if isinstance(payload, dict):
+                session_id = session_id or payload.get("session_id")
+                retry_key = payload.get("client_message_id")
+                if isinstance(payload.get("message"), str):
+                    trace["ml"] = len(payload["message"])
+        client = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                client = value.decode("latin-1").split(",")[0].strip()
+            elif name == b"idempotency-key":
+                retry_key = value.decode("latin-1")
+        if client is None and scope.get("client"):
+            client = scope["client"][0]
+        trace["sh"] = self.recorder.anonymize(session_id if isinstance(session_id, str) else None)
+        trace["ch"] = self.recorder.anonymize(client)
+        trace["rk"] = self.recorder.anonymize(retry_key if isinstance(retry_key, str) else None)
+
+# Global recorder; chatbot.py installs the middleware and starts it on startup
+traffic_recorder = TrafficRecorder()
@@ -38,6 +38,15 @@ declare global {
   }
 }
 
+// Extra attempts for a message whose request failed (network error or 5xx)
+const CHAT_RETRIES = 2;
+
+// Client errors (bad input, rate limit) fail the same way again, so only retry the rest
+const isRetryable = (error: unknown) => {
+  const status = (error as { status?: number }).status;
+  return status === undefined || status >= 500;
+};
+
 const AIChat = () => {
   const { user } = useAuth();
   const [messages, setMessages] = useState([
@@ -129,12 +138,27 @@ const AIChat = () => {
     setMessages(prev => [...prev, newUserMessage, botPlaceholder]);
     setIsLoading(true);
 
+    // One id per message, reused by every retry, so the backend answers a retry
+    // from the same generation instead of storing the message twice
+    const clientMessageId = generateUUID();
+
     try {
       // Stream tokens from the backend /ai-chat endpoint
-      const full = await streamMindCareAIResponse(userMessage, sessionId, (token) => {
-        // Append token to the bot placeholder message
-        setMessages(prev => prev.map(m => m.id === botId ? { ...m, message: m.message + token } : m));
-      });
+      let full: string | undefined;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          // A retry replays the reply from its first token, so start the placeholder over
+          setMessages(prev => prev.map(m => m.id === botId ? { ...m, message: "" } : m));
+          full = await streamMindCareAIResponse(userMessage, sessionId, user?.token, clientMessageId, (token) => {
+            // Append token to the bot placeholder message
+            setMessages(prev => prev.map(m => m.id === botId ? { ...m, message: m.message + token } : m));
+          });
+          break;
+        } catch (error) {
+          if (attempt >= CHAT_RETRIES || !isRetryable(error)) throw error;
+          await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
+        }
+      }
       // After streaming completes, persist to Supabase if user logged in
       if (user?.id) {
         const botMsg = full;
@@ -166,7 +190,7 @@ const AIChat = () => {
       setIsLoading(false);
     }
     return;
-  }, [isLoading, sessionId, user?.id, user?.fullName, user?.role]);
+  }, [isLoading, sessionId, user?.id, user?.fullName, user?.role, user?.token]);
 
   const handleSendMessage = async () => {
     if (!inputValue.trim() || isLoading) return;
@@ -181,14 +205,19 @@ const AIChat = () => {
   };
 
   // Helper to POST to /ai-chat and stream tokens using Fetch + ReadableStream
-  const streamMindCareAIResponse = async (message: string, sessionId: string | undefined, onToken: (token: string) => void) => {
+  const streamMindCareAIResponse = async (message: string, sessionId: string | undefined, authToken: string | undefined,
+                                          clientMessageId: string, onToken: (token: string) => void) => {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    // The signed login token tells the backend the student's institute (for the analytics dashboard)
+    if (authToken) headers['Authorization'] = `Bearer ${authToken}`;
     const resp = await fetch(`${API_CONFIG.BASE_URL}/ai-chat`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ message, session_id: sessionId })
+      headers,
+      // client_message_id lets the backend deduplicate a retried request
+      body: JSON.stringify({ message, session_id: sessionId, client_message_id: clientMessageId })
     });
 
-    if (!resp.ok) throw new Error(`HTTP error! status: ${resp.status}`);
+    if (!resp.ok) throw Object.assign(new Error(`HTTP error! status: ${resp.status}`), { status: resp.status });
 
     if (!resp.body) throw new Error('ReadableStream not supported by this browser or server response has no body');
 
@@ -211,17 +240,21 @@ const AIChat = () => {
         // Do NOT trim lines; many model tokens intentionally include leading spaces
         const lines = part.split('\n').map(l => l.replace(/\r$/, ''));
         let isDone = false;
+        // A token containing newlines arrives as several 'data:' lines; join them back with '\n'
+        const dataLines: string[] = [];
         for (const line of lines) {
           if (line.startsWith('data:')) {
             // Remove only the literal 'data: ' prefix (one space), preserving any additional leading spaces
-            const token = line.replace(/^data: /, '');
-            // Emit token to UI
-            if (token && token !== '[DONE]') { onToken(token); full += token; }
+            dataLines.push(line.replace(/^data: ?/, ''));
           } else if (line.startsWith('event:')) {
             const ev = line.replace(/^event:\s*/, '');
             if (ev === 'done') isDone = true;
           }
+          // Lines starting with ':' are heartbeat comments and are ignored
         }
+        const token = dataLines.join('\n');
+        // Emit token to UI
+        if (token && !isDone) { onToken(token); full += token; }
         if (isDone) return;
       }
     }
@@ -254,7 +287,7 @@ const AIChat = () => {
       setSpeechLog(prev => [...prev, { type: 'user', text }]);
       // Stream bot reply and collect full response
       let botReply = '';
-      await streamMindCareAIResponse(text, sessionId, (token) => {
+      await streamMindCareAIResponse(text, sessionId, user?.token, generateUUID(), (token) => {
         botReply += token;
       });
       setSpeechLog(prev => [...prev, { type: 'bot', text: botReply }]);
@@ -263,7 +296,7 @@ const AIChat = () => {
       speak(botReply || '');
     };
     recognitionRef.current = recognition;
-  }, [sessionId, sendText, speak]);
+  }, [sessionId, sendText, speak, user?.token]);
 
   const startRecognition = () => {
     const rec = recognitionRef.current;
@@ -62,7 +62,7 @@ const Login = () => {
         }
         const data = await resp.json();
         const u = data.user;
-        login({ id: u.id, email: u.email, fullName: u.fullName, role: u.role });
+        login({ id: u.id, email: u.email, fullName: u.fullName, role: u.role, token: data.token });
         navigate('/ai-chat');
       }
     } catch (err: unknown) {
@@ -8,6 +8,7 @@ interface User {
   email: string;
   fullName: string;
   role: 'student' | 'counselor' | 'admin';
+  token?: string; // Signed token from the Node auth server, sent to the chat backend
 }
 
 interface AuthContextType {
@@ -27,6 +27,7 @@ export const generateUUID = () => {
 export interface ChatRequest {
   message: string;
   session_id?: string;
+  client_message_id?: string; // Idempotency key: a retry with the same id gets the same reply
 }
 
 export interface ChatResponse {
@@ -315,3 +315,18 @@ CREATE TRIGGER trg_post_replies_set_updated_at
 BEFORE UPDATE ON public.post_replies
 FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
 
+
+-- ---------- crisis_alerts (written by the backend alert pipeline, see backend/alerts.py) ----------
+CREATE TABLE IF NOT EXISTS public.crisis_alerts (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  session_id text NOT NULL,
+  excerpt text,
+  source text,
+  institute text,
+  personality text,
+  detected_at timestamptz NOT NULL,
+  repeats integer NOT NULL DEFAULT 0,
+  created_at timestamptz NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_crisis_alerts_detected_at ON public.crisis_alerts (detected_at DESC);